@@ -0,0 +1,847 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+import memo
+from detection import Detection
+from ecg import ECG
+from fiducials import MISSING
+from line_treatments import LineTreatment
+from parser import SAMPLING_RATE, parse_lines
+from profiling import PROFILE, Profiler
+from templates import BeatTemplates
+
+
+def reference_local_maxima(signal, threshold_ratio=0.7):
+    """
+    Implémentation de référence (boucle Python, échantillon par échantillon)
+    de Detection.detect_local_maxima, utilisée pour vérifier la parité.
+    """
+    interval = max(signal) - min(signal)
+    threshold = threshold_ratio * interval + min(signal)
+    maxima = []
+    maxima_indices = []
+    detected_indices = []
+    above_threshold = False
+
+    for i in range(len(signal)):
+        if signal[i] >= threshold:
+            above_threshold = True
+            maxima_indices.append(i)
+            maxima.append(signal[i])
+        elif above_threshold and signal[i] < threshold:
+            index_local_max = maxima.index(max(maxima))
+            detected_indices.append(maxima_indices[index_local_max])
+            maxima = []
+            maxima_indices = []
+            above_threshold = False
+
+    return detected_indices
+
+
+# Cas limites de detect_local_maxima : (signal, threshold_ratio)
+LOCAL_MAXIMA_CASES = {
+    "plateau_au_debut": ([5, 5, 5, 1, 0, 1, 4, 1], 0.7),
+    "plateau_ouvert_en_fin": ([0, 4, 1, 0, 5, 5, 5], 0.7),
+    "egalites": ([0, 3, 3, 1, 0, 3, 2, 3, 0], 0.7),
+    "signal_constant": ([2.0] * 10, 0.7),
+    "liste_entiere": ([0, 1, 9, 1, 0, 8, 9, 9, 0, 0], 0.5),
+    "longueur_1": ([3.0], 0.7),
+    "tuple": ((0.0, 2.0, 0.0, 2.0, 0.0), 0.7),
+    "ratio_nul": ([1, 0, 2, 0, 1], 0.0),
+    "ratio_1": ([1, 0, 2, 0, 2, 2, 0], 1.0),
+    "negatifs": (np.array([-5.0, -1.0, -5.0, -2.0, -5.0]), 0.7),
+    "float32": (np.array([0, 1, 0.9, 1, 0], dtype=np.float32), 0.7),
+    "vide": ([], 0.7),
+}
+
+
+def check_local_maxima_parity() -> int:
+    """
+    Compare Detection.detect_local_maxima à la boucle de référence sur les
+    cas limites de LOCAL_MAXIMA_CASES et sur des signaux aléatoires
+    déterministes (valeurs entières, donc avec égalités et plateaux). Les
+    deux implémentations doivent retourner les mêmes indices, ou lever la
+    même exception.
+
+    Returns:
+        int: Nombre de cas comparés (AssertionError au premier écart).
+    """
+    rng = np.random.default_rng(0)
+    cases = dict(LOCAL_MAXIMA_CASES)
+    for i in range(200):
+        cases[f"aleatoire_{i}"] = (
+            rng.integers(0, 4, rng.integers(1, 40)).tolist(),
+            float(rng.choice([0.0, 0.3, 0.7, 1.0])))
+
+    def outcome(function, signal, ratio):
+        try:
+            return function(signal, ratio)
+        except ValueError as error:
+            return type(error)
+
+    for name, (signal, ratio) in cases.items():
+        expected = outcome(reference_local_maxima, signal, ratio)
+        actual = outcome(Detection.detect_local_maxima, signal, ratio)
+        if actual != expected:
+            raise AssertionError(
+                f"detect_local_maxima diverge de la référence ({name}) : "
+                f"{actual} au lieu de {expected}.")
+    return len(cases)
+
+
+# Valeurs modifiées des paramètres de Detection par check_detection_memo
+DETECTION_CHANGES = {"REFRACTORY": 3.0, "GRADIENT_THRESHOLD": 5.0}
+
+
+def check_detection_memo(n_samples: int = 5000, fs: int = SAMPLING_RATE,
+                         seed: int = 0) -> int:
+    """
+    Vérifie que Detection.process_ecg_signal ne sert pas du cache un
+    résultat calculé avec d'autres paramètres : après chaque modification
+    d'un paramètre de Detection.params (doublé, ou valeur de
+    DETECTION_CHANGES), le résultat mémoïsé doit être celui calculé MEMO
+    désactivé. Les paramètres sont rétablis ensuite.
+
+    Returns:
+        int: Nombre de paramètres vérifiés (AssertionError au premier
+        résultat périmé).
+    """
+    signal = synthetic_leads(n_samples, 1, fs=fs, seed=seed)[0]
+    original = Detection.params()
+    try:
+        Detection.process_ecg_signal(signal, fs)
+        for name, value in original.items():
+            setattr(Detection, name, DETECTION_CHANGES.get(name, 2 * value))
+            cached = Detection.process_ecg_signal(signal, fs)
+            with memo.MEMO.disabled():
+                expected = Detection.process_ecg_signal(signal, fs)
+            if cached != expected:
+                raise AssertionError(
+                    f"Résultat mémoïsé périmé après modification de "
+                    f"Detection.{name} : {len(cached)} battements au lieu "
+                    f"de {len(expected)}.")
+            setattr(Detection, name, value)
+    finally:
+        for name, value in original.items():
+            setattr(Detection, name, value)
+    return len(original)
+
+
+def _time(function, *args, repeat=5):
+    """Retourne la meilleure durée (en secondes) sur plusieurs exécutions."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_local_maxima(n_samples: int, fs: int = 500, seed: int = 0) -> dict:
+    """
+    Mesure le débit (échantillons/s) de Detection.detect_local_maxima et de
+    la boucle de référence sur un signal pseudo-ECG (la parité est vérifiée
+    par check_local_maxima_parity).
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / fs
+    signal = (np.sin(2 * np.pi * 1.2 * t) ** 31
+              + 0.05 * rng.standard_normal(n_samples))
+
+    vectorized_time = _time(Detection.detect_local_maxima, signal)
+    reference_time = _time(reference_local_maxima, signal, repeat=1)
+    return {
+        "n_samples": n_samples,
+        "vectorized_samples_per_s": n_samples / vectorized_time,
+        "reference_samples_per_s": n_samples / reference_time,
+        "speedup": reference_time / vectorized_time,
+    }
+
+
+def reference_running_extremum(signals, window, ufunc):
+    """
+    Extremum glissant naïf (une fenêtre par échantillon, O(n·w)), utilisé
+    comme référence pour LineTreatment._running_extremum.
+    """
+    half = window // 2
+    padded = np.pad(signals, ((0, 0), (half, half)), mode="edge")
+    result = np.empty(signals.shape)
+    for i in range(signals.shape[1]):
+        result[:, i] = ufunc.reduce(padded[:, i:i + window], axis=1)
+    return result
+
+
+def bench_baseline(n_samples: int, n_leads: int = 12, fs: int = 500,
+                   seed: int = 0) -> dict:
+    """
+    Mesure le débit (échantillons/s, toutes dérivations confondues) de
+    LineTreatment.estimate_baseline et celui du min/max glissant naïf sur
+    une fenêtre par échantillon, et vérifie leur parité.
+    """
+    rng = np.random.default_rng(seed)
+    signals = rng.standard_normal((n_leads, n_samples)).cumsum(axis=1)
+    window = int(LineTreatment.BASELINE_WINDOW_SIZE_MS * fs / 1000) | 1
+
+    fast = LineTreatment._running_extremum(signals, window, np.maximum)
+    naive = reference_running_extremum(signals, window, np.maximum)
+    if not np.array_equal(fast, naive):
+        raise AssertionError("_running_extremum diverge de la référence.")
+
+    baseline_time = _time(LineTreatment.estimate_baseline, signals, fs)
+    # estimate_baseline enchaîne 4 min/max glissants sur la fenêtre de base
+    # puis 4 sur une fenêtre trois fois plus grande
+    naive_time = 4 * sum(_time(reference_running_extremum, signals, size,
+                               np.maximum, repeat=1)
+                         for size in (window, 3 * window | 1))
+    return {
+        "n_samples": n_samples,
+        "baseline_samples_per_s": n_leads * n_samples / baseline_time,
+        "naive_samples_per_s": n_leads * n_samples / naive_time,
+        "speedup": naive_time / baseline_time,
+    }
+
+
+# Dérivations et gains (projection du signal simulé) des enregistrements
+# synthétiques
+SYNTHETIC_LEADS = ["I", "II", "III", "aVR", "aVL", "aVF",
+                   "V1", "V2", "V3", "V4", "V5", "V6"]
+SYNTHETIC_GAINS = [0.6, 1.0, 0.4, -0.8, 0.1, 0.7,
+                   -0.5, 0.3, 0.8, 1.2, 1.1, 0.9]
+
+
+def synthetic_leads(n_samples: int, n_leads: int = 12,
+                    heart_rate: float = 70, fs: int = SAMPLING_RATE,
+                    seed: int = 0) -> np.ndarray:
+    """
+    Enregistrement synthétique (n_dérivations, n_échantillons) en µV : un
+    ECG simulé par nk.ecg_simulate (ecgsyn) projeté sur chaque dérivation,
+    avec dérive de la ligne de base, décalage et bruit propres à chaque
+    dérivation.
+    """
+    import neurokit2 as nk
+
+    rng = np.random.default_rng(seed)
+    # `duration` plutôt que `length`, que ecgsyn ne respecte pas toujours
+    ecg = nk.ecg_simulate(duration=n_samples / fs, sampling_rate=fs,
+                          heart_rate=heart_rate, noise=0.0,
+                          random_state=seed)
+    ecg = np.resize(ecg, n_samples)
+    t = np.arange(n_samples) / fs
+    gains = np.resize(SYNTHETIC_GAINS, n_leads)[:, None]
+    wander = 0.1 * np.sin(2 * np.pi * rng.uniform(0.1, 0.4, (n_leads, 1)) * t
+                          + rng.uniform(0, 2 * np.pi, (n_leads, 1)))
+    noise = 0.01 * rng.standard_normal((n_leads, n_samples))
+    offsets = rng.uniform(-1, 1, (n_leads, 1))
+    return 1000 * (gains * ecg + wander + noise + offsets)
+
+
+def write_synthetic_cohort(directory: str, n_records: int, n_samples: int,
+                           n_leads: int = 12, heart_rate: float = 70,
+                           fs: int = SAMPLING_RATE, seed: int = 0):
+    """
+    Écrit `n_records` CSV synthétiques au format des enregistrements réels
+    et retourne le df_meta correspondant.
+    """
+    import pandas as pd
+
+    os.makedirs(directory, exist_ok=True)
+    labels = [SYNTHETIC_LEADS[i % 12] + ("" if i < 12 else f"_{i // 12}")
+              for i in range(n_leads)]
+    rows = []
+    for i in range(n_records):
+        path = os.path.join(directory, f"synthetic_{i}.csv")
+        leads = synthetic_leads(n_samples, n_leads, heart_rate, fs, seed + i)
+        pd.DataFrame(leads.T.round(1), columns=labels).to_csv(path,
+                                                             index=False)
+        rows.append({
+            "patient_id": f"synthetic_{i}", "age": 50, "date_of_birth": None,
+            "gender": "F" if i % 2 else "M", "height_cm": 170.0,
+            "weight_kg": 70.0, "date": None, "location": None,
+            "diagnosis": ["synthetic"], "original_diagnosis": "synthetic",
+            "ecg_file_path": path,
+        })
+    return pd.DataFrame(rows)
+
+
+def _environment() -> dict:
+    """Versions utiles pour comparer des résultats entre deux exécutions."""
+    import neurokit2 as nk
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(),
+            "numpy": np.__version__, "neurokit2": nk.__version__,
+            "machine": platform.machine()}
+
+
+def _save_json(results, path: Optional[str]) -> None:
+    """Enregistre les résultats d'un banc en JSON si `path` est donné
+    (option --json)."""
+    if path:
+        with open(path, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+def bench_pipeline(n_records: int = 10, n_samples: int = 5000,
+                   n_leads: int = 12, heart_rate: float = 70,
+                   fs: int = SAMPLING_RATE, repeat: int = 3, seed: int = 0,
+                   directory: Optional[str] = None) -> dict:
+    """
+    Chronomètre chaque étape du pipeline sur une cohorte synthétique :
+    lecture, traitement, fusion, chaque méthode de Detection, mesures (de
+    tous les battements et du battement médian, voir BeatTemplates) et
+    rendu hors écran. Le cache MEMO est désactivé pendant la mesure.
+
+    Pour chaque étape, la durée retenue est la meilleure des `repeat`
+    passes sur toute la cohorte. Le débit en échantillons/s compte toutes
+    les dérivations pour les étapes par enregistrement et la seule ligne
+    fusionnée pour les méthodes de Detection appliquées à un signal.
+
+    Returns:
+        dict: Configuration, environnement et, par étape, durée (s),
+        échantillons/s et enregistrements/s.
+    """
+    import neurokit2 as nk
+
+    from report import ReportRenderer
+
+    with tempfile.TemporaryDirectory() as temporary:
+        df_meta = write_synthetic_cohort(directory or temporary, n_records,
+                                         n_samples, n_leads, heart_rate, fs,
+                                         seed)
+        record_samples = n_leads * n_samples
+        stages = {
+            "parse_lines": record_samples,
+            "treat_ecg": record_samples,
+            "merge_ecg": record_samples,
+            "detect_local_maxima": n_samples,
+            "ecg_peaks": n_samples,
+            "detect_r_peaks": n_samples,
+            "detect_q_and_s": n_samples,
+            "detect_p_wave": n_samples,
+            "detect_t_wave_end": n_samples,
+            "process_ecg_signal": n_samples,
+            "detect": record_samples,
+            "measurements": record_samples,
+            "beat_templates": record_samples,
+            "template_measurements": record_samples,
+            "render": record_samples,
+        }
+        best = dict.fromkeys(stages, float("inf"))
+        renderer = ReportRenderer()
+
+        with memo.MEMO.disabled():
+            for _ in range(repeat):
+                elapsed = dict.fromkeys(stages, 0.0)
+
+                def timed(stage, function, *args):
+                    start = time.perf_counter()
+                    result = function(*args)
+                    elapsed[stage] += time.perf_counter() - start
+                    return result
+
+                for _, row in df_meta.iterrows():
+                    ecg = ECG(row, timed("parse_lines", parse_lines,
+                                         row.ecg_file_path))
+                    timed("treat_ecg", LineTreatment.treat_ecg, ecg)
+                    timed("merge_ecg", LineTreatment.merge_ecg, ecg)
+
+                    merged = np.asarray(ecg.treated_lines["Merged"].points)
+                    timed("detect_local_maxima",
+                          Detection.detect_local_maxima, merged)
+                    timed("ecg_peaks", nk.ecg_peaks, merged, fs)
+                    r_peaks = timed("detect_r_peaks",
+                                    Detection.detect_r_peaks, merged, fs)
+                    for stage in ("detect_q_and_s", "detect_p_wave",
+                                  "detect_t_wave_end"):
+                        timed(stage, getattr(Detection, stage), merged,
+                              r_peaks, fs)
+                    timed("process_ecg_signal", Detection.process_ecg_signal,
+                          merged, fs)
+                    timed("detect", Detection.detect, ecg)
+                    timed("measurements", ecg.measurements)
+                    templates = timed("beat_templates", BeatTemplates.from_ecg,
+                                      ecg)
+                    timed("template_measurements", templates.measurements)
+
+                    def render():
+                        renderer.render(ecg)
+                        renderer.canvas.print_png(io.BytesIO())
+                    timed("render", render)
+
+                best = {stage: min(best[stage], elapsed[stage])
+                        for stage in stages}
+
+    return {
+        "config": {"n_records": n_records, "n_samples": n_samples,
+                   "n_leads": n_leads, "heart_rate": heart_rate, "fs": fs,
+                   "repeat": repeat, "seed": seed},
+        "environment": _environment(),
+        "stages": {stage: {"seconds": best[stage],
+                           "samples_per_s": n_records * samples / best[stage],
+                           "records_per_s": n_records / best[stage]}
+                   for stage, samples in stages.items()},
+    }
+
+
+def bench_lead_parallel(n_samples: int = 5000, n_leads: int = 12,
+                        workers: int = 4, fs: int = SAMPLING_RATE,
+                        repeat: int = 3, seed: int = 0) -> dict:
+    """
+    Latence du nettoyage et de la détection d'un seul enregistrement, en
+    séquentiel puis avec les dérivations réparties sur un pool de threads
+    et sur un pool de processus réutilisé. Vérifie que les résultats
+    parallèles sont identiques au résultat séquentiel. MEMO est désactivé.
+    """
+    leads = synthetic_leads(n_samples, n_leads, fs=fs, seed=seed)
+    labels = [f"L{i}" for i in range(n_leads)]
+
+    def run(executor):
+        ecg = ECG(None, ECG.Leads(labels, leads.copy(), fs))
+        LineTreatment.treat_ecg(ecg, executor=executor)
+        LineTreatment.merge_ecg(ecg)
+        Detection.detect(ecg, executor=executor)
+        return ecg
+
+    def fingerprint(ecg):
+        return (ecg.treated_lines.matrix,
+                [line.fiducials for line in ecg.treated_lines])
+
+    with memo.MEMO.disabled():
+        reference = fingerprint(run(None))
+        latencies = {"serial": _time(run, None, repeat=repeat)}
+        with ThreadPoolExecutor(workers) as threads, \
+                ProcessPoolExecutor(workers) as processes:
+            for mode, executor in (("threads", threads),
+                                   ("processes", processes)):
+                matrix, fiducials = fingerprint(run(executor))
+                if not (np.array_equal(matrix, reference[0])
+                        and fiducials == reference[1]):
+                    raise AssertionError(
+                        f"Le mode {mode} diverge du traitement séquentiel.")
+                latencies[mode] = _time(run, executor, repeat=repeat)
+
+    return {"n_samples": n_samples, "n_leads": n_leads, "workers": workers,
+            "latency": latencies,
+            "speedup": {mode: latencies["serial"] / latency
+                        for mode, latency in latencies.items()}}
+
+
+def _match_peaks(detected, reference, tolerance):
+    """
+    Nombre de pics de `reference` retrouvés dans `detected` à moins de
+    `tolerance` échantillons, et écarts (échantillons) de ces pics.
+    """
+    detected = np.sort(np.asarray(detected, dtype=np.intp))
+    reference = np.asarray(reference, dtype=np.intp)
+    if len(detected) == 0 or len(reference) == 0:
+        return 0, np.empty(0, dtype=np.intp)
+    position = np.searchsorted(detected, reference)
+    before = detected[np.maximum(position - 1, 0)]
+    after = detected[np.minimum(position, len(detected) - 1)]
+    nearest = np.where(reference - before <= after - reference, before,
+                       after)
+    offsets = nearest - reference
+    matched = np.abs(offsets) <= tolerance
+    return int(matched.sum()), offsets[matched]
+
+
+def bench_r_peaks(n_records: int = 10, n_samples: int = 5000,
+                  n_leads: int = 12, heart_rate: float = 70,
+                  fs: int = SAMPLING_RATE, repeat: int = 3,
+                  tolerance: float = 0.05, seed: int = 0) -> dict:
+    """
+    Compare Detection.detect_r_peaks à nk.ecg_peaks sur des enregistrements
+    synthétiques traités et fusionnés.
+
+    Exactitude, en prenant nk.ecg_peaks comme référence (pic retrouvé à
+    moins de `tolerance` secondes) : sur la ligne fusionnée, et sur chaque
+    dérivation pour les pics détectés sur la ligne fusionnée puis replacés
+    (Detection.refine_r_peaks). Débit : nk.ecg_peaks et detect_r_peaks sur
+    un signal, puis les pics R de toutes les lignes d'un enregistrement
+    (nk.ecg_peaks sur chacune, ou une détection et un replacement par
+    dérivation).
+    """
+    import neurokit2 as nk
+
+    window = int(tolerance * fs)
+    counts = {scope: {"reference": 0, "detected": 0, "matched": 0}
+              for scope in ("merged", "leads")}
+    offsets = {"merged": [], "leads": []}
+    times = {"ecg_peaks": 0.0, "detect_r_peaks": 0.0,
+             "ecg_peaks_all_lines": 0.0, "multi_lead": 0.0}
+
+    def nk_peaks(signal):
+        _, rpeaks = nk.ecg_peaks(signal, sampling_rate=fs)
+        return np.asarray(rpeaks["ECG_R_Peaks"], dtype=np.intp)
+
+    def all_lines(signals):
+        return [nk_peaks(signal) for signal in signals]
+
+    def multi_lead(merged, leads):
+        r_peaks = Detection.detect_r_peaks(merged, fs)
+        return [Detection.refine_r_peaks(lead, r_peaks, fs)
+                for lead in leads]
+
+    for i in range(n_records):
+        leads = synthetic_leads(n_samples, n_leads, heart_rate, fs, seed + i)
+        ecg = ECG(None, ECG.Leads([f"L{lead}" for lead in range(n_leads)],
+                                  leads, fs))
+        LineTreatment.treat_ecg(ecg)
+        LineTreatment.merge_ecg(ecg)
+        lines = [np.asarray(line.points) for line in ecg.treated_lines]
+        merged, leads = lines[-1], lines[:-1]
+
+        results = {"merged": [(Detection.detect_r_peaks(merged, fs),
+                               nk_peaks(merged))],
+                   "leads": list(zip(multi_lead(merged, leads),
+                                     all_lines(leads)))}
+        for scope, pairs in results.items():
+            for detected, reference in pairs:
+                matched, matched_offsets = _match_peaks(detected, reference,
+                                                        window)
+                counts[scope]["reference"] += len(reference)
+                counts[scope]["detected"] += len(detected)
+                counts[scope]["matched"] += matched
+                offsets[scope].append(matched_offsets)
+
+        times["ecg_peaks"] += _time(nk_peaks, merged, repeat=repeat)
+        times["detect_r_peaks"] += _time(Detection.detect_r_peaks, merged, fs,
+                                         repeat=repeat)
+        times["ecg_peaks_all_lines"] += _time(all_lines, lines, repeat=repeat)
+        times["multi_lead"] += _time(multi_lead, merged, leads, repeat=repeat)
+
+    accuracy = {}
+    for scope, count in counts.items():
+        scope_offsets = np.abs(np.concatenate(offsets[scope]))
+        accuracy[scope] = {
+            "sensitivity": count["matched"] / max(count["reference"], 1),
+            "precision": count["matched"] / max(count["detected"], 1),
+            "exact": float(np.mean(scope_offsets == 0))
+            if len(scope_offsets) else None,
+            "mean_offset_ms": float(scope_offsets.mean() * 1000 / fs)
+            if len(scope_offsets) else None,
+            **count}
+    return {
+        "config": {"n_records": n_records, "n_samples": n_samples,
+                   "n_leads": n_leads, "heart_rate": heart_rate, "fs": fs,
+                   "tolerance": tolerance, "seed": seed},
+        "accuracy": accuracy,
+        "seconds": times,
+        "speedup": {
+            "single_signal": times["ecg_peaks"] / times["detect_r_peaks"],
+            "record": times["ecg_peaks_all_lines"] / times["multi_lead"]},
+    }
+
+
+# Écart maximal (échantillons) toléré entre les points caractéristiques
+# calculés en float32 et en float64, les battements devant être les mêmes
+FLOAT32_TOLERANCE = 1
+
+
+def bench_precision(n_records: int = 10, n_samples: int = 5000,
+                    n_leads: int = 12, heart_rate: float = 70,
+                    fs: int = SAMPLING_RATE,
+                    tolerance: int = FLOAT32_TOLERANCE,
+                    seed: int = 0) -> dict:
+    """
+    Valide le mode float32 (lecture en float32 et nettoyage en place) contre
+    le traitement float64 sur une cohorte synthétique, et compare leur
+    mémoire.
+
+    Les deux modes doivent détecter les mêmes battements sur chaque ligne et
+    leurs points caractéristiques ne pas différer de plus de `tolerance`
+    échantillons (AssertionError sinon). La mémoire de chaque enregistrement
+    est suivie par tracemalloc de la lecture à la fin du pipeline : pic, et
+    octets encore détenus par l'ECG (ECG.memory_report). MEMO est désactivé.
+    """
+    from pipeline import Pipeline
+
+    modes = {"float64": (np.float64, False), "float32": (np.float32, True)}
+    memory = {mode: {"peak": 0, "retained": 0} for mode in modes}
+    compared = different = max_offset = 0
+
+    with memo.MEMO.disabled(), tempfile.TemporaryDirectory() as directory:
+        df_meta = write_synthetic_cohort(directory, n_records, n_samples,
+                                         n_leads, heart_rate, fs, seed)
+        for _, row in df_meta.iterrows():
+            ecgs = {}
+            for mode, (dtype, in_place) in modes.items():
+                tracemalloc.start()
+                try:
+                    ecg = ECG(row, parse_lines(row.ecg_file_path, dtype=dtype))
+                    Pipeline(Pipeline.default(in_place=in_place).stages,
+                             track_memory=False).run(ecg)
+                    memory[mode]["peak"] += tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                memory[mode]["retained"] += ecg.memory_report()["total"]
+                ecgs[mode] = ecg
+
+            for reference, reduced in zip(ecgs["float64"].treated_lines,
+                                          ecgs["float32"].treated_lines):
+                expected = reference.fiducials.table
+                actual = reduced.fiducials.table
+                if expected.shape != actual.shape or not np.array_equal(
+                        expected == MISSING, actual == MISSING):
+                    raise AssertionError(
+                        f"{row.ecg_file_path} ({reference.label}) : "
+                        f"battements différents en float32.")
+                offsets = np.abs(expected.astype(np.int64) - actual)
+                compared += int(np.sum(expected != MISSING))
+                different += int(np.count_nonzero(offsets))
+                max_offset = max(max_offset, int(offsets.max(initial=0)))
+
+    if max_offset > tolerance:
+        raise AssertionError(
+            f"Écart float32 de {max_offset} échantillons (tolérance : "
+            f"{tolerance}).")
+    return {
+        "config": {"n_records": n_records, "n_samples": n_samples,
+                   "n_leads": n_leads, "heart_rate": heart_rate, "fs": fs,
+                   "tolerance": tolerance, "seed": seed},
+        "fiducials": {"compared": compared, "different": different,
+                      "max_offset": max_offset},
+        "memory": {mode: {key: value / n_records
+                          for key, value in values.items()}
+                   for mode, values in memory.items()},
+        "peak_ratio": memory["float32"]["peak"] / memory["float64"]["peak"],
+    }
+
+
+def bench_profiling(n_records: int = 10, n_samples: int = 5000,
+                    n_leads: int = 12, heart_rate: float = 70,
+                    fs: int = SAMPLING_RATE, repeat: int = 5,
+                    seed: int = 0) -> dict:
+    """
+    Coût de l'instrumentation (voir profiling.Profiler) sur la détection
+    d'une cohorte synthétique traitée et fusionnée, MEMO désactivé.
+
+    La détection est chronométrée registre désactivé puis activé (meilleure
+    de `repeat` passes). Le surcoût du registre désactivé est estimé par le
+    nombre d'appels instrumentés multiplié par le coût d'un
+    PROFILE.start() désactivé.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        df_meta = write_synthetic_cohort(directory, n_records, n_samples,
+                                         n_leads, heart_rate, fs, seed)
+        ecgs = [ECG(row, parse_lines(row.ecg_file_path))
+                for _, row in df_meta.iterrows()]
+
+    def detect_all():
+        for ecg in ecgs:
+            Detection.detect(ecg)
+
+    profiled = PROFILE.enabled
+    with memo.MEMO.disabled():
+        try:
+            for ecg in ecgs:
+                LineTreatment.treat_ecg(ecg)
+                LineTreatment.merge_ecg(ecg)
+            PROFILE.enabled = False
+            disabled = _time(detect_all, repeat=repeat)
+            start_cost = _time(lambda: [PROFILE.start() for _ in range(10000)],
+                               repeat=repeat) / 10000
+            with PROFILE.collect() as collected:
+                enabled_time = _time(detect_all, repeat=repeat)
+        finally:
+            PROFILE.enabled = profiled
+
+    stats = collected.to_dict()
+    calls = sum(values[Profiler.CALLS] for values in stats.values()) / repeat
+    return {
+        "config": {"n_records": n_records, "n_samples": n_samples,
+                   "n_leads": n_leads, "heart_rate": heart_rate, "fs": fs,
+                   "repeat": repeat, "seed": seed},
+        "disabled_seconds": disabled,
+        "enabled_seconds": enabled_time,
+        "enabled_overhead": enabled_time / disabled - 1,
+        "disabled_overhead": calls * start_cost / disabled,
+        "profile": stats,
+    }
+
+
+# Budget d'import (s, temps cumulé de -X importtime) des modules du cœur, et
+# dépendances lourdes qu'ils ne doivent pas charger à l'import
+IMPORT_BUDGET = 0.3
+IMPORT_MODULES = ["ecg", "parser", "detection", "line_treatments",
+                  "measurements", "calculation", "diagnostic", "pipeline",
+                  "memo", "templates", "profiling", "streaming", "ecg_batch"]
+HEAVY_MODULES = ["neurokit2", "matplotlib.pyplot", "pandas", "scipy"]
+
+
+def bench_import(module: str, repeat: int = 3) -> dict:
+    """
+    Mesure le temps d'import de `module` dans un interpréteur neuf avec
+    -X importtime (meilleur de `repeat` essais) et liste les dépendances
+    lourdes qu'il importe.
+    """
+    best = float("inf")
+    heavy = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, check=True).stderr
+        # Lignes "import time: self [us] | cumulative | module indenté"
+        rows = [line.split("|") for line in output.splitlines()
+                if line.startswith("import time:") and "cumulative" not in line]
+        imported = {row[2].strip(): int(row[1]) for row in rows}
+        best = min(best, imported[module] / 1e6)
+        heavy = [name for name in HEAVY_MODULES if name in imported]
+    return {"module": module, "import_time": best, "heavy_imports": heavy}
+
+
+def check_imports(budget: float = IMPORT_BUDGET) -> bool:
+    """Vérifie le budget d'import des modules du cœur et affiche le détail."""
+    ok = True
+    for module in IMPORT_MODULES:
+        result = bench_import(module)
+        within = result["import_time"] <= budget and not result["heavy_imports"]
+        ok &= within
+        heavy = ", ".join(result["heavy_imports"])
+        print(f"import {module}: {result['import_time'] * 1000:.0f} ms"
+              f"{f' ({heavy})' if heavy else ''}"
+              f"{'' if within else ' DÉPASSEMENT'}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks des étapes de détection.")
+    parser.add_argument("--samples", type=int, nargs="+",
+                        default=[5000, 60000, 500000])
+    parser.add_argument("--parity", action="store_true",
+                        help="Vérifie uniquement la parité de "
+                             "detect_local_maxima avec la boucle de référence "
+                             "et la clé du cache de la détection")
+    parser.add_argument("--imports", action="store_true",
+                        help="Vérifie uniquement le budget de temps d'import")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET)
+    parser.add_argument("--suite", action="store_true",
+                        help="Chronomètre toutes les étapes du pipeline sur "
+                             "une cohorte synthétique")
+    parser.add_argument("--records", type=int, default=10)
+    parser.add_argument("--leads", type=int, default=12)
+    parser.add_argument("--heart-rate", type=float, default=70)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--lead-workers", type=int, default=None,
+                        help="Mesure la latence d'un enregistrement avec les "
+                             "dérivations réparties sur N threads/processus")
+    parser.add_argument("--r-peaks", action="store_true",
+                        help="Compare Detection.detect_r_peaks à "
+                             "nk.ecg_peaks (exactitude et débit)")
+    parser.add_argument("--precision", action="store_true",
+                        help="Valide le mode float32 (points "
+                             "caractéristiques et mémoire par enregistrement)")
+    parser.add_argument("--profiling", action="store_true",
+                        help="Mesure le surcoût de l'instrumentation de la "
+                             "détection (registre désactivé et activé)")
+    parser.add_argument("--json", default=None,
+                        help="Fichier JSON où enregistrer les résultats")
+    args = parser.parse_args()
+
+    if args.imports:
+        sys.exit(0 if check_imports(args.import_budget) else 1)
+
+    if args.parity:
+        print(f"detect_local_maxima : {check_local_maxima_parity()} cas "
+              f"identiques à la référence.")
+        print(f"process_ecg_signal : {check_detection_memo()} paramètres de "
+              f"Detection dans la clé du cache.")
+        sys.exit(0)
+
+    if args.lead_workers:
+        for n in args.samples:
+            result = bench_lead_parallel(n, args.leads, args.lead_workers,
+                                         repeat=args.repeat)
+            print(f"n_samples={n} workers={args.lead_workers}: " + ", ".join(
+                f"{mode} {latency * 1000:.0f} ms "
+                f"(x{result['speedup'][mode]:.1f})"
+                for mode, latency in result["latency"].items()))
+        sys.exit(0)
+
+    if args.precision:
+        results = [bench_precision(args.records, n, args.leads,
+                                   args.heart_rate)
+                   for n in args.samples]
+        for result in results:
+            fiducials = result["fiducials"]
+            print(f"n_samples={result['config']['n_samples']}: "
+                  f"{fiducials['different']}/{fiducials['compared']} points "
+                  f"décalés (au plus {fiducials['max_offset']} échantillon), "
+                  f"pic mémoire x{result['peak_ratio']:.2f}")
+            for mode, metrics in result["memory"].items():
+                print(f"  {mode}  pic {metrics['peak'] / 1e6:.1f} Mo  "
+                      f"conservé {metrics['retained'] / 1e6:.1f} Mo")
+        _save_json(results, args.json)
+        sys.exit(0)
+
+    if args.profiling:
+        results = [bench_profiling(args.records, n, args.leads,
+                                   args.heart_rate, repeat=args.repeat)
+                   for n in args.samples]
+        for result in results:
+            print(f"n_samples={result['config']['n_samples']}: "
+                  f"désactivé {result['disabled_seconds'] * 1e3:.1f} ms "
+                  f"(surcoût estimé {result['disabled_overhead']:.2%}), "
+                  f"activé {result['enabled_seconds'] * 1e3:.1f} ms "
+                  f"({result['enabled_overhead']:+.1%})")
+        _save_json(results, args.json)
+        sys.exit(0)
+
+    if args.r_peaks:
+        results = [bench_r_peaks(args.records, n, args.leads, args.heart_rate,
+                                 repeat=args.repeat)
+                   for n in args.samples]
+        for result in results:
+            print(f"n_samples={result['config']['n_samples']}: "
+                  f"x{result['speedup']['single_signal']:.1f} par signal, "
+                  f"x{result['speedup']['record']:.1f} par enregistrement")
+            for scope, metrics in result["accuracy"].items():
+                print(f"  {scope:<7} sensibilité {metrics['sensitivity']:.3f}"
+                      f"  précision {metrics['precision']:.3f}"
+                      f"  identiques {metrics['exact']:.3f}"
+                      f"  écart moyen {metrics['mean_offset_ms']:.1f} ms")
+        _save_json(results, args.json)
+        sys.exit(0)
+
+    if args.suite:
+        results = [bench_pipeline(args.records, n, args.leads,
+                                  args.heart_rate, repeat=args.repeat)
+                   for n in args.samples]
+        for result in results:
+            print(f"n_samples={result['config']['n_samples']}")
+            for stage, metrics in result["stages"].items():
+                print(f"  {stage:<21} {metrics['samples_per_s']:.3e} "
+                      f"samples/s  {metrics['records_per_s']:8.1f} records/s")
+        _save_json(results, args.json)
+        sys.exit(0)
+
+    for n in args.samples:
+        result = bench_local_maxima(n)
+        print(f"detect_local_maxima n={n}: "
+              f"{result['vectorized_samples_per_s']:.3e} samples/s "
+              f"(référence {result['reference_samples_per_s']:.3e}, "
+              f"x{result['speedup']:.1f})")
+        result = bench_baseline(n)
+        print(f"estimate_baseline n={n}: "
+              f"{result['baseline_samples_per_s']:.3e} samples/s "
+              f"(fenêtre naïve {result['naive_samples_per_s']:.3e}, "
+              f"x{result['speedup']:.1f})")
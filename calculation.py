@@ -1,3 +1,5 @@
+from typing import Optional
+
 from ecg import ECG
 
 
@@ -36,7 +38,7 @@ class Calculation:
 
     def st_segments(self) -> [int]:
         """
-        Retourne les déviations du segment ST en millivolts (converti en millisecondes si nécessaire).
+        Retourne les déviations du segment ST en millivolts.
         """
         return self.ecg.get_st_segments()
 
@@ -51,11 +53,11 @@ class Calculation:
         Calcule et retourne la fréquence cardiaque moyenne en battements par minute (bpm).
         """
         rr = self.rr_intervals()
-        return int(60000 / (sum(rr) / len(rr))) if rr else 0
+        return int(60000 / (sum(rr) / len(rr))) if len(rr) else 0
 
-    def age_of_patient(self) -> int:
+    def age_of_patient(self) -> Optional[int]:
         """
-        Retourne l'âge du patient en années.
+        Retourne l'âge du patient en années, None s'il est inconnu.
         """
         return self.ecg.get_patient_age()
 
@@ -0,0 +1,63 @@
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Iterator, Optional, Union
+
+from ecg import ECG
+from parser import parse_lines
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class Cohort:
+    """
+    Collection d'ECG paresseux construite à partir de df_meta.
+
+    Les ECG sont créés à la demande pendant l'itération et leurs dérivations
+    ne sont lues qu'au premier accès à `ECG.lines` (ou à une seule
+    dérivation via `ECG.line`). Les filtres sur les métadonnées ne lisent
+    donc aucun fichier de signal.
+    """
+
+    def __init__(self, df_meta: 'pd.DataFrame',
+                 cache_dir: Optional[str] = None):
+        self.df_meta = df_meta
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def read_pickle(path: str, cache_dir: Optional[str] = None) -> 'Cohort':
+        import pandas as pd
+
+        return Cohort(pd.read_pickle(path), cache_dir)
+
+    def _ecg(self, row: 'pd.Series') -> 'ECG':
+        return ECG(row, loader=partial(parse_lines, row.ecg_file_path,
+                                       self.cache_dir))
+
+    def __len__(self) -> int:
+        return len(self.df_meta)
+
+    def __iter__(self) -> Iterator['ECG']:
+        for _, row in self.df_meta.iterrows():
+            yield self._ecg(row)
+
+    def __getitem__(self, position: int) -> 'ECG':
+        return self._ecg(self.df_meta.iloc[position])
+
+    def filter(self, condition: Union['pd.Series',
+                                      Callable[['pd.DataFrame'], 'pd.Series']]
+               ) -> 'Cohort':
+        """
+        Sous-cohorte des lignes vérifiant `condition` : un masque booléen ou
+        une fonction de df_meta vers un masque booléen.
+        """
+        mask = condition(self.df_meta) if callable(condition) else condition
+        return Cohort(self.df_meta[mask], self.cache_dir)
+
+    def with_diagnosis(self, text: str, original: bool = False) -> 'Cohort':
+        """Sous-cohorte dont le diagnostic contient `text` (sans casse)."""
+        column = "original_diagnosis" if original else "diagnosis"
+        text = text.lower()
+        return self.filter(self.df_meta[column].map(
+            lambda diagnosis: any(text in str(item).lower() for item in (
+                diagnosis if isinstance(diagnosis, (list, tuple))
+                else [diagnosis]))))
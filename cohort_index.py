@@ -0,0 +1,261 @@
+import argparse
+import json
+import sqlite3
+from typing import (TYPE_CHECKING, Dict, Hashable, Iterable, List, Mapping,
+                    Optional, Sequence, Tuple)
+
+import numpy as np
+
+from cohort import Cohort
+from diagnostic import Diagnostics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class CohortIndex:
+    """
+    Index SQLite d'une cohorte : une ligne par enregistrement de df_meta avec
+    les données patient (ECG.PatientData), le résumé de ses mesures et les
+    résultats des règles de Diagnostics.
+
+    Les requêtes ne lisent que ce fichier, aucun signal. Par exemple, les
+    hommes de plus de 60 ans avec un QTc supérieur à 460 ms et une
+    bradycardie :
+
+        index.query("gender = ? AND age > ? AND qtc > ? AND bradycardie",
+                    ("M", 60, 460))
+
+    L'index de df_meta est enregistré sous forme de texte (colonne record),
+    quel que soit son type ; cohort retrouve les lignes d'origine. Les
+    enregistrements non traités (ou en erreur) ont des mesures et des règles
+    NULL.
+    """
+    PATIENT_COLUMNS = {"patient_id": "TEXT", "age": "INTEGER",
+                       "date_of_birth": "TEXT", "gender": "TEXT",
+                       "height_cm": "REAL", "weight_kg": "REAL",
+                       "date": "TEXT", "location": "TEXT",
+                       "diagnosis": "TEXT", "original_diagnosis": "TEXT"}
+    # Colonnes enregistrées en JSON (liste ou texte) et relues telles quelles
+    JSON_COLUMNS = ("diagnosis", "original_diagnosis")
+    # Colonnes résumant une mesure par battement (médiane des battements)
+    MEDIANS = {"rr_interval": "rr_intervals", "pr_interval": "pr_intervals",
+               "pr_segment": "pr_segments", "qrs_duration": "qrs_durations",
+               "qt_interval": "qt_intervals", "st_segment": "st_segments",
+               "p_wave_amplitude": "p_wave_amplitudes",
+               "qrs_amplitude": "qrs_amplitudes",
+               "t_wave_amplitude": "t_wave_amplitudes"}
+    SUMMARY_COLUMNS = ("n_beats", "heart_rate", "qtc", *MEDIANS, "qrs_axis")
+    # Une colonne booléenne par règle (tachycardie, bradycardie...)
+    FLAGS = tuple(Diagnostics.evaluate_arrays([], []))
+    # Index des critères de sélection les plus courants
+    INDEXES = (("gender", "age"), ("age",), ("patient_id",),
+               ("heart_rate",), ("qtc",), ("qrs_duration",))
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        columns = ", ".join(
+            ["record TEXT PRIMARY KEY", "ecg_file_path TEXT"]
+            + [f"{name} {kind}"
+               for name, kind in CohortIndex.PATIENT_COLUMNS.items()]
+            + [f"{name} REAL" for name in CohortIndex.SUMMARY_COLUMNS]
+            + [f"{name} INTEGER" for name in CohortIndex.FLAGS])
+        with self.connection:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS records ({columns})")
+            for indexed in CohortIndex.INDEXES:
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS records_{'_'.join(indexed)}"
+                    f" ON records ({', '.join(indexed)})")
+
+    @staticmethod
+    def summarize(measurements: Dict[str, np.ndarray],
+                  age: Optional[int]) -> dict:
+        """
+        Résumé sérialisable en JSON des mesures par battement d'un ECG (voir
+        ECG.measurements) : nombre de battements, fréquence cardiaque
+        moyenne, QTc de Bazett, médianes des intervalles et amplitudes, axe
+        du QRS, et résultat de chaque règle de Diagnostics.
+        """
+        def median(values) -> Optional[float]:
+            values = np.asarray(values, dtype=np.float64)
+            values = values[~np.isnan(values)]
+            return float(np.median(values)) if len(values) else None
+
+        rr = np.asarray(measurements["rr_intervals"], dtype=np.float64)
+        qt = np.asarray(measurements["qt_intervals"], dtype=np.float64)
+        # Mêmes conventions que Diagnostics.evaluate_measurements
+        paired = min(len(qt), len(rr))
+        summary = {
+            "n_beats": len(measurements["qrs_durations"]),
+            "heart_rate": float(np.floor(60000 / rr.mean())) if len(rr)
+            else None,
+            "qtc": median(qt[:paired] / np.sqrt(rr[:paired] / 1000)),
+        }
+        summary.update({column: median(measurements[key])
+                        for column, key in CohortIndex.MEDIANS.items()})
+        axis = float(measurements["qrs_axis"])
+        summary["qrs_axis"] = None if np.isnan(axis) else axis
+
+        flags = Diagnostics.evaluate_measurements([measurements], [age])
+        summary.update({flag: bool(value)
+                        for flag, value in flags.iloc[0].items()})
+        return summary
+
+    @staticmethod
+    def _sql_value(value):
+        """Valeur de df_meta ou du résumé convertie pour SQLite."""
+        if value is None or isinstance(value, (bool, int, str)):
+            return value
+        if isinstance(value, float):
+            return None if value != value else value
+        if isinstance(value, np.generic):
+            return CohortIndex._sql_value(value.item())
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return [CohortIndex._sql_value(item) for item in value]
+        # Dates (pd.Timestamp, datetime...)
+        import pandas as pd
+
+        return None if pd.isna(value) else str(value)
+
+    @staticmethod
+    def record_key(index) -> str:
+        """Clé (texte) d'un index de df_meta dans la colonne record."""
+        return str(index)
+
+    @staticmethod
+    def _patient_value(name: str, value):
+        value = CohortIndex._sql_value(value)
+        if value is not None and (name in CohortIndex.JSON_COLUMNS
+                                  or isinstance(value, list)):
+            return json.dumps(value)
+        return value
+
+    def add(self, records: Iterable[Tuple[Hashable, Mapping,
+                                          Optional[dict]]]
+            ) -> None:
+        """
+        Ajoute ou remplace des enregistrements : triplets (index dans
+        df_meta, ligne de df_meta en dictionnaire ou pd.Series, résumé de
+        summarize ou None).
+        """
+        summary_names = [*CohortIndex.SUMMARY_COLUMNS, *CohortIndex.FLAGS]
+        names = ["record", "ecg_file_path", *CohortIndex.PATIENT_COLUMNS,
+                 *summary_names]
+        rows = ([CohortIndex.record_key(index), row.get("ecg_file_path")]
+                + [CohortIndex._patient_value(name, row.get(name))
+                   for name in CohortIndex.PATIENT_COLUMNS]
+                + [CohortIndex._sql_value((summary or {}).get(name))
+                   for name in summary_names]
+                for index, row, summary in records)
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO records ({', '.join(names)}) "
+                f"VALUES ({', '.join('?' * len(names))})", rows)
+
+    def build(self, df_meta: 'pd.DataFrame',
+              summaries: Dict[Hashable, dict]) -> None:
+        """Indexe toutes les lignes de df_meta avec leur résumé, s'il existe."""
+        # Lignes en dictionnaires : bien plus rapide que iterrows
+        self.add((index, row, summaries.get(index)) for index, row
+                 in zip(df_meta.index, df_meta.to_dict("records")))
+        with self.connection:
+            # Statistiques pour que SQLite choisisse le meilleur index
+            self.connection.execute("ANALYZE")
+
+    def _columns(self, columns: str) -> str:
+        """
+        Liste de colonnes SQL de `columns` (noms séparés par des virgules,
+        ou *), vérifiés contre le schéma de la table.
+        """
+        if columns.strip() == "*":
+            return "*"
+        names = [name.strip() for name in columns.split(",")]
+        known = {name for _, name, *_ in self.connection.execute(
+            "PRAGMA table_info(records)")}
+        unknown = [name for name in names if name not in known]
+        if unknown:
+            raise ValueError(f"Colonnes inconnues : {', '.join(unknown)}")
+        return ", ".join(f'"{name}"' for name in names)
+
+    def query(self, where: str = "1", params: Sequence = (),
+              columns: str = "*") -> 'pd.DataFrame':
+        """
+        Enregistrements vérifiant la condition SQL `where`, indexés par
+        record, dans l'ordre d'indexation. Les valeurs sont passées dans
+        `params`, avec des ? dans `where`. Les diagnostics sont relus sous
+        forme de listes.
+        """
+        import pandas as pd
+
+        df = pd.read_sql_query(
+            f"SELECT {self._columns(columns)} FROM records WHERE {where} "
+            f"ORDER BY rowid", self.connection, params=list(params))
+        for column in CohortIndex.JSON_COLUMNS:
+            if column in df:
+                df[column] = df[column].map(
+                    lambda value: value if value is None
+                    else json.loads(value))
+        return df.set_index("record") if "record" in df else df
+
+    def records(self, where: str = "1", params: Sequence = ()) -> List[str]:
+        """
+        Clés (voir record_key) des enregistrements vérifiant `where`, dans
+        l'ordre d'indexation.
+        """
+        return [record for record, in self.connection.execute(
+            f"SELECT record FROM records WHERE {where} ORDER BY rowid",
+            list(params))]
+
+    def count(self, where: str = "1", params: Sequence = ()) -> int:
+        return self.connection.execute(
+            f"SELECT COUNT(*) FROM records WHERE {where}",
+            list(params)).fetchone()[0]
+
+    def cohort(self, df_meta: 'pd.DataFrame', where: str = "1",
+               params: Sequence = (), cache_dir: Optional[str] = None
+               ) -> 'Cohort':
+        """Cohorte (paresseuse) des lignes de df_meta vérifiant `where`."""
+        indexes = {CohortIndex.record_key(index): index
+                   for index in df_meta.index}
+        return Cohort(df_meta.loc[[indexes[record] for record
+                                   in self.records(where, params)]],
+                      cache_dir)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> 'CohortIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Interroge l'index d'une cohorte (voir ecg_batch "
+                    "--index).")
+    parser.add_argument("index", help="Fichier SQLite de l'index")
+    parser.add_argument("where", nargs="?", default="1",
+                        help="Condition SQL, par exemple \"gender = ? AND "
+                             "age > ? AND qtc > ? AND bradycardie\"")
+    parser.add_argument("--param", action="append", default=[],
+                        dest="params",
+                        help="Valeur d'un ? de la condition, dans l'ordre "
+                             "(par exemple --param M --param 60 --param "
+                             "460)")
+    parser.add_argument("--columns", default="record, patient_id, age, "
+                                             "gender, heart_rate, qtc, "
+                                             "ecg_file_path")
+    parser.add_argument("--count", action="store_true",
+                        help="Affiche uniquement le nombre d'enregistrements")
+    args = parser.parse_args()
+
+    with CohortIndex(args.index) as cohort_index:
+        if args.count:
+            print(cohort_index.count(args.where, args.params))
+        else:
+            print(cohort_index.query(args.where, args.params, args.columns)
+                  .to_string())
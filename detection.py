@@ -1,7 +1,46 @@
-import neurokit2 as nk
+from contextlib import nullcontext
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from fiducials import MISSING, Fiducials
+from memo import MEMO
+from profiling import PROFILE
 
 
 class Detection:
+    # Paramètres de detect_r_peaks (durées en secondes)
+    SMOOTH_WINDOW = 0.1
+    AVERAGE_WINDOW = 0.75
+    GRADIENT_THRESHOLD = 1.5
+    MIN_QRS_RATIO = 0.4
+    REFRACTORY = 0.3
+    # Demi-fenêtre (s) de recherche du pic R d'une dérivation autour du pic
+    # détecté sur la ligne fusionnée
+    REFINE_WINDOW = 0.05
+    # Paramètres par défaut de detect_q_and_s, detect_p_wave et
+    # detect_t_wave_end (durées en secondes)
+    QRS_DURATION = 0.20
+    P_SEARCH_WINDOW = 0.3
+    P_DERIV_WINDOW = 0.08
+    P_THRESHOLD = 0.25
+    T_SEARCH_WINDOW = 0.3
+    T_DERIV_WINDOW = 0.04
+
+    @staticmethod
+    def params() -> dict:
+        """
+        Paramètres dont dépend le résultat de process_ecg_signal : ils
+        entrent dans sa clé de mémoïsation (voir memo.MEMO) et dans
+        l'empreinte d'un lot (voir ecg_batch.pipeline_params), si bien que
+        modifier un seuil invalide les résultats déjà calculés.
+        """
+        return {name: getattr(Detection, name) for name in (
+            "SMOOTH_WINDOW", "AVERAGE_WINDOW", "GRADIENT_THRESHOLD",
+            "MIN_QRS_RATIO", "REFRACTORY", "REFINE_WINDOW", "QRS_DURATION",
+            "P_SEARCH_WINDOW", "P_DERIV_WINDOW", "P_THRESHOLD",
+            "T_SEARCH_WINDOW", "T_DERIV_WINDOW")}
+
     @staticmethod
     def detect_local_maxima(signal, threshold_ratio=0.7):
         """
@@ -18,32 +57,180 @@ class Detection:
                                                                  '__iter__'):
             raise ValueError("Le signal doit être un tableau ou une liste.")
 
-        interval = max(signal) - min(signal)
-        threshold = threshold_ratio * interval + min(signal)
-        maxima = []
-        maxima_indices = []
-        detected_indices = []
-        above_threshold = False
-
-        for i in range(len(signal)):
-            if signal[i] >= threshold:  # Si la valeur dépasse le seuil
-                above_threshold = True
-                maxima_indices.append(i)
-                maxima.append(signal[i])
-            elif above_threshold and signal[
-                i] < threshold:  # Si on retombe en dessous du seuil
-                # Trouver l'indice du maximum local
-                index_local_max = maxima.index(max(maxima))
-                detected_indices.append(maxima_indices[index_local_max])
-                # Réinitialiser les valeurs temporaires
-                maxima = []
-                maxima_indices = []
-                above_threshold = False
-
-        return detected_indices
-
-    @staticmethod
-    def detect_q_and_s(signal, r_peaks_indices, fs, qrs_duration=0.20):
+        signal = np.asarray(signal)
+        interval = signal.max() - signal.min()
+        threshold = threshold_ratio * interval + signal.min()
+        above_threshold = signal >= threshold
+
+        # Bornes des plages au-dessus du seuil (début inclus, fin exclue)
+        edges = np.diff(above_threshold.astype(np.int8))
+        starts = np.flatnonzero(edges == 1) + 1
+        if above_threshold[0]:
+            starts = np.concatenate(([0], starts))
+        ends = np.flatnonzero(edges == -1) + 1
+        # Une plage encore ouverte en fin de signal n'est pas retenue
+        starts = starts[:len(ends)]
+        if len(starts) == 0:
+            return []
+
+        # Maximum de chaque plage : les échantillons sous le seuil situés
+        # entre deux plages ne peuvent pas dépasser le maximum de la plage
+        run_maxima = np.maximum.reduceat(signal[:ends[-1]], starts)
+
+        # Premier indice atteignant le maximum dans chaque plage
+        run_starts = np.zeros(ends[-1], dtype=np.int8)
+        run_starts[starts] = 1
+        run_ids = np.cumsum(run_starts) - 1
+        candidates = np.flatnonzero(
+            above_threshold[:ends[-1]] &
+            (signal[:ends[-1]] == run_maxima[run_ids]))
+        first = np.diff(run_ids[candidates], prepend=-1) != 0
+
+        return candidates[first].tolist()
+
+    @staticmethod
+    def detect_r_peaks(signal, fs):
+        """
+        Détecte les pics R d'un signal ECG nettoyé.
+
+        Les complexes QRS sont les plages où la valeur absolue de la dérivée,
+        lissée sur SMOOTH_WINDOW, dépasse un seuil adaptatif : sa moyenne
+        glissante sur AVERAGE_WINDOW multipliée par GRADIENT_THRESHOLD. Les
+        plages plus courtes que MIN_QRS_RATIO fois leur durée moyenne sont
+        écartées. Le pic R est le maximum du signal sur chaque plage, s'il
+        n'est pas sur un bord ; un pic à moins de REFRACTORY du pic précédent
+        retenu est ignoré.
+
+        Même principe que la méthode par défaut de nk.ecg_peaks, sans
+        construction de DataFrame ni boucle par complexe.
+
+        Args:
+            signal (list or array): Signal ECG nettoyé.
+            fs (int): Fréquence d'échantillonnage.
+
+        Returns:
+            np.ndarray: Indices des pics R détectés.
+        """
+        start = PROFILE.start()
+        peaks = Detection._detect_r_peaks(signal, fs)
+        if start is not None:
+            PROFILE.record("detect_r_peaks", start, samples=len(signal),
+                           beats=len(peaks))
+        return peaks
+
+    @staticmethod
+    def _detect_r_peaks(signal, fs):
+        signal = np.asarray(signal, dtype=np.float64)
+        if len(signal) < 2:
+            return np.empty(0, dtype=np.intp)
+
+        smooth = Detection._moving_average(
+            np.abs(np.gradient(signal)),
+            int(round(Detection.SMOOTH_WINDOW * fs)))
+        threshold = Detection.GRADIENT_THRESHOLD * Detection._moving_average(
+            smooth, int(round(Detection.AVERAGE_WINDOW * fs)))
+
+        # Plages ]début, fin] au-dessus du seuil ; une plage ouverte au début
+        # ou à la fin du signal n'est pas retenue
+        qrs = smooth > threshold
+        starts = np.flatnonzero(~qrs[:-1] & qrs[1:])
+        ends = np.flatnonzero(qrs[:-1] & ~qrs[1:])
+        if len(starts) == 0:
+            return np.empty(0, dtype=np.intp)
+        ends = ends[ends > starts[0]]
+        n_qrs = min(len(starts), len(ends))
+        if n_qrs == 0:
+            return np.empty(0, dtype=np.intp)
+        starts, ends = starts[:n_qrs], ends[:n_qrs]
+
+        lengths = ends - starts
+        long_enough = lengths >= Detection.MIN_QRS_RATIO * lengths.mean()
+        starts, ends = starts[long_enough], ends[long_enough]
+        peaks = Detection._segment_argmax(signal, starts, ends)
+        # Un maximum au bord de la plage est une pente (fin d'onde T...), pas
+        # un pic
+        peaks = peaks[(peaks > starts) & (peaks < ends - 1)]
+        return Detection._enforce_refractory(
+            peaks, int(round(Detection.REFRACTORY * fs)))
+
+    @staticmethod
+    def refine_r_peaks(signal, r_peaks_indices, fs, window=None):
+        """
+        Replace chaque pic R (détecté sur un autre signal, typiquement la
+        ligne fusionnée) sur le maximum du signal à moins de `window`
+        secondes (REFINE_WINDOW par défaut).
+
+        Returns:
+            np.ndarray: Indices des pics R dans ce signal, un par pic donné.
+        """
+        start = PROFILE.start()
+        r_peaks = np.asarray(r_peaks_indices, dtype=np.intp)
+        half = int((Detection.REFINE_WINDOW if window is None else window)
+                   * fs)
+        # Le remplissage -inf hors du signal n'est jamais maximal
+        windows = Detection._beat_windows(
+            np.asarray(signal, dtype=np.float64), r_peaks - half,
+            2 * half + 1, -np.inf)
+        refined = r_peaks - half + np.argmax(windows, axis=1)
+        if start is not None:
+            PROFILE.record("refine_r_peaks", start, samples=windows.size,
+                           beats=len(r_peaks))
+        return refined
+
+    @staticmethod
+    def _moving_average(values, size):
+        """
+        Moyenne glissante centrée sur `size` échantillons, les bords étant
+        prolongés par la première et la dernière valeur (comme
+        nk.signal_smooth avec un noyau boxcar).
+        """
+        if size <= 1:
+            return values
+        padded = np.concatenate((np.full(size, values[0]), values,
+                                 np.full(size, values[-1])))
+        cumulative = np.concatenate(([0.0], np.cumsum(padded)))
+        # Fenêtre [i - size // 2, i + (size - 1) // 2] de chaque échantillon
+        ends = np.arange(len(values)) + size + (size - 1) // 2 + 1
+        return (cumulative[ends] - cumulative[ends - size]) / size
+
+    @staticmethod
+    def _segment_argmax(signal, starts, ends):
+        """
+        Premier indice du maximum de signal sur chaque plage [start, end),
+        les plages étant disjointes, non vides et triées.
+        """
+        if len(starts) == 0:
+            return np.empty(0, dtype=np.intp)
+        lengths = ends - starts
+        offsets = np.cumsum(lengths) - lengths
+        # Indices de tous les échantillons des plages, mis bout à bout
+        positions = (np.arange(lengths.sum())
+                     + np.repeat(starts - offsets, lengths))
+        segment_ids = np.repeat(np.arange(len(starts)), lengths)
+        values = signal[positions]
+
+        maxima = np.maximum.reduceat(values, offsets)
+        hits = np.flatnonzero(values == maxima[segment_ids])
+        first = np.diff(segment_ids[hits], prepend=-1) != 0
+        return positions[hits[first]]
+
+    @staticmethod
+    def _enforce_refractory(peaks, refractory):
+        """
+        Retire les pics à moins de `refractory` échantillons (inclus) du pic
+        précédent retenu.
+        """
+        if np.all(np.diff(peaks) > refractory):
+            return peaks
+        # Rare : seule une suite de pics rapprochés impose le parcours
+        kept = [peaks[0]]
+        for peak in peaks[1:]:
+            if peak - kept[-1] > refractory:
+                kept.append(peak)
+        return np.asarray(kept, dtype=np.intp)
+
+    @staticmethod
+    def detect_q_and_s(signal, r_peaks_indices, fs, qrs_duration=None):
         """
         Détecte les points Q et S autour des pics R dans un signal ECG.
 
@@ -51,41 +238,53 @@ class Detection:
             signal (list or array): Signal ECG brut.
             r_peaks_indices (list): Indices des pics R détectés.
             fs (int): Fréquence d'échantillonnage du signal.
-            qrs_duration (float): Durée maximale du complexe QRS en secondes (par défaut : 0.14 s).
+            qrs_duration (float): Durée maximale du complexe QRS en secondes (par défaut : QRS_DURATION).
 
         Returns:
             dict: Indices des points Q et S détectés.
         """
-        qs_indices = {"Q_Peaks": [], "S_Peaks": []}
+        q_indices, s_indices = Detection.q_and_s_per_beat(
+            signal, r_peaks_indices, fs, qrs_duration)
+        return {"Q_Peaks": q_indices[q_indices != MISSING].tolist(),
+                "S_Peaks": s_indices[s_indices != MISSING].tolist()}
+
+    @staticmethod
+    def q_and_s_per_beat(signal, r_peaks_indices, fs, qrs_duration=None):
+        """Points Q et S de chaque battement (alignés sur
+        r_peaks_indices), MISSING si absent. Voir detect_q_and_s."""
+        start = PROFILE.start()
+        if qrs_duration is None:
+            qrs_duration = Detection.QRS_DURATION
+        signal = np.asarray(signal)
+        r_peaks = np.asarray(r_peaks_indices, dtype=np.intp)
 
         # Taille des fenêtres (en nombre d'échantillons) pour la recherche de Q et S
         window_size = int(
             qrs_duration * fs / 2)  # Demi-fenêtre autour de chaque R
 
-        for r_peak_i in r_peaks_indices:
-            # Vérifier les limites des indices pour éviter des erreurs d'accès
-            left_start = max(0, r_peak_i - window_size)
-            right_end = min(len(signal), r_peak_i + window_size)
-
-            # Intervalle gauche pour détecter Q
-            left_interval = signal[left_start:r_peak_i]
-            if len(left_interval) > 0:  # Vérification explicite de la taille de l'intervalle
-                q_index = left_start + list(left_interval).index(
-                    min(left_interval))
-                qs_indices["Q_Peaks"].append(q_index)
-
-            # Intervalle droit pour détecter S
-            right_interval = signal[r_peak_i:right_end]
-            if len(right_interval) > 0:  # Vérification explicite de la taille de l'intervalle
-                s_index = r_peak_i + list(right_interval).index(
-                    min(right_interval))
-                qs_indices["S_Peaks"].append(s_index)
-
-        return qs_indices
+        # Fenêtres gauches [R - w, R) et droites [R, R + w) de tous les
+        # battements ; le remplissage +inf hors du signal n'est jamais minimal
+        left = Detection._beat_windows(signal, r_peaks - window_size,
+                                       window_size, np.inf)
+        right = Detection._beat_windows(signal, r_peaks, window_size, np.inf)
+
+        # Un intervalle vide (R en bord de signal) ne produit pas de point
+        left_valid = np.isfinite(left).any(axis=1)
+        right_valid = np.isfinite(right).any(axis=1)
+        q_indices = r_peaks - window_size + np.argmin(left, axis=1)
+        s_indices = r_peaks + np.argmin(right, axis=1)
+
+        if start is not None:
+            PROFILE.record("detect_q_and_s", start,
+                           samples=left.size + right.size, beats=len(r_peaks),
+                           no_match=np.count_nonzero(~left_valid)
+                           + np.count_nonzero(~right_valid))
+        return (np.where(left_valid, q_indices, MISSING),
+                np.where(right_valid, s_indices, MISSING))
 
     @staticmethod
-    def detect_p_wave(signal, r_peaks_indices, fs, search_window=0.3,
-                      deriv_window=0.08, threshold=0.25):
+    def detect_p_wave(signal, r_peaks_indices, fs, search_window=None,
+                      deriv_window=None, threshold=None):
         """
         Détecte les débuts des ondes P dans un signal ECG.
 
@@ -93,42 +292,58 @@ class Detection:
             signal (list or array): Signal ECG brut.
             r_peaks_indices (list): Indices des pics R détectés.
             fs (int): Fréquence d'échantillonnage.
-            search_window (float): Durée (en secondes) avant le pic R pour rechercher l'onde P (par défaut : 0.3 s).
-            deriv_window (float): Durée (en secondes) de la fenêtre pour calculer la dérivée (par défaut : 0.08 s).
-            threshold (float): Seuil pour détecter l'inflexion (par défaut : 25000).
+            search_window (float): Durée (en secondes) avant le pic R pour rechercher l'onde P (par défaut : P_SEARCH_WINDOW).
+            deriv_window (float): Durée (en secondes) de la fenêtre pour calculer la dérivée (par défaut : P_DERIV_WINDOW).
+            threshold (float): Seuil pour détecter l'inflexion (par défaut : P_THRESHOLD).
 
         Returns:
             list: Indices des débuts des ondes P détectées.
         """
-        p_wave_begin = []
-        time_derivative_vec = []
+        p_indices = Detection.p_wave_per_beat(
+            signal, r_peaks_indices, fs, search_window, deriv_window,
+            threshold)
+        return p_indices[p_indices != MISSING].tolist()
+
+    @staticmethod
+    def p_wave_per_beat(signal, r_peaks_indices, fs, search_window=None,
+                        deriv_window=None, threshold=None):
+        """Début de l'onde P de chaque battement (aligné sur
+        r_peaks_indices), MISSING si absent. Voir detect_p_wave."""
+        start = PROFILE.start()
+        if search_window is None:
+            search_window = Detection.P_SEARCH_WINDOW
+        if deriv_window is None:
+            deriv_window = Detection.P_DERIV_WINDOW
+        if threshold is None:
+            threshold = Detection.P_THRESHOLD
+        r_peaks = np.asarray(r_peaks_indices, dtype=np.intp)
 
         # Convertir les fenêtres de temps en échantillons
         nn = int(search_window * fs)
         interval_der = int(deriv_window * fs)
+        window_size = max(0, nn - int(0.2 * fs))
 
-        for r_peak_i in r_peaks_indices:
-            # Limiter la recherche aux indices valides
-            start_index = max(0, r_peak_i - nn)
-            end_index = max(0, start_index + nn - int(0.2 * fs))
+        # Fenêtres de recherche [R - nn, R - 0.2 s) limitées au début du signal
+        start_indices = np.maximum(0, r_peaks - nn)
+        derivatives = Detection._beat_windows(
+            Detection._discrete_derivative(signal, interval_der),
+            start_indices, window_size, np.nan)
 
-            for i in range(start_index, end_index):
-                # Calcul de la dérivée discrète
-                if i + interval_der < len(signal):
-                    aux = (signal[i + interval_der] - signal[i]) / interval_der
-                    time_derivative_vec.append(aux)
+        # Premier échantillon de chaque fenêtre dépassant le seuil
+        above_threshold = derivatives > threshold
+        found = above_threshold.any(axis=1)
+        first = np.argmax(above_threshold, axis=1)
 
-                    # Détection du seuil
-                    if aux > threshold:
-                        p_wave_begin.append(i)
-                        break
-
-        return p_wave_begin
+        if start is not None:
+            PROFILE.record("detect_p_wave", start, samples=derivatives.size,
+                           beats=len(r_peaks),
+                           no_match=np.count_nonzero(~found))
+        return np.where(found, start_indices + first, MISSING)
 
 
     @staticmethod
-    def detect_t_wave_end(signal, r_peaks_indices, fs, search_window=0.3,
-                          deriv_window=0.04):
+    def detect_t_wave_end(signal, r_peaks_indices, fs, search_window=None,
+                          deriv_window=None):
         """
         Détecte les fins des ondes T dans un signal ECG.
 
@@ -136,58 +351,164 @@ class Detection:
             signal (list or array): Signal ECG brut.
             r_peaks_indices (list): Indices des pics R détectés.
             fs (int): Fréquence d'échantillonnage.
-            search_window (float): Durée (en secondes) après le pic R pour rechercher la fin de l'onde T (par défaut : 0.3 s).
-            deriv_window (float): Durée (en secondes) de la fenêtre pour calculer la dérivée (par défaut : 0.04 s).
+            search_window (float): Durée (en secondes) après le pic R pour rechercher la fin de l'onde T (par défaut : T_SEARCH_WINDOW).
+            deriv_window (float): Durée (en secondes) de la fenêtre pour calculer la dérivée (par défaut : T_DERIV_WINDOW).
 
         Returns:
             list: Indices des fins des ondes T détectées.
         """
-        t_wave_end = []
-        time_derivative_vec = [0]  # Inclure un zéro initial pour comparaison
+        t_indices = Detection.t_wave_end_per_beat(
+            signal, r_peaks_indices, fs, search_window, deriv_window)
+        return t_indices[t_indices != MISSING].tolist()
+
+    @staticmethod
+    def t_wave_end_per_beat(signal, r_peaks_indices, fs, search_window=None,
+                            deriv_window=None):
+        """Fin de l'onde T de chaque battement (alignée sur
+        r_peaks_indices), MISSING si absente. Voir detect_t_wave_end."""
+        start = PROFILE.start()
+        if search_window is None:
+            search_window = Detection.T_SEARCH_WINDOW
+        if deriv_window is None:
+            deriv_window = Detection.T_DERIV_WINDOW
+        r_peaks = np.asarray(r_peaks_indices, dtype=np.intp)
 
         # Convertir les fenêtres de temps en échantillons
         nn = int(search_window * fs)
         interval_der = int(deriv_window * fs)
 
-        for r_peak_i in r_peaks_indices:
-            # Limiter la recherche aux indices valides
-            start_index = min(len(signal) - 1, r_peak_i + nn)
-            end_index = min(len(signal), start_index + nn)
+        # Fenêtres de recherche [R + nn, R + 2 nn) limitées à la fin du signal
+        start_indices = np.minimum(len(signal) - 1, r_peaks + nn)
+        derivatives = Detection._beat_windows(
+            Detection._discrete_derivative(signal, interval_der),
+            start_indices, nn, np.nan)
+
+        # Point d'inflexion : la dérivée passe de négative à positive. Le
+        # premier échantillon de chaque fenêtre est comparé à zéro, il ne peut
+        # donc pas être retenu.
+        sign_change = np.zeros(derivatives.shape, dtype=bool)
+        sign_change[:, 1:] = (derivatives[:, 1:] > 0) & (
+                derivatives[:, :-1] < 0)
+        found = sign_change.any(axis=1)
+        first = np.argmax(sign_change, axis=1)
+
+        if start is not None:
+            PROFILE.record("detect_t_wave_end", start,
+                           samples=derivatives.size, beats=len(r_peaks),
+                           no_match=np.count_nonzero(~found))
+        return np.where(found, start_indices + first, MISSING)
 
-            for i in range(start_index, end_index):
-                # Calcul de la dérivée discrète
-                if i + interval_der < len(signal):
-                    aux = (signal[i + interval_der] - signal[i]) / interval_der
-                    time_derivative_vec.append(aux)
+    @staticmethod
+    def _discrete_derivative(signal, interval_der):
+        """
+        Dérivée discrète (signal[i + d] - signal[i]) / d pour tous les
+        indices i tels que i + d < len(signal).
+        """
+        signal = np.asarray(signal)
+        if interval_der <= 0 or len(signal) <= interval_der:
+            return np.empty(0)
+        return (signal[interval_der:] - signal[:-interval_der]) / interval_der
 
-                    # Détection du point d'inflexion
-                    if time_derivative_vec[-1] > 0 > time_derivative_vec[-2]:
-                        t_wave_end.append(i)
-                        break
+    @staticmethod
+    def _beat_windows(values, start_indices, window_size, fill_value):
+        """
+        Construit la matrice battements × fenêtre des valeurs
+        values[start:start + window_size] pour chaque indice de départ.
 
-        return t_wave_end
+        Les indices hors de values (négatifs ou au-delà de la fin) sont
+        remplacés par fill_value. La matrice est extraite en une seule fois
+        d'une vue strided (sliding_window_view) du signal complété.
+        """
+        start_indices = np.asarray(start_indices, dtype=np.intp)
+        if window_size <= 0 or len(start_indices) == 0:
+            return np.full((len(start_indices), max(0, window_size)),
+                           fill_value)
+
+        values = np.asarray(values)
+        padded = np.full(len(values) + 2 * window_size, fill_value,
+                         dtype=np.result_type(values.dtype, type(fill_value)))
+        padded[window_size:window_size + len(values)] = values
+        windows = sliding_window_view(padded, window_size)
+        return windows[np.clip(start_indices + window_size, 0,
+                               len(windows) - 1)]
 
     @staticmethod
-    def process_ecg_signal(signal, fs):
-
-        _, rpeaks = nk.ecg_peaks(signal, sampling_rate=fs)
-        r_peaks = rpeaks["ECG_R_Peaks"]
+    def process_ecg_signal(signal, fs, r_peaks=None) -> Fiducials:
+        """
+        Détecte les pics R puis les points Q, S, début de P et fin de T d'un
+        signal, alignés par battement (voir fiducials.Fiducials). Le résultat
+        est mémoïsé par contenu et par paramètres (voir params et
+        memo.MEMO).
+
+        Avec `r_peaks` (pics R détectés sur un autre signal du même
+        enregistrement), les pics R ne sont pas détectés mais replacés dans
+        ce signal (voir refine_r_peaks).
+        """
+        start = PROFILE.start()
+        params = {"fs": fs, "detection": Detection.params()}
+        if r_peaks is not None:
+            params["r_peaks"] = np.asarray(r_peaks).tolist()
+        fiducials = MEMO.get_or_compute(
+            "process_ecg_signal", signal, params,
+            lambda: Detection._process_ecg_signal(signal, fs, r_peaks))
+        if start is not None:
+            PROFILE.record("process_ecg_signal", start, samples=len(signal),
+                           beats=len(fiducials))
+        # Copie : le résultat mémoïsé ne doit pas être modifié par l'appelant
+        return fiducials.copy()
 
-        qs_peaks = Detection.detect_q_and_s(signal, r_peaks, fs)
-        p_wave_starts = Detection.detect_p_wave(signal, r_peaks, fs)
-        t_wave_ends = Detection.detect_t_wave_end(signal, r_peaks, fs)
+    @staticmethod
+    def _process_ecg_signal(signal, fs, r_peaks=None):
+        if r_peaks is None:
+            r_peaks = Detection.detect_r_peaks(signal, fs)
+        else:
+            r_peaks = Detection.refine_r_peaks(signal, r_peaks, fs)
 
-        return {
-            "R_Peaks": r_peaks,
-            "Q_Peaks": qs_peaks["Q_Peaks"],
-            "S_Peaks": qs_peaks["S_Peaks"],
-            "P_Peaks": p_wave_starts,
-            "T_Wave_Ends": t_wave_ends,
-        }
+        q_peaks, s_peaks = Detection.q_and_s_per_beat(signal, r_peaks, fs)
+        return Fiducials.from_columns(
+            Detection.p_wave_per_beat(signal, r_peaks, fs), q_peaks, r_peaks,
+            s_peaks, Detection.t_wave_end_per_beat(signal, r_peaks, fs))
 
     @staticmethod
-    def detect(ecg):
-        """Détection des ondes PQRST pour un ensemble de signaux ECG."""
-        for line in ecg.treated_lines:
-            line.metadata = Detection.process_ecg_signal(line.points,
-                                                         line.sampling_rate)
+    def detect(ecg, lead_context=None, executor=None):
+        """
+        Détection des ondes PQRST pour un ensemble de signaux ECG.
+
+        Si l'ECG a une ligne fusionnée ("Merged"), les pics R ne sont
+        détectés qu'une fois, sur celle-ci, puis replacés dans chaque
+        dérivation (voir refine_r_peaks) : toutes les lignes ont les mêmes
+        battements. Sinon, chaque ligne est détectée indépendamment.
+
+        `lead_context`, s'il est fourni, est appelé avec l'étiquette de chaque
+        ligne et retourne un gestionnaire de contexte entourant sa détection.
+
+        Avec `executor` (ThreadPoolExecutor ou ProcessPoolExecutor), les
+        lignes sont traitées en parallèle sur ce pool, avec un résultat
+        identique au traitement séquentiel ; `lead_context` est alors ignoré.
+        """
+        lead_context = lead_context or nullcontext
+        lines = list(ecg.treated_lines)
+        merged = next((line for line in lines if line.label == "Merged"),
+                      None)
+        r_peaks = None
+        if merged is not None:
+            with (lead_context if executor is None else nullcontext)(
+                    merged.label):
+                merged.fiducials = Detection.process_ecg_signal(
+                    merged.points, merged.sampling_rate)
+            r_peaks = merged.fiducials["R"]
+            lines = [line for line in lines if line is not merged]
+
+        if executor is not None:
+            for line, fiducials in zip(lines, executor.map(
+                    Detection.process_ecg_signal,
+                    [line.points for line in lines],
+                    [line.sampling_rate for line in lines],
+                    [r_peaks] * len(lines))):
+                line.fiducials = fiducials
+            return
+
+        for line in lines:
+            with lead_context(line.label):
+                line.fiducials = Detection.process_ecg_signal(
+                    line.points, line.sampling_rate, r_peaks)
@@ -1,7 +1,23 @@
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
 from calculation import Calculation
+from ecg import ECG
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class Diagnostics:
+    # Seuil de QTc (ms) de l'adulte et de l'enfant ; un âge inconnu reçoit le
+    # seuil le plus bas, le plus prudent
+    QTC_ADULT = 460
+    QTC_CHILD = 440
+    ADULT_AGE = 18
+    # Critère de Sokolow-Lyon : 35 mm à 10 mm/mV
+    SOKOLOW_MV = 3.5
+
     @staticmethod
     def is_tachycardie(calc: Calculation) -> bool:
         """Détecte une tachycardie : fréquence cardiaque supérieure à 100 bpm."""
@@ -30,12 +46,12 @@ class Diagnostics:
     @staticmethod
     def is_st_elevation(calc: Calculation) -> bool:
         """Détecte une élévation du segment ST : déviation supérieure à 0,2 mV."""
-        return any(st > 200 for st in calc.st_segments())
+        return any(st > 0.2 for st in calc.st_segments())
 
     @staticmethod
     def is_st_depression(calc: Calculation) -> bool:
         """Détecte une dépression du segment ST : déviation inférieure à -0,1 mV."""
-        return any(st < -100 for st in calc.st_segments())
+        return any(st < -0.1 for st in calc.st_segments())
 
     @staticmethod
     def is_p_wave_absent(calc: Calculation) -> bool:
@@ -45,20 +61,27 @@ class Diagnostics:
     @staticmethod
     def is_qt_prolonged(calc: Calculation) -> bool:
         """
-        Détecte un QT prolongé : QTc > 460 ms (femmes) ou 440 ms (hommes).
-        Utilise la formule de Bazett : QTc = QT / sqrt(RR).
+        Détecte un QT prolongé : QTc > 460 ms (adultes) ou 440 ms (moins de
+        18 ans ou âge inconnu).
+        Utilise la formule de Bazett : QTc = QT / sqrt(RR), RR en secondes.
         """
         qt = calc.qt_intervals()
         rr = calc.rr_intervals()
-        qtcs = [qt[i] / (rr[i] ** 0.5) for i in range(len(qt))]
-        seuil = 460 if calc.age_of_patient() > 18 else 440
+        qtcs = [qt_i / ((rr_i / 1000) ** 0.5) for qt_i, rr_i in zip(qt, rr)]
+        age = calc.age_of_patient()
+        seuil = Diagnostics.QTC_ADULT \
+            if age is not None and age > Diagnostics.ADULT_AGE \
+            else Diagnostics.QTC_CHILD
         return any(qtc > seuil for qtc in qtcs)
 
     @staticmethod
     def is_hypertrophy_left_ventricular(calc: Calculation) -> bool:
-        """Détecte une hypertrophie ventriculaire gauche selon le critère de Sokolow-Lyon : S(V1) + R(V5/V6) > 35 mm."""
-        qrs_amplitudes = calc.qrs_amplitudes()
-        return sum(qrs_amplitudes) > 35
+        """Détecte une hypertrophie ventriculaire gauche selon le critère de Sokolow-Lyon : S(V1) + R(V5/V6) > 35 mm (3,5 mV),
+        appliqué à l'amplitude moyenne des complexes QRS de la ligne de référence."""
+        qrs_amplitudes = np.asarray(calc.qrs_amplitudes(), dtype=np.float64)
+        qrs_amplitudes = qrs_amplitudes[~np.isnan(qrs_amplitudes)]
+        return len(qrs_amplitudes) > 0 \
+            and qrs_amplitudes.mean() > Diagnostics.SOKOLOW_MV
 
     @staticmethod
     def is_fibrillation_atrial(calc: Calculation) -> bool:
@@ -84,3 +107,143 @@ class Diagnostics:
         return any(t < 0.1 for t in
                    calc.t_wave_amplitudes()) and Diagnostics.is_st_depression(
             calc)
+
+    @staticmethod
+    def evaluate_all(ecgs: Iterable['ECG'],
+                     index: Optional[Sequence] = None) -> 'pd.DataFrame':
+        """
+        Évalue toutes les règles sur un ensemble d'ECG déjà analysés.
+
+        Args:
+            ecgs (iterable): ECG sur lesquels Detection.detect a été exécuté.
+            index (sequence): Index du tableau retourné (par défaut, l'index
+                de chaque ECG dans `ecgs`).
+
+        Returns:
+            pd.DataFrame: Une ligne par ECG, une colonne booléenne par règle.
+        """
+        ecgs = list(ecgs)
+        return Diagnostics.evaluate_measurements(
+            [ecg.measurements() for ecg in ecgs],
+            [ecg.get_patient_age() for ecg in ecgs], index)
+
+    @staticmethod
+    def evaluate_measurements(measurements: Sequence[dict],
+                              ages: Sequence[Optional[int]],
+                              index: Optional[Sequence] = None
+                              ) -> 'pd.DataFrame':
+        """
+        Évalue toutes les règles en une passe à partir des mesures par
+        battement de N ECG (voir ECG.measurements).
+
+        Les tableaux de tous les ECG sont concaténés et chaque règle est
+        calculée comme un masque vectorisé sur l'ensemble des battements,
+        puis réduite par ECG. Les résultats sont identiques à ceux des
+        méthodes is_* appliquées ECG par ECG.
+        """
+        import pandas as pd
+
+        findings = Diagnostics.evaluate_arrays(measurements, ages)
+        return pd.DataFrame(findings, index=index if index is not None
+                            else range(len(measurements)))
+
+    @staticmethod
+    def evaluate_arrays(measurements: Sequence[dict],
+                        ages: Sequence[Optional[int]]
+                        ) -> Dict[str, np.ndarray]:
+        """
+        Règles de evaluate_measurements sans construire de DataFrame : un
+        tableau booléen de N valeurs par règle, pour les appels fréquents
+        sur peu d'ECG (voir monitor.Monitor).
+        """
+        n = len(measurements)
+
+        def concat(key):
+            values = [np.asarray(m[key], dtype=np.float64)
+                      for m in measurements]
+            ids = np.repeat(np.arange(n), [len(v) for v in values])
+            return (np.concatenate(values) if values else np.empty(0)), ids
+
+        def count(mask, ids):
+            return np.bincount(ids[mask], minlength=n)
+
+        def any_beat(key, predicate):
+            values, ids = concat(key)
+            with np.errstate(invalid="ignore"):
+                return count(predicate(values), ids) > 0
+
+        # Fréquence cardiaque moyenne (0 sans intervalle RR)
+        rr, rr_ids = concat("rr_intervals")
+        rr_count = np.bincount(rr_ids, minlength=n)
+        rr_sum = np.bincount(rr_ids, weights=rr, minlength=n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            heart_rate = np.where(rr_count > 0,
+                                  np.floor(60000 / (rr_sum / rr_count)), 0)
+
+        # QTc de Bazett par battement, RR en secondes
+        qt_values = [np.asarray(m["qt_intervals"], dtype=np.float64)
+                     for m in measurements]
+        rr_values = [np.asarray(m["rr_intervals"], dtype=np.float64)
+                     for m in measurements]
+        paired = [min(len(qt), len(rr)) for qt, rr in zip(qt_values, rr_values)]
+        qt_ids = np.repeat(np.arange(n), paired)
+        qtc = (np.concatenate([qt[:k] for qt, k in zip(qt_values, paired)]
+                              + [np.empty(0)])
+               / np.sqrt(np.concatenate([rr[:k] for rr, k in
+                                         zip(rr_values, paired)]
+                                        + [np.empty(0)]) / 1000))
+        # Âge inconnu (None ou NaN) : NaN > ADULT_AGE est faux, seuil
+        # QTC_CHILD comme dans is_qt_prolonged
+        age = np.array([np.nan if a is None else a for a in ages],
+                       dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            qtc_threshold = np.where(age > Diagnostics.ADULT_AGE,
+                                     Diagnostics.QTC_ADULT,
+                                     Diagnostics.QTC_CHILD)
+        with np.errstate(invalid="ignore"):
+            qt_prolonged = count(qtc > qtc_threshold[qt_ids], qt_ids) > 0
+
+        # Onde P absente sur tous les battements
+        p, p_ids = concat("p_wave_amplitudes")
+        p_absent = count(p == 0, p_ids) == np.bincount(p_ids, minlength=n)
+
+        # RR irréguliers : au moins deux valeurs distinctes
+        rr_first = np.zeros(n)
+        rr_first[rr_count > 0] = rr[np.cumsum(rr_count)[rr_count > 0]
+                                    - rr_count[rr_count > 0]]
+        rr_irregular = count(rr != rr_first[rr_ids], rr_ids) > 0
+
+        # Amplitude moyenne des QRS mesurés
+        qrs_amplitude, qrs_ids = concat("qrs_amplitudes")
+        measured = ~np.isnan(qrs_amplitude)
+        qrs_count = np.bincount(qrs_ids[measured], minlength=n)
+        qrs_amplitude_sum = np.bincount(qrs_ids[measured],
+                                        weights=qrs_amplitude[measured],
+                                        minlength=n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lvh = (qrs_count > 0) & (qrs_amplitude_sum / qrs_count
+                                     > Diagnostics.SOKOLOW_MV)
+
+        st_elevation = any_beat("st_segments", lambda st: st > 0.2)
+        st_depression = any_beat("st_segments", lambda st: st < -0.1)
+        qrs_prolonged = any_beat("qrs_durations", lambda qrs: qrs > 120)
+
+        findings = {
+            "tachycardie": heart_rate > 100,
+            "bradycardie": heart_rate < 60,
+            "pr_interval_prolonged": any_beat("pr_intervals",
+                                              lambda pr: pr > 200),
+            "pr_interval_short": any_beat("pr_intervals", lambda pr: pr < 120),
+            "qrs_duration_prolonged": qrs_prolonged,
+            "st_elevation": st_elevation,
+            "st_depression": st_depression,
+            "p_wave_absent": p_absent,
+            "qt_prolonged": qt_prolonged,
+            "hypertrophy_left_ventricular": lvh,
+            "fibrillation_atrial": p_absent & rr_irregular,
+            "infarctus_acute": st_elevation & qrs_prolonged,
+            "hyperkaliemia": any_beat("t_wave_amplitudes", lambda t: t > 0.5),
+            "hypokaliemia": any_beat("t_wave_amplitudes",
+                                     lambda t: t < 0.1) & st_depression,
+        }
+        return findings
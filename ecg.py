@@ -1,15 +1,17 @@
+import inspect
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 from typing import Union
 
 import numpy as np
 
+from fiducials import Fiducials
+from measurements import Measurements
 from plot import Plot
 
 
 class ECG:
-    lines: ['ECG.Line']
-    treated_lines: ['ECG.Line'] = None
+    treated_lines: Optional['ECG.Leads'] = None
 
     # pickle data
     @dataclass
@@ -28,28 +30,333 @@ class ECG:
     data: 'ECG.PatientData'
 
     class Line:
+        """
+        One ECG lead. A line attached to an ECG.Leads is a view of one row of
+        its matrix: reading `points` does not copy, and assigning `points`
+        writes into that row.
+        """
+        __slots__ = ("label", "sampling_rate", "fiducials", "_points",
+                     "_leads")
+
         label: str
-        points: np.ndarray
         sampling_rate: int
-        metadata: Optional[dict] = None
+        # Beat-aligned detection results (see Detection.detect)
+        fiducials: Optional[Fiducials]
 
         def __init__(self, label: str, points: np.ndarray, sampling_rate: int):
             self.label = str.strip(label)
-            self.points = points
+            self._points = points
             self.sampling_rate = sampling_rate
+            self.fiducials = None
+            self._leads = None
+
+        @property
+        def metadata(self) -> Optional[dict]:
+            """Detected points in the former dict-of-lists format."""
+            return None if self.fiducials is None \
+                else self.fiducials.to_metadata()
+
+        @metadata.setter
+        def metadata(self, metadata: Optional[dict]):
+            self.fiducials = None if metadata is None else \
+                Fiducials.from_metadata(metadata, self.sampling_rate)
+
+        @property
+        def points(self) -> np.ndarray:
+            return self._points
+
+        @points.setter
+        def points(self, points: np.ndarray):
+            if self._leads is None:
+                self._points = points
+            else:
+                self._points[...] = points
 
         def copy(self, new_label: Optional[str] = None) -> 'ECG.Line':
             return ECG.Line(new_label or self.label,
-                            self.points.copy(), self.sampling_rate)
+                            self._points.copy(), self.sampling_rate)
+
+    class Leads:
+        """
+        ECG leads stored as a single (n_leads, n_samples) matrix. Iterating
+        yields ECG.Line views of the rows, indexing accepts a row number or
+        a label.
+
+        With `spare_rows`, the given matrix has that many extra rows after
+        the labelled ones: `append` fills them without copying the matrix
+        (e.g. the "Merged" row reserved by LineTreatment.clean_ecg).
+        """
+        __slots__ = ("matrix", "sampling_rate", "_lines", "_buffer")
+
+        matrix: np.ndarray
+        sampling_rate: int
+
+        def __init__(self, labels: List[str], matrix: np.ndarray,
+                     sampling_rate: int, spare_rows: int = 0):
+            matrix = np.asarray(matrix)
+            if matrix.ndim != 2 or \
+                    matrix.shape[0] != len(labels) + spare_rows:
+                raise ValueError(
+                    "The matrix must have one row per label.")
+            self._buffer = matrix
+            self.matrix = matrix[:len(labels)] if spare_rows else matrix
+            self.sampling_rate = sampling_rate
+            self._lines = []
+            for label in labels:
+                line = ECG.Line(label, None, sampling_rate)
+                line._leads = self
+                self._lines.append(line)
+            self._bind_rows()
+
+        @staticmethod
+        def from_lines(lines: Iterable['ECG.Line']) -> 'ECG.Leads':
+            """Stack independent lines (keeping their fiducials) into a
+            matrix."""
+            if isinstance(lines, ECG.Leads):
+                return lines
+            lines = list(lines)
+            if not lines:
+                raise ValueError("At least one line is required.")
+            if any(line.sampling_rate != lines[0].sampling_rate
+                   for line in lines):
+                raise ValueError("All lines must have the same sampling rate.")
+            if any(line.points.shape[0] != lines[0].points.shape[0]
+                   for line in lines):
+                raise ValueError("All lines must have the same length.")
+
+            leads = ECG.Leads([line.label for line in lines],
+                              np.stack([line.points for line in lines]),
+                              lines[0].sampling_rate)
+            for line, view in zip(lines, leads):
+                view.fiducials = line.fiducials
+            return leads
+
+        @property
+        def labels(self) -> List[str]:
+            return [line.label for line in self._lines]
+
+        def index(self, label: str) -> int:
+            """Row of the lead with the given label."""
+            for i, line in enumerate(self._lines):
+                if line.label == label:
+                    return i
+            raise KeyError(label)
+
+        def append(self, line: 'ECG.Line') -> 'ECG.Line':
+            """
+            Add a lead as a new row of the matrix and return its view. The
+            row is written into a spare row if one is left, otherwise the
+            matrix is copied with one more row.
+            """
+            if line.sampling_rate != self.sampling_rate:
+                raise ValueError("All lines must have the same sampling rate.")
+            if line.points.shape[0] != self.matrix.shape[1]:
+                raise ValueError("All lines must have the same length.")
+
+            n_rows = len(self._lines)
+            if n_rows < self._buffer.shape[0]:
+                self._buffer[n_rows] = line.points
+                self.matrix = self._buffer[:n_rows + 1]
+            else:
+                self.matrix = self._buffer = np.vstack([self.matrix,
+                                                        line.points])
+            view = ECG.Line(line.label, None, self.sampling_rate)
+            view.fiducials = line.fiducials
+            view._leads = self
+            self._lines.append(view)
+            self._bind_rows()
+            return view
+
+        def _bind_rows(self):
+            for i, line in enumerate(self._lines):
+                line._points = self.matrix[i]
+
+        def __reduce__(self):
+            # Rebuild the row views of a single matrix after unpickling
+            return ECG.Leads._restore, (
+                self.labels, self.matrix, self.sampling_rate,
+                [line.fiducials for line in self._lines])
+
+        @staticmethod
+        def _restore(labels: List[str], matrix: np.ndarray, sampling_rate: int,
+                     fiducials: List[Optional[Fiducials]]) -> 'ECG.Leads':
+            leads = ECG.Leads(labels, matrix, sampling_rate)
+            for line, line_fiducials in zip(leads, fiducials):
+                line.fiducials = line_fiducials
+            return leads
+
+        def __iadd__(self, lines: Iterable['ECG.Line']) -> 'ECG.Leads':
+            for line in lines:
+                self.append(line)
+            return self
+
+        def __len__(self) -> int:
+            return len(self._lines)
+
+        def __iter__(self) -> Iterator['ECG.Line']:
+            return iter(self._lines)
+
+        def __getitem__(self, key: Union[int, str]) -> 'ECG.Line':
+            if isinstance(key, str):
+                key = self.index(key)
+            return self._lines[key]
+
+    def __init__(self, data: 'ECG.PatientData',
+                 lines: Union['ECG.Leads', List['ECG.Line'], None] = None,
+                 loader: Optional[Callable[..., 'ECG.Leads']] = None,
+                 rr_intervals: Optional[np.ndarray] = None):
+        """
+        Lines are either given up front or parsed by `loader` on first
+        access to `lines`. The loader may accept a `labels` keyword to read
+        only some leads (see `line`).
 
-    def __init__(self, data: 'ECG.PatientData', lines: List['ECG.Line']):
+        `rr_intervals` (ms), if given, replace the RR intervals measured on
+        the reference line (e.g. the record's rhythm for a beat template,
+        see templates.BeatTemplates.to_ecg).
+        """
+        if lines is None and loader is None:
+            raise ValueError("Either lines or a loader is required.")
         self.data = data
-        self.lines = lines
+        self._lines = None if lines is None else ECG.Leads.from_lines(lines)
+        self._loader = loader
+        self._loader_takes_labels = loader is not None and any(
+            parameter.name == "labels"
+            or parameter.kind is inspect.Parameter.VAR_KEYWORD
+            for parameter in inspect.signature(loader).parameters.values())
+        self.rr_intervals = None if rr_intervals is None \
+            else np.asarray(rr_intervals, dtype=np.float64)
+        self._measurements = None
 
-    def plot(self, line: Optional[str] = None, treated: bool = False):
-        """Plot one or more ECG lines with patient information."""
-        # Prepare patient information
-        patient_info = (
+    @property
+    def lines(self) -> 'ECG.Leads':
+        if self._lines is None:
+            if self._loader is None:
+                raise ValueError(
+                    "The raw lines were released and there is no loader.")
+            self._lines = ECG.Leads.from_lines(self._loader())
+        return self._lines
+
+    @lines.setter
+    def lines(self, lines: Union['ECG.Leads', List['ECG.Line']]):
+        self._lines = ECG.Leads.from_lines(lines)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._lines is not None
+
+    def release_lines(self) -> None:
+        """
+        Drop the raw lines once they are no longer needed. They are parsed
+        again by the loader on next access to `lines`.
+        """
+        self._lines = None
+
+    def memory_report(self) -> Dict[str, int]:
+        """
+        Bytes held by this ECG: raw lines in memory, raw lines mapped from
+        the binary cache (paged in by the OS, not counted in the total),
+        treated lines, fiducial tables and cached measurements.
+        """
+        raw = 0 if self._lines is None else self._lines.matrix.nbytes
+        mapped = 0
+        if self._lines is not None and isinstance(self._lines.matrix,
+                                                  np.memmap):
+            raw, mapped = 0, self._lines.matrix.nbytes
+        treated = 0 if self.treated_lines is None \
+            else self.treated_lines.matrix.nbytes
+        fiducials = sum(line.fiducials.table.nbytes
+                        for line in self.treated_lines or []
+                        if line.fiducials is not None)
+        measurements = 0 if self._measurements is None else sum(
+            value.nbytes for value in self._measurements[1].values()
+            if isinstance(value, np.ndarray))
+        return {"raw": raw, "raw_mapped": mapped, "treated": treated,
+                "fiducials": fiducials, "measurements": measurements,
+                "total": raw + treated + fiducials + measurements}
+
+    def line(self, label: str) -> 'ECG.Line':
+        """
+        One raw lead. If the lines are not loaded yet and the loader accepts
+        `labels`, only this lead is parsed, and the lines stay unloaded;
+        otherwise all lines are loaded.
+        """
+        if self._lines is None and self._loader_takes_labels:
+            leads = self._loader(labels=[label])
+            if len(leads) == 0:
+                raise KeyError(label)
+            return leads[0]
+        return self.lines[label]
+
+    def _reference_line(self) -> 'ECG.Line':
+        """Merged line if available, else the first line with detections."""
+        candidates = [line for line in self.treated_lines or []
+                      if line.fiducials is not None]
+        if not candidates:
+            raise ValueError("Detection must be run before measurements.")
+        for line in candidates:
+            if line.label == "Merged":
+                return line
+        return candidates[0]
+
+    def _treated_line(self, label: str) -> Optional['ECG.Line']:
+        for line in self.treated_lines or []:
+            if line.label in (label, label + " (treated)"):
+                return line
+        return None
+
+    def measurements(self) -> Dict[str, np.ndarray]:
+        """
+        Per-beat intervals and amplitudes of the reference line. They are
+        computed once and reused until the detection results change. The RR
+        intervals are `rr_intervals` when given.
+        """
+        line = self._reference_line()
+        if self._measurements is None or self._measurements[0] is not \
+                line.fiducials:
+            axis_lines = (self._treated_line("I"), self._treated_line("aVF"))
+            measurements = Measurements.compute(line, axis_lines)
+            if self.rr_intervals is not None:
+                measurements["rr_intervals"] = self.rr_intervals
+            self._measurements = (line.fiducials, measurements)
+        return self._measurements[1]
+
+    def get_rr_intervals(self) -> np.ndarray:
+        return self.measurements()["rr_intervals"]
+
+    def get_pr_intervals(self) -> np.ndarray:
+        return self.measurements()["pr_intervals"]
+
+    def get_pr_segments(self) -> np.ndarray:
+        return self.measurements()["pr_segments"]
+
+    def get_qrs_durations(self) -> np.ndarray:
+        return self.measurements()["qrs_durations"]
+
+    def get_qt_intervals(self) -> np.ndarray:
+        return self.measurements()["qt_intervals"]
+
+    def get_st_segments(self) -> np.ndarray:
+        return self.measurements()["st_segments"]
+
+    def get_p_wave_amplitudes(self) -> np.ndarray:
+        return self.measurements()["p_wave_amplitudes"]
+
+    def get_qrs_amplitudes(self) -> np.ndarray:
+        return self.measurements()["qrs_amplitudes"]
+
+    def get_t_wave_amplitudes(self) -> np.ndarray:
+        return self.measurements()["t_wave_amplitudes"]
+
+    def get_qrs_axis(self) -> float:
+        return self.measurements()["qrs_axis"]
+
+    def get_patient_age(self) -> Optional[int]:
+        age = self.data.age
+        return None if age is None or age != age else int(age)
+
+    def patient_info(self) -> str:
+        """Patient information as displayed next to the plots."""
+        return (
             f"Patient ID: {self.data.patient_id}\n"
             f"Age: {self.data.age}\n"
             f"Date of Birth: {self.data.date_of_birth}\n"
@@ -62,14 +369,19 @@ class ECG:
             f"Original Diagnosis: {self.data.original_diagnosis}"
         )
 
+    def plot(self, line: Optional[str] = None, treated: bool = False):
+        """Plot one or more ECG lines with patient information."""
         # Show patient info and plot lines
-        Plot.show_text(patient_info)
+        Plot.show_text(self.patient_info())
         if treated:
             # display line and treated line
             Plot.plot_lines(
                 [*self.lines, *self.treated_lines],
                 title="ECG Lines",
                 selected_label=line)
+        elif line is not None:
+            Plot.plot_lines([self.line(line)], title=f"ECG Line: {line}",
+                            selected_label=line)
         else:
             Plot.plot_lines(self.lines, title=f"ECG Line: {line}",
                             selected_label=line)
@@ -0,0 +1,369 @@
+import argparse
+import json
+import os
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+from functools import partial
+from typing import (TYPE_CHECKING, Callable, Iterable, Iterator, List,
+                    Optional, Tuple)
+
+import numpy as np
+
+import memo
+from cohort_index import CohortIndex
+from detection import Detection
+from ecg import ECG
+from fiducials import Fiducials, FiducialStore
+from line_treatments import LineTreatment
+from manifest import Manifest
+from parser import CACHE_FORMAT, SAMPLING_RATE, parse_lines
+from profiling import PROFILE, Profiler
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# À incrémenter lorsque process_record change de résultat, afin que les
+# enregistrements déjà traités soient recalculés (voir manifest.Manifest)
+PIPELINE_VERSION = 3
+
+
+def pipeline_params(method: str = "neurokit", dtype: str = "float64") -> dict:
+    """Version et paramètres dont dépend le résultat de process_record."""
+    return {"pipeline_version": PIPELINE_VERSION,
+            "cache_version": memo.CACHE_VERSION,
+            "cache_format": CACHE_FORMAT,
+            "method": method,
+            # Type des signaux de la lecture (et du cache binaire) à la
+            # détection : les résultats float32 et float64 ne se mélangent pas
+            "dtype": dtype,
+            "baseline_window_ms": LineTreatment.BASELINE_WINDOW_SIZE_MS,
+            # Seuils et fenêtres de la détection, aussi dans la clé du cache
+            # des détections (voir Detection.process_ecg_signal)
+            "detection": Detection.params()}
+
+
+def process_record(item: Tuple[int, 'pd.Series'],
+                   cache_dir: Optional[str] = None,
+                   method: str = "neurokit", dtype: str = "float64",
+                   in_place: bool = False, profile: bool = False) -> dict:
+    """
+    Traite un enregistrement de df_meta (parsing, nettoyage, fusion,
+    détection, résumé des mesures) et retourne un résultat sérialisable en
+    JSON.
+
+    Toute exception est capturée : un enregistrement invalide produit un
+    résultat en erreur sans interrompre le reste du lot. `cache_dir` active
+    le cache binaire des CSV (voir parser.parse_lines), `method` est la
+    méthode de nettoyage de nk.ecg_clean.
+
+    `dtype` ("float32" ou "float64") est le type des signaux de la lecture à
+    la détection ; avec `in_place`, les lignes brutes sont remplacées par
+    les lignes nettoyées (voir LineTreatment.clean_ecg). Le résultat indique
+    la mémoire détenue par l'enregistrement (voir ECG.memory_report).
+
+    Avec `profile`, le résultat contient aussi les mesures des fonctions
+    instrumentées pendant son traitement (voir profiling.Profiler).
+    """
+    index, row = item
+    # Les index numpy (np.int64...) ne sont pas sérialisables en JSON
+    index = index.item() if isinstance(index, np.generic) else index
+    result = {"index": index, "ecg_file_path": row.ecg_file_path}
+    collected = None
+    try:
+        with PROFILE.collect() if profile else nullcontext() as collected:
+            ecg = ECG(row, parse_lines(row.ecg_file_path, cache_dir,
+                                       np.dtype(dtype)))
+            LineTreatment.treat_ecg(ecg, method, in_place=in_place)
+            LineTreatment.merge_ecg(ecg)
+            Detection.detect(ecg)
+            summary = CohortIndex.summarize(ecg.measurements(),
+                                            ecg.get_patient_age())
+    except Exception as error:
+        result["status"] = "error"
+        result["error"] = f"{type(error).__name__}: {error}"
+        result["traceback"] = traceback.format_exc()
+        if collected is not None:
+            result["profile"] = collected.to_dict()
+        return result
+
+    result["status"] = "ok"
+    # Colonnes P, Q, R, S, T alignées par battement (MISSING si absent)
+    result["fiducials"] = {line.label: line.fiducials.to_dict()
+                           for line in ecg.treated_lines}
+    result["summary"] = summary
+    result["memory"] = ecg.memory_report()
+    if collected is not None:
+        result["profile"] = collected.to_dict()
+    return result
+
+
+def process_chunk(chunk: List[Tuple[int, 'pd.Series']], **options
+                  ) -> List[dict]:
+    """Traite un paquet d'enregistrements dans un processus du pool (voir
+    process_record pour `options`)."""
+    return [process_record(item, **options) for item in chunk]
+
+
+def crash_result(item: Tuple[int, 'pd.Series']) -> dict:
+    """Résultat en erreur d'un enregistrement dont le traitement a arrêté
+    brutalement son processus (erreur de segmentation, mémoire épuisée...),
+    ce que process_record ne peut pas capturer."""
+    index, row = item
+    index = index.item() if isinstance(index, np.generic) else index
+    return {"index": index, "ecg_file_path": row.ecg_file_path,
+            "status": "error",
+            "error": "BrokenProcessPool: le processus s'est arrêté pendant "
+                     "le traitement de l'enregistrement",
+            "traceback": ""}
+
+
+def _run_isolated(items: Iterable[Tuple[int, 'pd.Series']],
+                  executor: Callable[..., ProcessPoolExecutor],
+                  options: dict) -> Iterator[dict]:
+    """
+    Traite les enregistrements un par un dans un pool d'un seul processus,
+    recréé après chaque arrêt : l'arrêt n'est imputé qu'à l'enregistrement
+    qui l'a provoqué (voir crash_result).
+    """
+    pool = None
+    try:
+        for item in items:
+            if pool is None:
+                pool = executor(max_workers=1)
+            try:
+                result, = pool.submit(process_chunk, [item],
+                                      **options).result()
+            except BrokenProcessPool:
+                result = crash_result(item)
+                pool.shutdown()
+                pool = None
+            yield result
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def read_results(output_path: str) -> dict:
+    """
+    Résultats réussis d'un fichier de résultats par index d'enregistrement
+    (la dernière ligne d'un enregistrement fait foi).
+    """
+    results = {}
+    with open(output_path) as output:
+        for line in output:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if result.get("status") == "ok":
+                results[result["index"]] = result
+    return results
+
+
+def fiducial_store(output_path: str) -> FiducialStore:
+    """
+    Rassemble les points caractéristiques des enregistrements traités avec
+    succès dans un fichier de résultats en un seul FiducialStore (à
+    enregistrer en .npy ou .parquet), pour ne plus relancer la détection.
+    """
+    def lead_fiducials(columns: dict) -> Fiducials:
+        if "R" in columns:
+            return Fiducials.from_columns(*(columns[column] for column
+                                            in Fiducials.COLUMNS))
+        # Résultats écrits avant le format par battement
+        return Fiducials.from_metadata(columns, SAMPLING_RATE)
+
+    return FiducialStore.from_fiducials(
+        (index, label, lead_fiducials(columns))
+        for index, result in sorted(read_results(output_path).items())
+        for label, columns in result["fiducials"].items())
+
+
+def index_cohort(df_meta: 'pd.DataFrame', output_path: str,
+                 index_path: str) -> None:
+    """
+    Indexe df_meta avec le résumé des mesures des enregistrements traités
+    dans un fichier de résultats (voir cohort_index.CohortIndex).
+    """
+    summaries = {index: result["summary"] for index, result
+                 in read_results(output_path).items() if "summary" in result}
+    with CohortIndex(index_path) as index:
+        index.build(df_meta, summaries)
+
+
+def run_batch(df_meta: 'pd.DataFrame', output_path: str,
+              workers: Optional[int] = None, chunksize: int = 4,
+              resume: bool = True,
+              cache_dir: Optional[str] = None,
+              memo_dir: Optional[str] = None,
+              method: str = "neurokit",
+              manifest_path: Optional[str] = None,
+              dtype: str = "float64",
+              in_place: bool = False,
+              profile: bool = False) -> Iterator[dict]:
+    """
+    Traite toutes les lignes de df_meta sur un pool de processus.
+
+    Les enregistrements sont distribués par paquets de `chunksize` et les
+    résultats sont ajoutés au fichier de sortie (JSON lines) dès leur
+    réception, si bien qu'un arrêt brutal ne perd pas le travail terminé.
+
+    Un processus arrêté brutalement (erreur de segmentation, mémoire
+    épuisée...) fait échouer les paquets en cours, au plus un par
+    processus : leurs enregistrements sont repris un par un (voir
+    _run_isolated), celui qui a provoqué l'arrêt reçoit un résultat en
+    erreur et le reste du lot continue sur un nouveau pool.
+    `memo_dir` active le cache disque des résultats de nettoyage et de
+    détection (voir memo.Memo). `dtype`, `in_place` et `profile` : voir
+    process_record.
+
+    Chaque résultat est inscrit dans un manifeste (par défaut
+    `output_path + ".manifest"`) avec l'empreinte du CSV et des paramètres
+    et son statut. Avec `resume`, seuls les enregistrements nouveaux, en
+    erreur, dont le CSV a changé ou dont les paramètres (`method`,
+    PIPELINE_VERSION...) diffèrent sont traités ; leurs résultats sont
+    ajoutés au fichier existant, où la dernière ligne d'un enregistrement
+    fait foi.
+
+    Yields:
+        dict: Résultat de chaque enregistrement, dans l'ordre d'achèvement.
+    """
+    params_key = Manifest.params_key(pipeline_params(method, dtype))
+    with Manifest(manifest_path or output_path + ".manifest") as manifest:
+        # Empreintes calculées avant le traitement : un CSV modifié pendant
+        # le lot sera retraité au lot suivant
+        fingerprints = {}
+        items = []
+        for index, row in df_meta.iterrows():
+            fingerprint = Manifest.fingerprint(row.ecg_file_path)
+            if resume and manifest.is_current(row.ecg_file_path, fingerprint,
+                                              params_key):
+                continue
+            fingerprints[row.ecg_file_path] = fingerprint
+            items.append((index, row))
+
+        options = dict(cache_dir=cache_dir, method=method, dtype=dtype,
+                       in_place=in_place, profile=profile)
+        executor = partial(ProcessPoolExecutor, initializer=memo.configure,
+                           initargs=(None, memo_dir))
+        n_workers = workers or os.cpu_count()
+        pending = deque(items[start:start + chunksize]
+                        for start in range(0, len(items), chunksize))
+
+        with open(output_path, "a") as output:
+            def write(result: dict) -> dict:
+                offset = output.tell()
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+                manifest.record(result["ecg_file_path"], result["index"],
+                                fingerprints[result["ecg_file_path"]],
+                                params_key, output_path, offset,
+                                result["status"])
+                return result
+
+            while pending:
+                suspects = []
+                broken = False
+                with executor(max_workers=n_workers) as pool:
+                    # Un paquet en cours par processus : un arrêt ne fait
+                    # échouer que des paquets réellement en traitement
+                    running = {}
+                    while pending or running:
+                        while pending and not broken \
+                                and len(running) < n_workers:
+                            chunk = pending.popleft()
+                            try:
+                                future = pool.submit(process_chunk, chunk,
+                                                     **options)
+                            except BrokenProcessPool:
+                                pending.appendleft(chunk)
+                                broken = True
+                                break
+                            running[future] = chunk
+                        if not running:
+                            break
+                        done, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            chunk = running.pop(future)
+                            try:
+                                results = future.result()
+                            except BrokenProcessPool:
+                                suspects.extend(chunk)
+                                broken = True
+                                continue
+                            for result in results:
+                                yield write(result)
+                for result in _run_isolated(suspects, executor, options):
+                    yield write(result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Traitement par lot des ECG d'un fichier df_meta.")
+    parser.add_argument("df_meta", help="Chemin du fichier df_meta.pkl")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument("--chunksize", type=int, default=4,
+                        help="Nombre d'enregistrements envoyés par paquet")
+    parser.add_argument("--output", default="ecg_batch_results.jsonl",
+                        help="Fichier de résultats (JSON lines)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Répertoire du cache binaire des CSV")
+    parser.add_argument("--memo-dir", default=None,
+                        help="Répertoire du cache des nettoyages et détections")
+    parser.add_argument("--method", default="neurokit",
+                        help="Méthode de nettoyage de nk.ecg_clean")
+    parser.add_argument("--dtype", choices=["float32", "float64"],
+                        default="float64",
+                        help="Type des signaux (float32 : moitié moins de "
+                             "mémoire)")
+    parser.add_argument("--in-place", action="store_true",
+                        help="Nettoie les signaux à la place des lignes "
+                             "brutes, qui ne sont pas conservées")
+    parser.add_argument("--manifest", default=None,
+                        help="Manifeste des enregistrements à jour (défaut : "
+                             "fichier de résultats + .manifest)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Retraiter tous les enregistrements, même à "
+                             "jour")
+    parser.add_argument("--fiducials", default=None,
+                        help="Exporte ensuite les points caractéristiques de "
+                             "tous les enregistrements (.npy ou .parquet)")
+    parser.add_argument("--index", default=None,
+                        help="Indexe ensuite la cohorte (données patient, "
+                             "mesures et règles) dans ce fichier SQLite")
+    parser.add_argument("--profile", default=None,
+                        help="Mesure les fonctions de nettoyage et de "
+                             "détection et enregistre leur cumul sur le lot "
+                             "(.json, ou .prom pour Prometheus)")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    meta = pd.read_pickle(args.df_meta)
+    n_ok = n_error = 0
+    # Cumul des mesures renvoyées par les processus du pool
+    batch_profile = Profiler()
+    for record in run_batch(meta, args.output, workers=args.workers,
+                            chunksize=args.chunksize, resume=args.resume,
+                            cache_dir=args.cache_dir, memo_dir=args.memo_dir,
+                            method=args.method, manifest_path=args.manifest,
+                            dtype=args.dtype, in_place=args.in_place,
+                            profile=args.profile is not None):
+        batch_profile.merge(record.get("profile", {}))
+        if record["status"] == "ok":
+            n_ok += 1
+        else:
+            n_error += 1
+            print(f"[{record['index']}] {record['ecg_file_path']}: "
+                  f"{record['error']}")
+    print(f"{n_ok} enregistrements traités, {n_error} en erreur.")
+    if args.profile:
+        batch_profile.save(args.profile)
+    if args.fiducials:
+        fiducial_store(args.output).save(args.fiducials)
+    if args.index:
+        index_cohort(meta, args.output, args.index)
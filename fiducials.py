@@ -0,0 +1,239 @@
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from ecg import ECG
+
+# Indice utilisé pour un point caractéristique absent d'un battement
+MISSING = -1
+
+
+class Fiducials:
+    """
+    Points caractéristiques d'une dérivation, alignés par battement : une
+    matrice int32 battements × (P, Q, R, S, T), MISSING lorsque le point n'a
+    pas été détecté pour ce battement.
+    """
+    COLUMNS = ("P", "Q", "R", "S", "T")
+    # Clés de l'ancien format (dictionnaire de listes non alignées)
+    KEYS = {"P": "P_Peaks", "Q": "Q_Peaks", "R": "R_Peaks", "S": "S_Peaks",
+            "T": "T_Wave_Ends"}
+    # Fenêtres (s) autour du pic R dans lesquelles un point de l'ancien
+    # format est rattaché au battement, cohérentes avec celles de Detection
+    Q_S_WINDOW = 0.1
+    P_WINDOW = 0.3
+    T_WINDOW = 0.6
+
+    __slots__ = ("table",)
+
+    table: np.ndarray
+
+    def __init__(self, table: np.ndarray):
+        table = np.asarray(table, dtype=np.int32)
+        if table.ndim != 2 or table.shape[1] != len(Fiducials.COLUMNS):
+            raise ValueError(
+                "La table doit avoir une colonne par point caractéristique.")
+        self.table = table
+
+    @staticmethod
+    def from_columns(p, q, r, s, t) -> 'Fiducials':
+        """Table à partir des colonnes par battement (MISSING si absent)."""
+        return Fiducials(np.stack([np.asarray(column, dtype=np.int32)
+                                   for column in (p, q, r, s, t)], axis=1)
+                         .reshape(-1, len(Fiducials.COLUMNS)))
+
+    @staticmethod
+    def from_metadata(metadata: dict, fs: int) -> 'Fiducials':
+        """
+        Aligne sur les pics R des points donnés dans l'ancien format
+        ({"R_Peaks": [...], "Q_Peaks": [...], ...}) : chaque point est
+        rattaché au battement dont il est le plus proche dans sa fenêtre.
+        """
+        r_peaks = np.asarray(metadata["R_Peaks"], dtype=np.intp)
+        return Fiducials.from_columns(
+            Fiducials._align_before(metadata["P_Peaks"], r_peaks,
+                                    int(Fiducials.P_WINDOW * fs)),
+            Fiducials._align_before(metadata["Q_Peaks"], r_peaks,
+                                    int(Fiducials.Q_S_WINDOW * fs)),
+            r_peaks,
+            Fiducials._align_after(metadata["S_Peaks"], r_peaks,
+                                   int(Fiducials.Q_S_WINDOW * fs)),
+            Fiducials._align_after(metadata["T_Wave_Ends"], r_peaks,
+                                   int(Fiducials.T_WINDOW * fs)))
+
+    @staticmethod
+    def _align_before(events, anchors, window):
+        """Dernier évènement strictement avant chaque ancre, à moins de window."""
+        events = np.sort(np.asarray(events, dtype=np.intp))
+        if len(events) == 0:
+            return np.full(len(anchors), MISSING, dtype=np.intp)
+        position = np.searchsorted(events, anchors, side="left") - 1
+        candidates = events[np.maximum(position, 0)]
+        valid = (position >= 0) & (anchors - candidates <= window)
+        return np.where(valid, candidates, MISSING)
+
+    @staticmethod
+    def _align_after(events, anchors, window):
+        """Premier évènement à partir de chaque ancre, à moins de window."""
+        events = np.sort(np.asarray(events, dtype=np.intp))
+        if len(events) == 0:
+            return np.full(len(anchors), MISSING, dtype=np.intp)
+        position = np.searchsorted(events, anchors, side="left")
+        candidates = events[np.minimum(position, len(events) - 1)]
+        valid = (position < len(events)) & (candidates - anchors <= window)
+        return np.where(valid, candidates, MISSING)
+
+    def __len__(self) -> int:
+        return self.table.shape[0]
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        """Colonne (vue int32, un élément par battement) d'un point."""
+        return self.table[:, Fiducials.COLUMNS.index(column)]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Fiducials) and np.array_equal(self.table,
+                                                               other.table)
+
+    def copy(self) -> 'Fiducials':
+        return Fiducials(self.table.copy())
+
+    def shifted(self, offset: int) -> 'Fiducials':
+        """Copie dont les points détectés sont décalés de `offset`
+        échantillons, les points absents restant MISSING."""
+        return Fiducials(np.where(self.table != MISSING, self.table + offset,
+                                  MISSING))
+
+    def indices(self) -> np.ndarray:
+        """Indices de tous les points détectés, sans les absents."""
+        return self.table[self.table != MISSING].astype(np.intp)
+
+    def valid_indices(self, length: int) -> np.ndarray:
+        """Indices des points détectés compris dans un signal de `length`
+        échantillons (par exemple pour les afficher)."""
+        values = self.indices()
+        return values[(values >= 0) & (values < length)]
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        """Colonnes sérialisables en JSON ({"P": [...], ..., "T": [...]})."""
+        return {column: self.table[:, i].tolist()
+                for i, column in enumerate(Fiducials.COLUMNS)}
+
+    def to_metadata(self) -> dict:
+        """Points détectés dans l'ancien format (R_Peaks, Q_Peaks...)."""
+        return {Fiducials.KEYS[column]: values[values != MISSING].tolist()
+                for column, values in zip(Fiducials.COLUMNS, self.table.T)}
+
+
+class FiducialStore:
+    """
+    Points caractéristiques de toute une cohorte dans un seul tableau
+    structuré : une ligne par (enregistrement, dérivation, battement).
+
+    Enregistré en .npy (relu en mémoire mappée, sans copie) ou en .parquet
+    (pandas avec pyarrow), il permet de recalculer des mesures ou
+    d'interroger les battements sans relancer la détection.
+    """
+    # Taille minimale (octets) du champ "lead" : elle est portée à celle du
+    # libellé le plus long à l'écriture, pour ne jamais le tronquer
+    LEAD_BYTES = 16
+    DTYPE = np.dtype([("record", "<i8"), ("lead", f"S{LEAD_BYTES}"),
+                      ("beat", "<i4")]
+                     + [(column, "<i4") for column in Fiducials.COLUMNS])
+
+    def __init__(self, rows: np.ndarray):
+        self.rows = rows
+
+    @staticmethod
+    def dtype(lead_bytes: int) -> np.dtype:
+        """DTYPE dont le champ "lead" contient des libellés (encodés en
+        UTF-8) de lead_bytes octets, au moins LEAD_BYTES."""
+        size = max(FiducialStore.LEAD_BYTES, lead_bytes)
+        return np.dtype([(name, f"S{size}" if name == "lead" else
+                          FiducialStore.DTYPE.fields[name][0])
+                         for name in FiducialStore.DTYPE.names])
+
+    @staticmethod
+    def from_fiducials(items: Iterable[Tuple[int, str, 'Fiducials']]
+                       ) -> 'FiducialStore':
+        """Construit le tableau à partir de triplets (enregistrement,
+        dérivation, Fiducials)."""
+        items = [(record, lead.encode(), fiducials)
+                 for record, lead, fiducials in items]
+        dtype = FiducialStore.dtype(max([len(lead) for _, lead, _ in items],
+                                        default=0))
+        rows = np.empty(sum(len(fiducials) for _, _, fiducials in items),
+                        dtype=dtype)
+        start = 0
+        for record, lead, fiducials in items:
+            block = rows[start:start + len(fiducials)]
+            block["record"] = record
+            block["lead"] = lead
+            block["beat"] = np.arange(len(fiducials))
+            for i, column in enumerate(Fiducials.COLUMNS):
+                block[column] = fiducials.table[:, i]
+            start += len(fiducials)
+        return FiducialStore(rows)
+
+    @staticmethod
+    def from_ecgs(ecgs: Iterable[Tuple[int, 'ECG']]) -> 'FiducialStore':
+        """Tableau des lignes traitées détectées de couples (index, ECG)."""
+        return FiducialStore.from_fiducials(
+            (record, line.label, line.fiducials)
+            for record, ecg in ecgs for line in ecg.treated_lines or []
+            if line.fiducials is not None)
+
+    def save(self, path: str) -> None:
+        """Enregistre en .npy ou en .parquet selon l'extension de path."""
+        if path.endswith(".parquet"):
+            self.to_dataframe().to_parquet(path, index=False)
+        else:
+            np.save(path, self.rows)
+
+    @staticmethod
+    def load(path: str) -> 'FiducialStore':
+        """Relit un tableau enregistré par save (.npy en mémoire mappée)."""
+        if not path.endswith(".parquet"):
+            return FiducialStore(np.load(path, mmap_mode="r"))
+
+        import pandas as pd
+
+        df = pd.read_parquet(path)
+        leads = np.char.encode(df["lead"].to_numpy().astype(str))
+        rows = np.empty(len(df),
+                        dtype=FiducialStore.dtype(leads.dtype.itemsize))
+        for name in FiducialStore.DTYPE.names:
+            rows[name] = leads if name == "lead" else df[name].to_numpy()
+        return FiducialStore(rows)
+
+    def to_dataframe(self) -> 'pd.DataFrame':
+        import pandas as pd
+
+        df = pd.DataFrame({name: self.rows[name]
+                           for name in FiducialStore.DTYPE.names})
+        df["lead"] = df["lead"].str.decode("utf-8").astype("category")
+        return df
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def select(self, record: Optional[int] = None,
+               lead: Optional[str] = None) -> 'FiducialStore':
+        """Battements d'un enregistrement et/ou d'une dérivation."""
+        mask = np.ones(len(self.rows), dtype=bool)
+        if record is not None:
+            mask &= self.rows["record"] == record
+        if lead is not None:
+            mask &= self.rows["lead"] == lead.encode()
+        return FiducialStore(self.rows[mask])
+
+    def fiducials(self, record: int, lead: str) -> 'Fiducials':
+        """Table de la dérivation `lead` de l'enregistrement `record`,
+        battements dans l'ordre."""
+        rows = self.select(record, lead).rows
+        rows = rows[np.argsort(rows["beat"], kind="stable")]
+        return Fiducials(np.stack([rows[column]
+                                   for column in Fiducials.COLUMNS], axis=1)
+                         .reshape(-1, len(Fiducials.COLUMNS)))
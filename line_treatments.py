@@ -1,7 +1,13 @@
-import neurokit2 as nk
+from concurrent.futures import Executor
+from contextlib import nullcontext
+from itertools import repeat
+from typing import Callable, ContextManager, Optional
+
 import numpy as np
 
 from ecg import ECG
+from memo import MEMO
+from profiling import PROFILE
 
 
 class LineTreatment:
@@ -9,28 +15,203 @@ class LineTreatment:
     BASELINE_WINDOW_SIZE_MS = 200
 
     @staticmethod
-    def treat_ecg(ecg: 'ECG') -> None:
+    def treat_ecg(ecg: 'ECG', method: str = "neurokit",
+                  executor: Optional[Executor] = None,
+                  in_place: bool = False) -> None:
+        """
+        Traiter les lignes ECG : appliquer tous les traitements nécessaires
+        (nettoyage puis correction de la ligne de base). Voir clean_ecg pour
+        `in_place`.
+        """
+        LineTreatment.clean_ecg(ecg, method, executor=executor,
+                                in_place=in_place)
+        LineTreatment.correct_baseline(ecg)
+
+    @staticmethod
+    def clean_ecg(ecg: 'ECG', method: str = "neurokit",
+                  lead_context: Optional[Callable[[str], ContextManager]] = None,
+                  executor: Optional[Executor] = None,
+                  in_place: bool = False) -> None:
         """
-        Traiter les lignes ECG : appliquer tous les traitements nécessaires.
+        Nettoie chaque dérivation avec nk.ecg_clean.
+
+        Les signaux nettoyés sont écrits directement dans une nouvelle matrice
+        (n_dérivations, n_échantillons), sans copie intermédiaire des lignes,
+        avec une ligne de réserve pour la ligne fusionnée (voir merge_ecg),
+        du même type que la matrice brute (float64 si elle n'est pas
+        flottante) : des lignes lues en float32 (voir parser.parse_lines)
+        restent en float32 jusqu'à la détection. Les résultats sont mémoïsés
+        par contenu (voir memo.MEMO).
+
+        Args:
+            ecg (ECG): ECG dont les lignes brutes sont nettoyées.
+            method (str): Méthode de nettoyage de nk.ecg_clean.
+            lead_context (callable): Appelé avec l'étiquette de chaque
+                dérivation, retourne un gestionnaire de contexte entourant
+                son traitement (instrumentation). Ignoré avec `executor`.
+            executor (Executor): Si fourni, les dérivations sont nettoyées en
+                parallèle sur ce pool (ThreadPoolExecutor ou
+                ProcessPoolExecutor), avec un résultat identique au
+                traitement séquentiel.
+            in_place (bool): Les lignes brutes ne sont plus nécessaires : les
+                signaux nettoyés sont écrits dans leur matrice lorsqu'elle est
+                modifiable (pas dans le cache projeté en mémoire), puis elles
+                sont libérées (voir ECG.release_lines). Cette matrice n'a pas
+                de ligne de réserve : la fusion la recopie.
         """
-        ecg.treated_lines = [line.copy(line.label + " (treated)") for line in
-                             ecg.lines]
-        for line in ecg.treated_lines:
-            line.points = nk.ecg_clean(line.points,
-                                       sampling_rate=line.sampling_rate,
-                                       method="neurokit")
+        lead_context = lead_context or nullcontext
+        raw = ecg.lines
+        dtype = raw.matrix.dtype \
+            if np.issubdtype(raw.matrix.dtype, np.floating) else np.float64
+        n_leads, n_samples = raw.matrix.shape
+        if in_place and raw.matrix.dtype == dtype \
+                and raw.matrix.flags.writeable \
+                and not isinstance(raw.matrix, np.memmap):
+            buffer, spare_rows = raw.matrix, 0
+        else:
+            buffer, spare_rows = np.empty((n_leads + 1, n_samples),
+                                          dtype=dtype), 1
+        cleaned = buffer[:n_leads]
+        if executor is not None:
+            # map conserve l'ordre des dérivations
+            for i, points in enumerate(executor.map(
+                    LineTreatment.clean_lead, raw.matrix,
+                    repeat(raw.sampling_rate), repeat(method))):
+                cleaned[i] = points
+        else:
+            for i, (label, points) in enumerate(zip(raw.labels, raw.matrix)):
+                with lead_context(label):
+                    cleaned[i] = LineTreatment.clean_lead(
+                        points, raw.sampling_rate, method)
+
+        ecg.treated_lines = ECG.Leads(
+            [label + " (treated)" for label in raw.labels], buffer,
+            raw.sampling_rate, spare_rows)
+        if in_place:
+            ecg.release_lines()
+
+    @staticmethod
+    def clean_lead(points: np.ndarray, sampling_rate: int,
+                   method: str = "neurokit") -> np.ndarray:
+        """Nettoie une dérivation avec nk.ecg_clean (mémoïsé par contenu)."""
+        # Import différé : neurokit2 (scipy, sklearn...) est long à importer
+        import neurokit2 as nk
+
+        def compute():
+            # Seuls les nettoyages effectifs sont mesurés, pas les résultats
+            # relus du cache
+            start = PROFILE.start()
+            cleaned = nk.ecg_clean(points, sampling_rate=sampling_rate,
+                                   method=method)
+            if start is not None:
+                PROFILE.record("ecg_clean", start, samples=len(points))
+            return cleaned
+
+        # La version de neurokit2 fait partie de la clé : une mise à jour
+        # peut changer le nettoyage
+        return MEMO.get_or_compute(
+            "ecg_clean", points,
+            {"sampling_rate": sampling_rate, "method": method,
+             "neurokit2": nk.__version__}, compute)
+
+    @staticmethod
+    def correct_baseline(ecg: 'ECG',
+                         window_size_ms: float = BASELINE_WINDOW_SIZE_MS
+                         ) -> None:
+        """Retire la ligne de base de toutes les lignes traitées."""
+        start = PROFILE.start()
+        treated = ecg.treated_lines
+        # Dérivation par dérivation : les tableaux intermédiaires des min/max
+        # glissants ont la taille d'une ligne et non de toute la matrice, sans
+        # coût en temps
+        for row in treated.matrix:
+            row -= LineTreatment.estimate_baseline(
+                row, treated.sampling_rate, window_size_ms)
+        if start is not None:
+            PROFILE.record("correct_baseline", start,
+                           samples=treated.matrix.size)
+
+    @staticmethod
+    def estimate_baseline(signals: np.ndarray, sampling_rate: int,
+                          window_size_ms: float = BASELINE_WINDOW_SIZE_MS
+                          ) -> np.ndarray:
+        """
+        Estime la ligne de base (dérive lente) de chaque dérivation.
+
+        Deux lissages morphologiques successifs (moyenne de l'ouverture et de
+        la fermeture) sont appliqués : le premier, sur `window_size_ms`, efface
+        les complexes QRS et les ondes P, le second, sur trois fois cette
+        durée, efface les ondes T. Chaque min/max glissant est calculé par
+        l'algorithme de van Herk / Gil-Werman en O(n) quelle que soit la
+        taille de la fenêtre.
+
+        Args:
+            signals (array): Signal 1-D ou matrice (n_dérivations, n_échantillons).
+            sampling_rate (int): Fréquence d'échantillonnage.
+            window_size_ms (float): Taille de la première fenêtre (ms).
+
+        Returns:
+            array: Ligne de base, de même forme et de même type flottant que
+            `signals`.
+        """
+        signals = np.asarray(signals)
+        if not np.issubdtype(signals.dtype, np.floating):
+            signals = signals.astype(np.float64)
+        baseline = np.atleast_2d(signals)
+        for factor in (1, 3):
+            window = int(factor * window_size_ms * sampling_rate / 1000) | 1
+            opening = LineTreatment._running_extremum(
+                LineTreatment._running_extremum(baseline, window, np.minimum),
+                window, np.maximum)
+            closing = LineTreatment._running_extremum(
+                LineTreatment._running_extremum(baseline, window, np.maximum),
+                window, np.minimum)
+            baseline = (opening + closing) / 2
+        return baseline.reshape(signals.shape)
+
+    @staticmethod
+    def _running_extremum(signals: np.ndarray, window: int,
+                          ufunc: np.ufunc) -> np.ndarray:
+        """
+        Minimum (np.minimum) ou maximum (np.maximum) glissant centré sur une
+        fenêtre impaire, ligne par ligne d'une matrice.
+
+        Algorithme de van Herk / Gil-Werman : le signal (prolongé par ses
+        valeurs de bord) est découpé en blocs de la taille de la fenêtre, on
+        calcule les extremums cumulés de gauche à droite et de droite à
+        gauche dans chaque bloc, et l'extremum d'une fenêtre est celui de la
+        fin de bloc à sa gauche et du début de bloc à sa droite.
+        """
+        n_rows, n_samples = signals.shape
+        half = window // 2
+        n_blocks = -(-(n_samples + 2 * half) // window)
+        padded = np.empty((n_rows, n_blocks * window), dtype=signals.dtype)
+        padded[:, :half] = signals[:, :1]
+        padded[:, half:half + n_samples] = signals
+        padded[:, half + n_samples:] = signals[:, -1:]
+
+        blocks = padded.reshape(n_rows, n_blocks, window)
+        prefix = ufunc.accumulate(blocks, axis=2).reshape(n_rows, -1)
+        suffix = ufunc.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1]
+        suffix = suffix.reshape(n_rows, -1)
+
+        return ufunc(suffix[:, :n_samples],
+                     prefix[:, window - 1:window - 1 + n_samples])
 
     @staticmethod
     def merge_ecg(ecg: 'ECG'):
-        if any([line.sampling_rate != ecg.treated_lines[0].sampling_rate for
-                line in ecg.treated_lines]):
-            raise ValueError("All lines must have the same sampling rate.")
-        if any([line.points.shape[0] != ecg.treated_lines[0].points.shape[0] for
-                line in ecg.treated_lines]):
-            raise ValueError("All lines must have the same length.")
-
-        treated_points = [np.asarray(line.points) for line in ecg.treated_lines]
-        merged = np.mean(treated_points, axis=0)
-
-        ecg.treated_lines += [
-            ECG.Line("Merged", merged, ecg.treated_lines[0].sampling_rate)]
+        """
+        Ajoute aux lignes traitées la moyenne de toutes les dérivations
+        ("Merged"), écrite dans la ligne de réserve de leur matrice si elle
+        existe (voir clean_ecg), sans recopier la matrice.
+        """
+        # Les contrôles de fréquence d'échantillonnage et de longueur sont
+        # faits à la construction de la matrice
+        start = PROFILE.start()
+        treated = ECG.Leads.from_lines(ecg.treated_lines)
+        merged = treated.matrix.mean(axis=0)
+
+        treated.append(ECG.Line("Merged", merged, treated.sampling_rate))
+        ecg.treated_lines = treated
+        if start is not None:
+            PROFILE.record("merge_ecg", start, samples=treated.matrix.size)
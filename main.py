@@ -1,10 +1,9 @@
 import matplotlib
 import pandas as pd
 
-from detection import Detection
 from ecg import ECG
-from line_treatments import LineTreatment
 from parser import parse_lines
+from pipeline import Pipeline
 
 matplotlib.use("Qt5Agg")
 
@@ -20,8 +19,7 @@ if __name__ == "__main__":
     ecg = ECG(first_ecg,
               parse_lines(first_ecg.ecg_file_path))
 
-    LineTreatment.treat_ecg(ecg)
-    LineTreatment.merge_ecg(ecg)
-    Detection.detect(ecg)
+    report = Pipeline.default().run(ecg)
+    print(report.to_dataframe().to_string())
 
     ecg.plot(treated=True)
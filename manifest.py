@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+from parser import cache_key
+
+
+class Manifest:
+    """
+    Manifeste des enregistrements traités : pour chaque ecg_file_path,
+    l'empreinte du CSV (chemin, date de modification et taille), l'empreinte
+    des paramètres du traitement et l'emplacement du résultat (fichier et
+    position de la ligne JSON), et son statut : un enregistrement en erreur
+    y figure aussi, mais n'est jamais à jour.
+
+    Le fichier est en JSON lines et en ajout seul, écrit au fil des
+    résultats : la dernière entrée d'un chemin fait foi. Il est réécrit sans
+    les entrées périmées à la fermeture.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self._file = None
+        if os.path.exists(path):
+            with open(path) as manifest:
+                for line in manifest:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Dernière ligne tronquée par un arrêt brutal
+                        continue
+                    self.entries[entry["ecg_file_path"]] = entry
+
+    @staticmethod
+    def fingerprint(csv_path: str) -> Optional[str]:
+        """Empreinte du CSV, None s'il n'existe pas."""
+        try:
+            return cache_key(csv_path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def params_key(params: dict) -> str:
+        """Empreinte des paramètres (version comprise) du traitement."""
+        return hashlib.sha1(
+            json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def is_current(self, csv_path: str, fingerprint: Optional[str],
+                   params_key: str) -> bool:
+        """Vrai si le résultat enregistré correspond au CSV et aux
+        paramètres actuels et que son fichier existe encore."""
+        entry = self.entries.get(csv_path)
+        return (entry is not None and fingerprint is not None
+                and entry["fingerprint"] == fingerprint
+                and entry["params"] == params_key
+                and entry.get("status", "ok") == "ok"
+                and os.path.exists(entry["output"]))
+
+    def record(self, csv_path: str, index, fingerprint: str, params_key: str,
+               output: str, offset: int, status: str = "ok") -> None:
+        """Enregistre (et écrit aussitôt) le dernier résultat d'un CSV,
+        `status` étant celui du résultat ("ok" ou "error")."""
+        entry = {"ecg_file_path": csv_path, "index": index,
+                 "fingerprint": fingerprint, "params": params_key,
+                 "output": output, "offset": offset, "status": status}
+        self.entries[csv_path] = entry
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def read_result(self, csv_path: str) -> dict:
+        """Relit le résultat enregistré d'un CSV à sa position."""
+        entry = self.entries[csv_path]
+        with open(entry["output"], "rb") as output:
+            output.seek(entry["offset"])
+            return json.loads(output.readline())
+
+    def compact(self) -> None:
+        """Réécrit le manifeste avec une seule entrée par CSV."""
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as manifest:
+            for entry in self.entries.values():
+                manifest.write(json.dumps(entry) + "\n")
+        os.replace(temporary, self.path)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self.compact()
+
+    def __enter__(self) -> 'Manifest':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,143 @@
+from typing import Dict, Optional
+
+import numpy as np
+
+from detection import Detection
+from fiducials import MISSING, Fiducials
+
+
+class Measurements:
+    # Largeurs (s) des fenêtres de mesure autour du pic R, cohérentes avec
+    # les fenêtres de rattachement des points (voir Fiducials)
+    Q_S_WINDOW = Fiducials.Q_S_WINDOW
+    P_WINDOW = Fiducials.P_WINDOW
+    T_WINDOW = Fiducials.T_WINDOW
+    # Niveau isoélectrique mesuré 40 ms avant Q, segment ST 60 ms après S
+    BASELINE_OFFSET = 0.04
+    ST_OFFSET = 0.06
+    # Les signaux sont en µV, les amplitudes sont retournées en mV
+    MICROVOLTS_PER_MILLIVOLT = 1000
+
+    @staticmethod
+    def _values_at(signal, indices):
+        """Valeurs du signal aux indices donnés, NaN pour MISSING."""
+        indices = np.asarray(indices, dtype=np.intp)
+        valid = (indices >= 0) & (indices < len(signal))
+        return np.where(valid, signal[np.clip(indices, 0, len(signal) - 1)],
+                        np.nan)
+
+    @staticmethod
+    def _windows_between(signal, starts, ends, width):
+        """
+        Matrice battements × width des valeurs signal[start:end], complétée
+        par NaN au-delà de end ou lorsque start ou end est absent.
+        """
+        windows = Detection._beat_windows(np.asarray(signal, dtype=np.float64),
+                                          np.maximum(starts, 0), width, np.nan)
+        lengths = np.where((starts >= 0) & (ends >= 0), ends - starts, 0)
+        windows[np.arange(width)[None, :] >= lengths[:, None]] = np.nan
+        return windows
+
+    @staticmethod
+    def compute(line, axis_lines: Optional[tuple] = None
+                ) -> Dict[str, np.ndarray]:
+        """
+        Calcule en une passe tous les intervalles et amplitudes par battement
+        d'une ligne dont les points caractéristiques ont été détectés.
+
+        Args:
+            line (ECG.Line): Ligne de référence (en général "Merged").
+            axis_lines (tuple): Lignes (I, aVF) pour l'axe électrique du QRS.
+
+        Returns:
+            dict: Tableaux par battement (NaN lorsque la mesure est
+            impossible) : intervalles en millisecondes, amplitudes et
+            niveau du segment ST en millivolts (signal en µV), axe du QRS en
+            degrés.
+        """
+        fs = line.sampling_rate
+        signal = np.asarray(line.points, dtype=np.float64) \
+            / Measurements.MICROVOLTS_PER_MILLIVOLT
+        p, q, r, s, t = (line.fiducials[column].astype(np.intp)
+                         for column in Fiducials.COLUMNS)
+
+        def duration(start, end):
+            valid = (start >= 0) & (end >= 0)
+            return np.where(valid, (end - start) * 1000 / fs, np.nan)
+
+        baseline = Measurements._baseline(signal, q, fs)
+
+        # Sommet de l'onde P (la fin de l'onde P n'est pas détectée)
+        p_windows = np.nan_to_num(Measurements._windows_between(
+            signal, p, q, int(Measurements.P_WINDOW * fs)), nan=-np.inf)
+        has_p = np.isfinite(p_windows).any(axis=1)
+        p_apex = np.where(has_p, p + np.argmax(p_windows, axis=1), MISSING)
+
+        # Onde T : écart au niveau isoélectrique le plus grand entre S et fin T
+        t_windows = Measurements._windows_between(
+            signal, s, t, int((Measurements.T_WINDOW
+                               + Measurements.Q_S_WINDOW) * fs)
+        ) - baseline[:, None]
+        has_t = ~np.all(np.isnan(t_windows), axis=1)
+        t_apex = np.argmax(np.nan_to_num(np.abs(t_windows), nan=-1), axis=1)
+        t_amplitudes = np.where(
+            has_t, t_windows[np.arange(len(r)), t_apex], np.nan)
+
+        st_level = Measurements._values_at(
+            signal, np.where(s >= 0, s + int(Measurements.ST_OFFSET * fs),
+                             MISSING))
+
+        return {
+            "fiducials": line.fiducials,
+            "rr_intervals": np.diff(r) * 1000 / fs,
+            "pr_intervals": duration(p, q),
+            "pr_segments": duration(p_apex, q),
+            "qrs_durations": duration(q, s),
+            "qt_intervals": duration(q, t),
+            "st_segments": st_level - baseline,
+            # Onde P non détectée : amplitude nulle
+            "p_wave_amplitudes": np.where(
+                has_p, Measurements._values_at(signal, p_apex)
+                - Measurements._values_at(signal, p), 0.0),
+            "qrs_amplitudes": Measurements._values_at(signal, r) - np.fmin(
+                Measurements._values_at(signal, q),
+                Measurements._values_at(signal, s)),
+            "t_wave_amplitudes": t_amplitudes,
+            "qrs_axis": Measurements._qrs_axis(axis_lines, q, s, fs),
+        }
+
+    @staticmethod
+    def _baseline(signal, q, fs):
+        """Niveau isoélectrique (segment PR) de chaque battement."""
+        return Measurements._values_at(
+            signal, np.where(q >= 0, q - int(Measurements.BASELINE_OFFSET * fs),
+                             MISSING))
+
+    @staticmethod
+    def _qrs_axis(axis_lines, q, s, fs) -> float:
+        """
+        Axe électrique moyen du QRS en degrés, à partir des amplitudes
+        nettes (déflexion positive maximale + négative maximale) des
+        dérivations I et aVF sur les complexes QRS de référence.
+        """
+        if not axis_lines or any(line is None for line in axis_lines):
+            return np.nan
+
+        width = int(2 * Measurements.Q_S_WINDOW * fs) + 1
+        net_amplitudes = []
+        for line in axis_lines:
+            signal = np.asarray(line.points, dtype=np.float64)
+            windows = Measurements._windows_between(
+                signal, q, np.where(s >= 0, s + 1, MISSING), width)
+            baseline = Measurements._baseline(signal, q, fs)
+            with np.errstate(invalid="ignore"):
+                net = (np.max(np.nan_to_num(windows, nan=-np.inf), axis=1)
+                       + np.min(np.nan_to_num(windows, nan=np.inf), axis=1)
+                       - 2 * baseline)
+            net = net[np.isfinite(net)]
+            if len(net) == 0:
+                return np.nan
+            net_amplitudes.append(net.mean())
+
+        lead_i, lead_avf = net_amplitudes
+        return float(np.degrees(np.arctan2(lead_avf, lead_i)))
@@ -0,0 +1,231 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import IO, Any, Callable, Iterator, Optional
+
+import numpy as np
+
+# À incrémenter lorsqu'un algorithme mémoïsé change de résultat, afin
+# d'invalider les entrées du cache disque
+CACHE_VERSION = 3
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb") -> Iterator[IO]:
+    """
+    Fichier ouvert en écriture qui remplace `path` à la sortie du bloc : un
+    fichier partiel n'est jamais visible, et le fichier temporaire est
+    propre à l'écrivain (processus et thread), si bien que deux écrivains du
+    même fichier ne se mélangent pas.
+    """
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary, mode) as file:
+            yield file
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+class Memo:
+    """
+    Cache de résultats adressé par contenu : la clé est un condensat du
+    tableau d'entrée (octets, type et forme) et des paramètres de l'étape.
+
+    Deux niveaux : un LRU en mémoire d'au plus `max_bytes` octets (taille
+    des tableaux retournés), et si `cache_dir` est fourni un cache disque
+    dont les fichiers les moins récemment utilisés sont supprimés au-delà de
+    `max_disk_bytes`.
+
+    Le cache disque n'est pas parcouru à chaque écriture : chaque processus
+    tient le compte des octets qu'il a écrits depuis le dernier parcours, et
+    l'éviction n'a lieu que lorsque ce compte dépasse `max_disk_bytes`. Elle
+    ramène alors le cache à LOW_WATER fois cette taille, si bien que les
+    parcours restent rares.
+    """
+    # Fraction de max_disk_bytes conservée après une éviction
+    LOW_WATER = 0.8
+
+    def __init__(self, max_bytes: int = 256 << 20,
+                 cache_dir: Optional[str] = None,
+                 max_disk_bytes: int = 1 << 30, enabled: bool = True):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # Taille du cache disque connue de ce processus, None avant le
+        # premier parcours
+        self._disk_bytes = None
+        # Le cache peut être partagé par les threads d'un pool de dérivations
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(stage: str, array, params: dict) -> str:
+        array = np.ascontiguousarray(array)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{CACHE_VERSION}|{stage}|{array.dtype.str}|"
+                      f"{array.shape}|{sorted(params.items())!r}".encode())
+        digest.update(array.data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def size(value: Any) -> int:
+        """Taille approximative (octets) d'une valeur mise en cache."""
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        # Fiducials et autres objets enveloppant une table
+        table = getattr(value, "table", None)
+        if isinstance(table, np.ndarray):
+            return table.nbytes
+        return sys.getsizeof(value)
+
+    def get_or_compute(self, stage: str, array, params: dict,
+                       compute: Callable[[], Any]) -> Any:
+        """
+        Retourne le résultat mémoïsé pour (stage, array, params), ou calcule,
+        stocke et retourne `compute()`.
+        """
+        if not self.enabled:
+            return compute()
+
+        key = Memo.key(stage, array, params)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        # Calcul hors verrou : les autres threads ne sont pas bloqués
+        value = self._load(key)
+        if value is None:
+            value = compute()
+            self._store(key, value)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+
+        size = Memo.size(value)
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= Memo.size(self._memory[key])
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            self._memory_bytes += size
+            # La dernière entrée est conservée même si elle dépasse seule
+            # max_bytes
+            while self._memory_bytes > self.max_bytes \
+                    and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= Memo.size(evicted)
+        return value
+
+    def clear(self) -> None:
+        """Vide le cache mémoire (le cache disque est conservé)."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    @contextmanager
+    def disabled(self) -> Iterator['Memo']:
+        """Désactive le cache le temps du bloc (par exemple pour mesurer le
+        coût réel des étapes), puis rétablit son état."""
+        enabled, self.enabled = self.enabled, False
+        try:
+            yield self
+        finally:
+            self.enabled = enabled
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _load(self, key: str) -> Any:
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cached:
+                value = pickle.load(cached)
+            # Date d'accès mise à jour pour l'éviction LRU ; le fichier peut
+            # avoir été évincé entre-temps par un autre processus
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def _store(self, key: str, value: Any) -> None:
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        with atomic_write(path) as cached:
+            pickle.dump(value, cached, protocol=pickle.HIGHEST_PROTOCOL)
+            written = cached.tell()
+
+        with self._lock:
+            if self._disk_bytes is None:
+                evict = True
+            else:
+                self._disk_bytes += written
+                evict = self._disk_bytes > self.max_disk_bytes
+        if evict:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Parcourt le cache disque et, s'il dépasse sa taille maximale,
+        supprime les fichiers les moins récemment utilisés jusqu'à
+        LOW_WATER fois cette taille."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pkl"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_disk_bytes:
+            target = Memo.LOW_WATER * self.max_disk_bytes
+            for _, size, name in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+
+# Cache utilisé par LineTreatment et Detection
+MEMO = Memo()
+
+
+def configure(max_bytes: Optional[int] = None, cache_dir: Optional[str] = None,
+              max_disk_bytes: Optional[int] = None,
+              enabled: Optional[bool] = None) -> Memo:
+    """Modifie la configuration du cache partagé MEMO."""
+    if max_bytes is not None:
+        MEMO.max_bytes = max_bytes
+    if cache_dir is not None:
+        MEMO.cache_dir = cache_dir
+        # Taille du nouveau répertoire inconnue jusqu'au prochain parcours
+        MEMO._disk_bytes = None
+    if max_disk_bytes is not None:
+        MEMO.max_disk_bytes = max_disk_bytes
+    if enabled is not None:
+        MEMO.enabled = enabled
+    return MEMO
@@ -0,0 +1,416 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from detection import Detection
+from diagnostic import Diagnostics
+from ecg import ECG
+from fiducials import MISSING, Fiducials
+from measurements import Measurements
+from parser import SAMPLING_RATE
+from streaming import StreamingTreatment, read_csv_blocks
+
+# Bloc horodaté : (instant d'arrivée time.perf_counter(), bloc
+# (n_dérivations, n_échantillons))
+Block = Tuple[float, np.ndarray]
+
+
+class RingBuffer:
+    """
+    Tampon circulaire de taille fixe (n_dérivations, capacité) : la mémoire
+    est allouée une fois, quelle que soit la durée du flux.
+    """
+
+    def __init__(self, n_leads: int, capacity: int):
+        self.data = np.zeros((n_leads, capacity))
+        self.capacity = capacity
+        # Nombre total d'échantillons reçus (indice absolu de fin)
+        self.end = 0
+
+    def write(self, block: np.ndarray) -> None:
+        n_samples = block.shape[1]
+        # Seuls les `capacity` derniers échantillons d'un bloc trop long
+        kept = block[:, max(0, n_samples - self.capacity):]
+        positions = (self.end + n_samples - kept.shape[1]
+                     + np.arange(kept.shape[1])) % self.capacity
+        self.data[:, positions] = kept
+        self.end += n_samples
+
+    def latest(self, n_samples: int) -> Tuple[int, np.ndarray]:
+        """Indice absolu de début et copie ordonnée des derniers échantillons."""
+        n_samples = min(n_samples, self.end, self.capacity)
+        start = self.end - n_samples
+        positions = (start + np.arange(n_samples)) % self.capacity
+        return start, self.data[:, positions]
+
+
+@dataclass
+class BeatEvent:
+    """Battement finalisé par le moniteur (indices absolus du flux)."""
+    index: int
+    time: float
+    fiducials: Dict[str, int]
+    rr_interval: Optional[float]
+    heart_rate: Optional[float]
+    flags: Dict[str, bool] = field(default_factory=dict)
+    # Délai (s) entre l'arrivée du bloc qui a rendu le battement décidable
+    # et la publication de l'évènement
+    latency: float = 0.0
+    late: bool = False
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class Monitor:
+    """
+    Surveillance en temps réel d'un flux ECG multi-dérivations.
+
+    Chaque bloc est nettoyé de façon causale (StreamingTreatment) puis
+    conservé dans un tampon circulaire par dérivation. Contrairement à
+    streaming.stream_fiducials, la ligne de base n'est pas corrigée :
+    StreamingBaseline retarderait chaque battement de sa marge (0,8 s à
+    500 Hz), et le passe-haut du nettoyage retire déjà la dérive lente. La détection R, Q, S,
+    P et fin de T est faite sur la moyenne des dérivations, dans une fenêtre
+    de taille fixe (`context` secondes d'historique plus `lookahead`) : un
+    battement est publié dès que `lookahead` secondes ont été reçues après
+    son pic R, et le coût de chaque étape est borné par la taille de la
+    fenêtre, indépendamment de la durée du flux.
+
+    Les évènements portent la fréquence cardiaque et les règles de
+    Diagnostics évaluées sur les battements des `rolling` dernières
+    secondes, ainsi que leur latence de traitement, comparée à
+    `latency_budget`.
+    """
+    # Temps (s) nécessaire après R pour trouver la fin de l'onde T
+    # (voir Detection.detect_t_wave_end), plus une marge
+    LOOKAHEAD = 0.7
+    CONTEXT = 2.5
+    # Écart minimal (s) entre deux pics R publiés
+    REFRACTORY = 0.2
+
+    def __init__(self, labels: List[str], sampling_rate: int = SAMPLING_RATE,
+                 lookahead: float = LOOKAHEAD, context: float = CONTEXT,
+                 rolling: float = 10.0, latency_budget: float = 0.1,
+                 age: Optional[int] = None, max_backlog: float = 10.0):
+        self.labels = labels
+        self.sampling_rate = sampling_rate
+        self.lookahead = int(lookahead * sampling_rate)
+        self.context = int(context * sampling_rate)
+        self.rolling = rolling
+        self.latency_budget = latency_budget
+        self.age = age
+        self.treatment = StreamingTreatment(len(labels), sampling_rate)
+        self.buffer = RingBuffer(
+            len(labels),
+            self.context + self.lookahead + int(max_backlog * sampling_rate))
+        # Indice absolu à partir duquel les pics R restent à publier
+        self._emitted_until = 0
+        self._last_r = None
+        self._beats = deque()
+        self.latencies = []
+        self.overruns = 0
+        self.dropped = 0
+
+    def process(self, block: np.ndarray,
+                arrival: Union[float, Sequence[Tuple[int, float]]]
+                ) -> List[BeatEvent]:
+        """
+        Traite un bloc brut et retourne les battements finalisés.
+
+        `arrival` est l'instant d'arrivée du bloc, ou pour des blocs reçus
+        puis traités ensemble, la liste (nombre d'échantillons, instant
+        d'arrivée) des blocs concaténés dans `block`. La latence d'un
+        battement est mesurée depuis l'arrivée du bloc qui l'a rendu
+        décidable : l'attente des blocs en file est comptée.
+        """
+        if np.isscalar(arrival):
+            arrival = [(block.shape[1], arrival)]
+        sizes, arrivals = zip(*arrival)
+        # Indice absolu de fin de chaque bloc
+        ends = self.buffer.end + np.cumsum(sizes)
+        self.buffer.write(self.treatment.clean(block))
+        until = self.buffer.end - self.lookahead
+        if until <= self._emitted_until:
+            return []
+
+        # Battements trop anciens pour le tampon (retard de traitement)
+        oldest = self.buffer.end - self.buffer.capacity + self.context
+        if self._emitted_until < oldest:
+            self.dropped += oldest - self._emitted_until
+            self._emitted_until = oldest
+
+        start, window = self.buffer.latest(
+            self.buffer.end - self._emitted_until + self.context)
+        events = self._detect(window.mean(axis=0), start, until)
+        self._emitted_until = until
+
+        emitted = time.perf_counter()
+        for event in events:
+            # Premier bloc dont la fin dépasse R + lookahead
+            decisive = np.searchsorted(
+                ends, event.index + self.treatment.delay + self.lookahead,
+                side="right")
+            event.latency = emitted - arrivals[min(decisive, len(ends) - 1)]
+            event.late = event.latency > self.latency_budget
+            self.overruns += event.late
+            self.latencies.append(event.latency)
+        return events
+
+    def _detect(self, signal: np.ndarray, start: int, until: int
+                ) -> List[BeatEvent]:
+        fs = self.sampling_rate
+        if len(signal) < fs:
+            return []
+        r_peaks = Detection.detect_r_peaks(signal, fs)
+        if len(r_peaks) == 0:
+            return []
+
+        q_peaks, s_peaks = Detection.q_and_s_per_beat(signal, r_peaks, fs)
+        line = ECG.Line("Merged", signal, fs)
+        line.fiducials = Fiducials.from_columns(
+            Detection.p_wave_per_beat(signal, r_peaks, fs), q_peaks, r_peaks,
+            s_peaks, Detection.t_wave_end_per_beat(signal, r_peaks, fs))
+        measurements = Measurements.compute(line)
+
+        # Indices absolus dans l'enregistrement d'origine (retard du filtre)
+        offset = start - self.treatment.delay
+        events = []
+        for beat, r in enumerate(r_peaks):
+            absolute = start + r
+            if not self._emitted_until <= absolute < until:
+                continue
+            if self._last_r is not None and \
+                    absolute - self._last_r < self.REFRACTORY * fs:
+                continue
+            rr = None if self._last_r is None else \
+                (absolute - self._last_r) * 1000 / fs
+            self._last_r = absolute
+
+            values = {key: measurements[key][beat]
+                      for key in ("pr_intervals", "pr_segments",
+                                  "qrs_durations", "qt_intervals",
+                                  "st_segments", "p_wave_amplitudes",
+                                  "qrs_amplitudes", "t_wave_amplitudes")}
+            values["rr_intervals"] = rr
+            self._beats.append((absolute, values))
+            while self._beats[0][0] < absolute - self.rolling * fs:
+                self._beats.popleft()
+
+            rolling = self._rolling()
+            row = line.fiducials.table[beat]
+            events.append(BeatEvent(
+                index=int(absolute - self.treatment.delay),
+                time=float((absolute - self.treatment.delay) / fs),
+                fiducials={column: int(value + offset) if value != MISSING
+                           else MISSING
+                           for column, value in zip(Fiducials.COLUMNS, row)},
+                rr_interval=rr,
+                heart_rate=self._heart_rate(rolling),
+                flags=self._flags(rolling)))
+        return events
+
+    def _rolling(self) -> dict:
+        """Mesures par battement de la fenêtre glissante."""
+        keys = self._beats[0][1].keys()
+        return {key: np.array([values[key] for _, values in self._beats
+                               if values[key] is not None], dtype=np.float64)
+                for key in keys}
+
+    @staticmethod
+    def _heart_rate(rolling: dict) -> Optional[float]:
+        rr = rolling["rr_intervals"]
+        return float(60000 / rr.mean()) if len(rr) else None
+
+    def _flags(self, rolling: dict) -> Dict[str, bool]:
+        # Tableaux NumPy plutôt qu'un DataFrame : appelé à chaque battement,
+        # dans le budget de latence
+        findings = Diagnostics.evaluate_arrays([rolling], [self.age])
+        return {rule: bool(values[0]) for rule, values in findings.items()}
+
+    async def run(self, source: AsyncIterator[Block],
+                  queue_size: int = 64) -> AsyncIterator[BeatEvent]:
+        """
+        Consomme une source de blocs horodatés et produit les battements.
+
+        La lecture de la source se poursuit pendant le traitement (tâche
+        séparée, traitement dans un thread) ; les blocs en attente sont
+        traités ensemble, si bien qu'un retard ponctuel est rattrapé en une
+        seule étape de coût borné.
+        """
+        queue = asyncio.Queue(queue_size)
+
+        async def read():
+            try:
+                async for item in source:
+                    await queue.put(item)
+            finally:
+                await queue.put(None)
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.create_task(read())
+        try:
+            finished = False
+            while not finished:
+                items = [await queue.get()]
+                while not queue.empty():
+                    items.append(queue.get_nowait())
+                finished = items[-1] is None
+                items = [item for item in items if item is not None]
+                if not items:
+                    continue
+                arrivals = [(block.shape[1], arrival)
+                            for arrival, block in items]
+                block = np.concatenate([block for _, block in items], axis=1)
+                # run_in_executor plutôt qu'asyncio.to_thread (Python 3.9+)
+                for event in await loop.run_in_executor(None, self.process,
+                                                        block, arrivals):
+                    yield event
+        finally:
+            reader.cancel()
+
+    def latency_summary(self) -> dict:
+        latencies = np.array(self.latencies)
+        summary = {"beats": len(latencies), "overruns": self.overruns,
+                   "dropped_samples": self.dropped,
+                   "budget": self.latency_budget,
+                   "detection_delay": (self.lookahead + self.treatment.delay)
+                   / self.sampling_rate}
+        if len(latencies):
+            summary.update({
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "max": float(latencies.max())})
+        return summary
+
+
+async def replay_blocks(csv_path: str, speed: float = 1.0,
+                        block_size: int = SAMPLING_RATE // 25,
+                        sampling_rate: int = SAMPLING_RATE
+                        ) -> AsyncIterator[Block]:
+    """
+    Rejoue un CSV enregistré comme une source temps réel, `speed` fois plus
+    vite que l'acquisition (1 à 100) : chaque bloc est publié à l'instant où
+    son dernier échantillon aurait été acquis.
+    """
+    _, blocks = read_csv_blocks(csv_path, block_size)
+    started = time.perf_counter()
+    received = 0
+    for block in blocks:
+        received += block.shape[1]
+        delay = started + received / sampling_rate / speed \
+            - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield time.perf_counter(), block
+
+
+async def stream_blocks(reader: asyncio.StreamReader,
+                        block_size: int = SAMPLING_RATE // 25
+                        ) -> AsyncIterator[Block]:
+    """
+    Source lue sur un flux texte (socket, tube, `tail -f`) : une ligne CSV
+    par échantillon, la première ligne pouvant être l'en-tête.
+    """
+    rows = []
+    while True:
+        line = await reader.readline()
+        if line:
+            try:
+                rows.append([float(value) for value in line.split(b",")])
+            except ValueError:
+                # En-tête ou ligne incomplète
+                pass
+        if rows and (len(rows) >= block_size or not line):
+            yield time.perf_counter(), np.array(rows).T
+            rows = []
+        if not line:
+            return
+
+
+async def _replay(args) -> dict:
+    labels, _ = read_csv_blocks(args.csv, 1)
+    monitor = Monitor(labels, latency_budget=args.budget_ms / 1000,
+                      age=args.age)
+    async for event in monitor.run(replay_blocks(
+            args.csv, args.speed, int(args.block_ms * SAMPLING_RATE / 1000))):
+        if args.events:
+            print(json.dumps(event.to_dict()))
+    return monitor.latency_summary()
+
+
+async def _listen(args) -> None:
+    async def handle(reader, writer):
+        header = (await reader.readline()).decode().strip().split(",")
+        monitor = Monitor([label.strip() for label in header],
+                          latency_budget=args.budget_ms / 1000, age=args.age)
+        async for event in monitor.run(stream_blocks(reader)):
+            print(json.dumps(event.to_dict()), flush=True)
+        print(json.dumps(monitor.latency_summary()), flush=True)
+        writer.close()
+
+    server = await asyncio.start_server(handle, args.host, args.port)
+    async with server:
+        await server.serve_forever()
+
+
+async def _send(args) -> None:
+    """Rejoue un CSV vers un moniteur à l'écoute (en-tête puis lignes)."""
+    labels, _ = read_csv_blocks(args.csv, 1)
+    _, writer = await asyncio.open_connection(args.host, args.port)
+    writer.write((",".join(labels) + "\n").encode())
+    async for _, block in replay_blocks(
+            args.csv, args.speed, int(args.block_ms * SAMPLING_RATE / 1000)):
+        writer.write("".join(",".join(map(repr, row)) + "\n"
+                             for row in block.T.tolist()).encode())
+        await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Surveillance ECG en temps réel et rejeu de CSV.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay = commands.add_parser(
+        "replay", help="Rejoue un CSV dans un moniteur et mesure la latence")
+    replay.add_argument("csv")
+    replay.add_argument("--events", action="store_true",
+                        help="Affiche chaque battement (JSON lines)")
+
+    listen = commands.add_parser(
+        "listen", help="Surveille les flux CSV reçus sur un port TCP")
+    listen.add_argument("--host", default="127.0.0.1")
+    listen.add_argument("--port", type=int, default=5555)
+
+    send = commands.add_parser(
+        "send", help="Envoie un CSV à un moniteur à la vitesse d'acquisition")
+    send.add_argument("csv")
+    send.add_argument("--host", default="127.0.0.1")
+    send.add_argument("--port", type=int, default=5555)
+
+    for command in (replay, send):
+        command.add_argument("--speed", type=float, default=1.0,
+                             help="Facteur d'accélération (1 à 100)")
+        command.add_argument("--block-ms", type=float, default=40,
+                             help="Durée d'un bloc (ms)")
+    for command in (replay, listen):
+        command.add_argument("--budget-ms", type=float, default=100,
+                             help="Budget de latence de traitement (ms)")
+        command.add_argument("--age", type=int, default=None,
+                             help="Âge du patient (règle du QT)")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        print(json.dumps(asyncio.run(_replay(args))))
+    elif args.command == "listen":
+        asyncio.run(_listen(args))
+    else:
+        asyncio.run(_send(args))
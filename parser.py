@@ -1,18 +1,159 @@
-from typing import List
+import argparse
+import glob
+import hashlib
+import json
+import os
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
 
-import pandas as pd
+import numpy as np
 
 from ecg import ECG
+from memo import atomic_write
 
 SAMPLING_RATE = 500
+# À incrémenter lorsque le contenu du cache binaire change, afin que les
+# résultats calculés à partir des anciennes entrées soient recalculés (voir
+# ecg_batch.pipeline_params)
+CACHE_FORMAT = 2
 
 
-def parse_lines(csv_path: str) -> List['ECG.Line']:
-    df = pd.read_csv(csv_path)
-    lines = [
-        ECG.Line(label=column, points=df[column].to_numpy(),
-                 sampling_rate=SAMPLING_RATE)
-        for column in df.columns if len(str.strip(column)) > 0
-    ]
+def parse_lines(csv_path: str, cache_dir: Optional[str] = None,
+                dtype=np.float64,
+                labels: Optional[List[str]] = None) -> 'ECG.Leads':
+    """
+    Lit les dérivations d'un fichier CSV d'ECG.
 
-    return lines
+    Les dérivations sont retournées dans une matrice unique
+    (n_dérivations, n_échantillons). Si `cache_dir` est fourni, elles sont
+    lues depuis le cache binaire (matrice .npy projetée en mémoire) lorsqu'il
+    est à jour, et le cache est créé ou rafraîchi sinon. `labels` restreint
+    la lecture à certaines dérivations.
+
+    `dtype` est le type de la matrice retournée, lue du CSV dans ce type ;
+    le cache a une entrée par type, une lecture en float64 ne relit donc
+    jamais une matrice arrondie en float32. np.float32 divise par deux la
+    mémoire de l'enregistrement et des lignes traitées qui en conservent le
+    type (voir LineTreatment.clean_ecg).
+    """
+    if cache_dir is None:
+        file_labels, matrix = _read_csv(csv_path, dtype, labels)
+    else:
+        cached = load_cached(csv_path, cache_dir, dtype)
+        if cached is None:
+            cached = write_cache(csv_path, cache_dir, dtype)
+        file_labels, matrix = cached
+        if labels is not None:
+            # Seules les lignes demandées de la matrice projetée sont lues
+            rows = [i for i, label in enumerate(file_labels)
+                    if str.strip(label) in labels]
+            file_labels = [file_labels[i] for i in rows]
+            matrix = matrix[rows]
+
+    return ECG.Leads(file_labels, matrix, SAMPLING_RATE)
+
+
+def _read_csv(csv_path: str, dtype=np.float64,
+              labels: Optional[List[str]] = None
+              ) -> Tuple[List[str], np.ndarray]:
+    """Lit le CSV en une matrice contiguë (n_dérivations, n_échantillons)."""
+    # Import différé : pandas n'est pas nécessaire pour lire le cache binaire
+    import pandas as pd
+
+    # Conversion au type demandé pendant la lecture : en float32, pas de
+    # DataFrame intermédiaire en float64
+    df = pd.read_csv(csv_path, dtype=dtype, usecols=None if labels is None
+                     else (lambda column: str.strip(column) in labels))
+    columns = [column for column in df.columns if len(str.strip(column)) > 0]
+    matrix = np.ascontiguousarray(df[columns].to_numpy(dtype=dtype).T)
+    return columns, matrix
+
+
+def cache_key(csv_path: str) -> str:
+    """Clé de cache : chemin absolu, date de modification et taille du CSV."""
+    stat = os.stat(csv_path)
+    source = f"{os.path.abspath(csv_path)}|{stat.st_mtime_ns}|{stat.st_size}"
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+def _cache_paths(csv_path: str, cache_dir: str, dtype=np.float64
+                 ) -> Tuple[str, str]:
+    name = f"{cache_key(csv_path)}.{np.dtype(dtype).name}"
+    return (os.path.join(cache_dir, name + ".npy"),
+            os.path.join(cache_dir, name + ".json"))
+
+
+def load_cached(csv_path: str, cache_dir: str, dtype=np.float64
+                ) -> Optional[Tuple[List[str], np.ndarray]]:
+    """
+    Retourne les étiquettes et la matrice projetée en mémoire (lecture
+    seule) d'un CSV déjà en cache dans le type `dtype`, ou None si le cache
+    est absent ou périmé.
+    """
+    matrix_path, labels_path = _cache_paths(csv_path, cache_dir, dtype)
+    # Les étiquettes sont écrites en dernier : leur présence garantit que la
+    # matrice est complète
+    if not os.path.exists(labels_path):
+        return None
+    with open(labels_path) as labels_file:
+        labels = json.load(labels_file)["labels"]
+    return labels, np.load(matrix_path, mmap_mode="r")
+
+
+def write_cache(csv_path: str, cache_dir: str, dtype=np.float64
+                ) -> Tuple[List[str], np.ndarray]:
+    """Convertit un CSV en matrice .npy (de type `dtype`) et métadonnées
+    JSON dans le cache."""
+    labels, matrix = _read_csv(csv_path, dtype)
+    matrix_path, labels_path = _cache_paths(csv_path, cache_dir, dtype)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with atomic_write(matrix_path) as matrix_file:
+        np.save(matrix_file, matrix)
+    with atomic_write(labels_path, "w") as labels_file:
+        json.dump({"source": os.path.abspath(csv_path), "labels": labels,
+                   "dtype": matrix.dtype.str, "shape": matrix.shape},
+                  labels_file)
+
+    return labels, np.load(matrix_path, mmap_mode="r")
+
+
+def _warm_one(args: Tuple[str, str, str]) -> bool:
+    csv_path, cache_dir, dtype = args
+    if load_cached(csv_path, cache_dir, np.dtype(dtype)) is not None:
+        return False
+    write_cache(csv_path, cache_dir, np.dtype(dtype))
+    return True
+
+
+def warm_cache(directory: str, cache_dir: str, dtype=np.float64,
+               workers: Optional[int] = 1) -> int:
+    """
+    Convertit à l'avance tous les CSV d'un répertoire (récursivement) dans
+    le cache binaire. Retourne le nombre de fichiers convertis.
+    """
+    csv_paths = sorted(glob.glob(os.path.join(directory, "**", "*.csv"),
+                                 recursive=True))
+    jobs = [(path, cache_dir, np.dtype(dtype).str) for path in csv_paths]
+    if workers == 1:
+        return sum(map(_warm_one, jobs))
+    with Pool(processes=workers) as pool:
+        return sum(pool.imap_unordered(_warm_one, jobs, chunksize=16))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Préremplit le cache binaire des CSV d'ECG.")
+    parser.add_argument("command", choices=["warm"])
+    parser.add_argument("directory", help="Répertoire contenant les CSV")
+    parser.add_argument("--cache-dir", required=True,
+                        help="Répertoire du cache binaire")
+    parser.add_argument("--dtype", choices=["float32", "float64"],
+                        default="float64")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nombre de processus (défaut : 1)")
+    args = parser.parse_args()
+
+    converted = warm_cache(args.directory, args.cache_dir, args.dtype,
+                           args.workers)
+    print(f"{converted} fichiers convertis dans {args.cache_dir}.")
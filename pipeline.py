@@ -0,0 +1,241 @@
+import time
+import tracemalloc
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import (TYPE_CHECKING, Callable, ContextManager, Iterator, List,
+                    Optional, Sequence, Tuple)
+
+from detection import Detection
+from ecg import ECG
+from line_treatments import LineTreatment
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class StageMetrics:
+    """Mesures d'exécution d'une étape (lead=None) ou d'une dérivation."""
+    stage: str
+    lead: Optional[str]
+    wall_time: float
+    cpu_time: float
+    # Pic d'allocation Python (octets) pendant l'étape, None sans suivi
+    peak_memory: Optional[int]
+
+
+@dataclass
+class PipelineReport:
+    metrics: List[StageMetrics] = field(default_factory=list)
+
+    def stages(self) -> List[StageMetrics]:
+        """Mesures globales de chaque étape, dans l'ordre d'exécution."""
+        return [metric for metric in self.metrics if metric.lead is None]
+
+    def to_dataframe(self) -> 'pd.DataFrame':
+        import pandas as pd
+
+        return pd.DataFrame([asdict(metric) for metric in self.metrics],
+                            columns=["stage", "lead", "wall_time", "cpu_time",
+                                     "peak_memory"])
+
+    def to_dict(self) -> dict:
+        return {"metrics": [asdict(metric) for metric in self.metrics]}
+
+
+class Probe:
+    """
+    Mesure le temps réel, le temps CPU et le pic mémoire (tracemalloc) de
+    blocs éventuellement imbriqués (étape puis dérivations).
+
+    Le pic est remis à zéro au début de chaque bloc avec
+    tracemalloc.reset_peak (Python 3.9+). Sous Python 3.8, il ne l'est pas :
+    peak_memory majore alors le pic du bloc (pic depuis le début du suivi).
+    """
+
+    def __init__(self, report: PipelineReport,
+                 hooks: Sequence[Callable[[StageMetrics], None]] = (),
+                 track_memory: bool = True):
+        self.report = report
+        self.hooks = hooks
+        self.track_memory = track_memory
+        # Pic observé par chaque bloc englobant, tracemalloc n'ayant qu'un
+        # seul compteur de pic
+        self._peaks = []
+
+    @contextmanager
+    def measure(self, stage: str, lead: Optional[str] = None) -> Iterator[None]:
+        start_memory = None
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            Probe._reset_peak()
+            start_memory = current
+            self._peaks.append(current)
+
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start_wall
+            cpu_time = time.process_time() - start_cpu
+            peak_memory = None
+            if self.track_memory:
+                peak = max(tracemalloc.get_traced_memory()[1],
+                           self._peaks.pop())
+                peak_memory = peak - start_memory
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                Probe._reset_peak()
+
+            metrics = StageMetrics(stage, lead, wall_time, cpu_time,
+                                   peak_memory)
+            self.report.metrics.append(metrics)
+            for hook in self.hooks:
+                hook(metrics)
+
+    @staticmethod
+    def _reset_peak() -> None:
+        # tracemalloc.reset_peak n'existe qu'à partir de Python 3.9
+        reset_peak = getattr(tracemalloc, "reset_peak", None)
+        if reset_peak is not None:
+            reset_peak()
+
+    def lead_context(self, stage: str) -> Callable[[str], ContextManager]:
+        """Fabrique de contextes par dérivation pour une étape."""
+        return lambda label: self.measure(stage, label)
+
+
+class Stage:
+    """
+    Étape du pipeline. `inputs` et `outputs` nomment les artefacts lus et
+    produits sur l'ECG ("lines", "treated_lines", "merged", "fiducials",
+    "measurements").
+    """
+    name: str = ""
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+
+    def run(self, ecg: 'ECG', probe: Probe) -> None:
+        raise NotImplementedError
+
+
+class CleanStage(Stage):
+    name = "clean"
+    inputs = ("lines",)
+    outputs = ("treated_lines",)
+
+    def __init__(self, method: str = "neurokit",
+                 executor: Optional[Executor] = None,
+                 in_place: bool = False):
+        self.method = method
+        self.executor = executor
+        self.in_place = in_place
+
+    def run(self, ecg: 'ECG', probe: Probe) -> None:
+        LineTreatment.clean_ecg(ecg, self.method,
+                                probe.lead_context(self.name), self.executor,
+                                self.in_place)
+
+
+class BaselineStage(Stage):
+    name = "baseline"
+    inputs = ("treated_lines",)
+    outputs = ("treated_lines",)
+
+    def __init__(self,
+                 window_size_ms: float = LineTreatment.BASELINE_WINDOW_SIZE_MS):
+        self.window_size_ms = window_size_ms
+
+    def run(self, ecg: 'ECG', probe: Probe) -> None:
+        LineTreatment.correct_baseline(ecg, self.window_size_ms)
+
+
+class MergeStage(Stage):
+    name = "merge"
+    inputs = ("treated_lines",)
+    outputs = ("merged",)
+
+    def run(self, ecg: 'ECG', probe: Probe) -> None:
+        LineTreatment.merge_ecg(ecg)
+
+
+class DetectStage(Stage):
+    name = "detect"
+    inputs = ("treated_lines",)
+    outputs = ("fiducials",)
+
+    def __init__(self, executor: Optional[Executor] = None):
+        self.executor = executor
+
+    def run(self, ecg: 'ECG', probe: Probe) -> None:
+        Detection.detect(ecg, probe.lead_context(self.name), self.executor)
+
+
+class MeasureStage(Stage):
+    name = "measure"
+    inputs = ("fiducials",)
+    outputs = ("measurements",)
+
+    def run(self, ecg: 'ECG', probe: Probe) -> None:
+        ecg.measurements()
+
+
+class Pipeline:
+    """
+    Enchaînement configurable d'étapes, instrumenté étape par étape et
+    dérivation par dérivation.
+
+    Exemple :
+        pipeline = Pipeline([CleanStage(method="biosppy"), MergeStage(),
+                             DetectStage()])
+        report = pipeline.run(ecg)
+        print(report.to_dataframe())
+    """
+
+    def __init__(self, stages: Sequence[Stage],
+                 hooks: Sequence[Callable[[StageMetrics], None]] = (),
+                 track_memory: bool = True):
+        available = {"lines"}
+        for stage in stages:
+            missing = [name for name in stage.inputs if name not in available]
+            if missing:
+                raise ValueError(
+                    f"L'étape {stage.name} requiert {', '.join(missing)}, "
+                    f"qui n'est produit par aucune étape précédente.")
+            available.update(stage.outputs)
+
+        self.stages = list(stages)
+        self.hooks = list(hooks)
+        self.track_memory = track_memory
+
+    @staticmethod
+    def default(executor: Optional[Executor] = None,
+                in_place: bool = False) -> 'Pipeline':
+        """Pipeline de production : nettoyage, ligne de base, fusion,
+        détection et mesures. Avec `executor`, le nettoyage et la détection
+        traitent les dérivations en parallèle sur ce pool. Avec `in_place`,
+        les lignes brutes sont libérées au nettoyage (voir
+        LineTreatment.clean_ecg)."""
+        return Pipeline([CleanStage(executor=executor, in_place=in_place),
+                         BaselineStage(), MergeStage(),
+                         DetectStage(executor=executor), MeasureStage()])
+
+    def run(self, ecg: 'ECG') -> PipelineReport:
+        """Exécute toutes les étapes sur l'ECG et retourne leurs mesures."""
+        report = PipelineReport()
+        probe = Probe(report, self.hooks, self.track_memory)
+
+        started_tracing = self.track_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            for stage in self.stages:
+                with probe.measure(stage.name):
+                    stage.run(ecg, probe)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+        return report
@@ -1,15 +1,26 @@
-from typing import TYPE_CHECKING, List, Optional
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import numpy as np
 
 if TYPE_CHECKING:
     from ecg import ECG
 
-from matplotlib import pyplot as plt
+
+def _pyplot():
+    """Import pyplot on first use: it selects and loads a GUI backend, which
+    headless users of this module (decimation, reports) do not need."""
+    from matplotlib import pyplot
+    return pyplot
 
 
 class Plot:
+    # Nombre maximal de points tracés par ligne pour la plage visible
+    MAX_POINTS = 4000
+
     @staticmethod
     def show_text(text: str):
         """Display patient information in a separate figure."""
+        plt = _pyplot()
         fig_info = plt.figure(figsize=(6, 4))
         fig_info.suptitle("Patient Information")
         plt.axis("off")
@@ -20,61 +31,148 @@ class Plot:
     def plot_lines(lines: List['ECG.Line'], title: str = "ECG Lines",
                    selected_label: Optional[str] = None):
         """Plot one or more ECG lines with peaks."""
-        fig, ax = plt.subplots(figsize=(12, 6))
+        fig, ax = _pyplot().subplots(figsize=(12, 6))
 
         # Ajout de l'axe des ordonnées
         ax.axhline(y=0, color='black', linewidth=1, linestyle='--')
 
-        plotted_lines, peak_points = Plot._add_lines_and_peaks_to_plot(
-            lines, ax, selected_label
-        )
+        plotted_lines, peak_points, full_points = \
+            Plot._add_lines_and_peaks_to_plot(lines, ax, selected_label)
 
         ax.set_title(title)
         ax.set_xlabel("Time (samples)")
         ax.set_ylabel("Amplitude")
         legend = ax.legend()
 
-        Plot._connect_legend_click(fig, legend, plotted_lines, peak_points)
-        Plot._connect_keyboard_event(fig, legend, plotted_lines, peak_points)
+        Plot._connect_decimation(ax, list(zip(plotted_lines, full_points)))
+        redraw = Plot._connect_blit(fig, ax, [
+            *plotted_lines,
+            *(pp for peak_point in peak_points for pp in peak_point),
+            legend])
+        Plot._connect_legend_click(fig, legend, plotted_lines, peak_points,
+                                   redraw)
+        Plot._connect_keyboard_event(fig, legend, plotted_lines, peak_points,
+                                     redraw)
+
+    @staticmethod
+    def decimate(points: np.ndarray, start: int, end: int,
+                 max_points: int = MAX_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Enveloppe min/max de points[start:end] sur au plus `max_points`
+        points : chaque intervalle est représenté par son minimum et son
+        maximum, dans l'ordre où ils apparaissent, ce qui conserve l'aspect
+        du tracé (pics compris) à l'écran.
+
+        Returns:
+            tuple: Indices (abscisses) et valeurs des points à tracer.
+        """
+        start, end = max(0, start), min(len(points), end)
+        if end - start <= max_points:
+            indices = np.arange(start, end)
+            return indices, points[start:end]
+
+        n_bins = max_points // 2
+        bin_size = -(-(end - start) // n_bins)
+        n_bins = -(-(end - start) // bin_size)
+        padded = np.empty(n_bins * bin_size)
+        padded[:end - start] = points[start:end]
+        padded[end - start:] = points[end - 1]
+
+        bins = padded.reshape(n_bins, bin_size)
+        extrema = np.sort(np.stack([bins.argmin(axis=1),
+                                    bins.argmax(axis=1)], axis=1), axis=1)
+        indices = (extrema + start
+                   + bin_size * np.arange(n_bins)[:, None]).ravel()
+        indices = np.minimum(indices, end - 1)
+        return indices, points[indices]
 
     @staticmethod
     def _add_lines_and_peaks_to_plot(lines: List['ECG.Line'], ax,
                                      selected_label: Optional[str]):
-        """Add lines and peaks to the plot."""
+        """
+        Add lines and peaks to the plot. Returns the plotted lines, their
+        peak scatters and the full signal of each plotted line.
+        """
         plotted_lines = []
         peak_points = []
+        full_points = []
 
         for line in lines:
             if selected_label and line.label != selected_label:
                 continue
 
-            # Plot the line
-            plot_line, = ax.plot(line.points, label=line.label)
+            # Plot the line (decimated, refined on zoom by _connect_decimation)
+            points = np.asarray(line.points)
+            x, y = Plot.decimate(points, 0, len(points))
+            plot_line, = ax.plot(x, y, label=line.label)
             plotted_lines.append(plot_line)
+            full_points.append(points)
 
             # Plot the peaks as scatter points
-            waves_idx = line.metadata and line.metadata.values() or []
-            # flatten
-            waves_idx = [item for sublist in waves_idx for item in sublist]
-
-            peak_points_line = ax.scatter([i for i in waves_idx if not i != i],
-                                          [line.points[i] for i in waves_idx if
-                                           not i != i],
+            waves_idx = np.empty(0, dtype=np.intp) if line.fiducials is None \
+                else line.fiducials.valid_indices(len(points))
+            peak_points_line = ax.scatter(waves_idx, points[waves_idx],
                                           color=plot_line.get_color())
-            # peak_points_line = ax.scatter(waves_idx[1], [line.points[i] for i in
-            #                                              waves_idx[1]],
-            #                               color=plot_line.get_color())
-            # start_points = ax.scatter(waves_idx[0], [line.points[i] for i in waves_idx[0]],
-            #                             color=plot_line.get_color(), marker='s')
-            # end_points = ax.scatter(waves_idx[2], [line.points[i] for i in waves_idx[2]],
-            #                         color=plot_line.get_color(), marker='*')
-
             peak_points.append([peak_points_line])
 
-        return plotted_lines, peak_points
+        return plotted_lines, peak_points, full_points
+
+    @staticmethod
+    def _connect_decimation(ax, lines_and_points):
+        """
+        Re-sample the lines for the visible x-range on zoom and pan, from
+        (plotted line, full signal) pairs.
+        """
+
+        def on_xlim_changed(axes):
+            x_min, x_max = axes.get_xlim()
+            for plot_line, points in lines_and_points:
+                x, y = Plot.decimate(points, int(np.floor(x_min)) - 1,
+                                     int(np.ceil(x_max)) + 2)
+                plot_line.set_data(x, y)
+
+        ax.callbacks.connect("xlim_changed", on_xlim_changed)
+
+    @staticmethod
+    def _connect_blit(fig, ax, artists):
+        """
+        Draw the given artists (lines, peaks and legend) as animated artists
+        over a cached background, so that visibility toggles only redraw
+        them. Returns the redraw function (a full draw when blitting is not
+        supported by the backend).
+        """
+        if not fig.canvas.supports_blit:
+            return fig.canvas.draw_idle
+
+        for artist in artists:
+            artist.set_animated(True)
+        background = {}
+
+        def redraw():
+            if "axes" not in background:
+                fig.canvas.draw_idle()
+                return
+            fig.canvas.restore_region(background["axes"])
+            for artist in artists:
+                if artist.get_visible():
+                    ax.draw_artist(artist)
+            fig.canvas.blit(ax.bbox)
+
+        def on_draw(event):
+            # savefig draws the animated artists itself, possibly on another
+            # canvas (PDF) without blitting support
+            if fig.canvas.is_saving():
+                return
+            background["axes"] = fig.canvas.copy_from_bbox(ax.bbox)
+            for artist in artists:
+                if artist.get_visible():
+                    ax.draw_artist(artist)
+
+        fig.canvas.mpl_connect("draw_event", on_draw)
+        return redraw
 
     @staticmethod
-    def _connect_legend_click(fig, legend, plotted_lines, peak_points):
+    def _connect_legend_click(fig, legend, plotted_lines, peak_points, redraw):
         """Toggle visibility of lines and peaks via legend clicks."""
 
         def on_legend_click(event):
@@ -88,14 +186,15 @@ class Plot:
                         for pp in peak_point:
                             pp.set_visible(visible)
                     l_leg.set_alpha(1.0 if visible else 0.2)
-                    fig.canvas.draw()
+                    redraw()
 
         fig.canvas.mpl_connect("pick_event", on_legend_click)
         for leg_line in legend.get_lines():
             leg_line.set_picker(5)
 
     @staticmethod
-    def _connect_keyboard_event(fig, legend, plotted_lines, peak_points):
+    def _connect_keyboard_event(fig, legend, plotted_lines, peak_points,
+                                redraw):
         """Hide all lines and peaks when pressing 'H'."""
 
         def on_key_press(event):
@@ -107,10 +206,10 @@ class Plot:
                         for pp in peakpoint:
                             pp.set_visible(False)
                     legline.set_alpha(0.2)  # Semi-transparent legend
-                fig.canvas.draw()
+                redraw()
 
         fig.canvas.mpl_connect("key_press_event", on_key_press)
 
     @staticmethod
     def show():
-        plt.show()
+        _pyplot().show()
@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Mapping, Optional, Union
+
+
+class Profiler:
+    """
+    Registre des mesures des fonctions instrumentées de Detection et
+    LineTreatment : pour chaque fonction, nombre d'appels, temps cumulé et
+    maximal, et compteurs propres à la fonction (échantillons parcourus,
+    battements traités, battements sans point trouvé...).
+
+    Désactivé, une fonction instrumentée ne paie qu'un test de `enabled` :
+
+        start = PROFILE.start()
+        ...
+        if start is not None:
+            PROFILE.record("detect_p_wave", start, beats=len(r_peaks))
+
+    Le registre est propre au processus. Les registres des processus d'un
+    pool se fusionnent (merge) à partir de to_dict, par exemple renvoyé avec
+    le résultat de chaque tâche (voir collect et ecg_batch.process_record).
+    """
+    # Statistiques de temps, les autres champs sont des compteurs additifs
+    CALLS = "calls"
+    SECONDS = "seconds"
+    MAX_SECONDS = "max_seconds"
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._stats: Dict[str, Dict[str, float]] = {}
+        # Le registre peut être partagé par les threads d'un pool de
+        # dérivations
+        self._lock = threading.Lock()
+
+    def start(self) -> Optional[float]:
+        """Instant de début d'un appel, None si le registre est désactivé."""
+        return time.perf_counter() if self.enabled else None
+
+    def record(self, name: str, start: float, **counters: int) -> None:
+        """Enregistre un appel de `name` commencé à `start` (voir start)."""
+        seconds = time.perf_counter() - start
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {Profiler.CALLS: 0,
+                                             Profiler.SECONDS: 0.0,
+                                             Profiler.MAX_SECONDS: 0.0}
+            stats[Profiler.CALLS] += 1
+            stats[Profiler.SECONDS] += seconds
+            stats[Profiler.MAX_SECONDS] = max(stats[Profiler.MAX_SECONDS],
+                                              seconds)
+            for counter, value in counters.items():
+                stats[counter] = stats.get(counter, 0) + int(value)
+
+    def merge(self, other: Union['Profiler', Mapping[str, Mapping]]) -> None:
+        """Ajoute les mesures d'un autre registre (ou de son to_dict)."""
+        other = other.to_dict() if isinstance(other, Profiler) else other
+        with self._lock:
+            for name, other_stats in other.items():
+                stats = self._stats.setdefault(name, {})
+                for field, value in other_stats.items():
+                    if field == Profiler.MAX_SECONDS:
+                        stats[field] = max(stats.get(field, 0.0), value)
+                    else:
+                        stats[field] = stats.get(field, 0) + value
+
+    @contextmanager
+    def collect(self) -> Iterator['Profiler']:
+        """
+        Enregistre les mesures du bloc, même si le registre est désactivé,
+        dans un registre à part (par exemple celles d'un enregistrement),
+        ajouté ensuite à celui-ci.
+        """
+        collected = Profiler(enabled=True)
+        with self._lock:
+            outer, self._stats = self._stats, collected._stats
+        enabled, self.enabled = self.enabled, True
+        try:
+            yield collected
+        finally:
+            self.enabled = enabled
+            with self._lock:
+                self._stats = outer
+            self.merge(collected)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = {}
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """Mesures par fonction, sérialisables en JSON."""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix: str = "pqrst") -> str:
+        """
+        Mesures au format texte de Prometheus : une famille par champ
+        (`<prefix>_calls_total`, `<prefix>_seconds_total`,
+        `<prefix>_max_seconds`, `<prefix>_beats_total`...), étiquetée par
+        fonction.
+        """
+        stats = self.to_dict()
+        fields = sorted({field for values in stats.values()
+                         for field in values})
+        lines = []
+        for field in fields:
+            gauge = field == Profiler.MAX_SECONDS
+            metric = f"{prefix}_{field}" if gauge \
+                else f"{prefix}_{field}_total"
+            lines.append(f"# TYPE {metric} {'gauge' if gauge else 'counter'}")
+            lines.extend(f'{metric}{{function="{name}"}} {values[field]}'
+                         for name, values in sorted(stats.items())
+                         if field in values)
+        return "\n".join(lines) + "\n"
+
+    def save(self, path: str) -> None:
+        """Écrit les mesures en JSON, ou au format Prometheus pour un
+        fichier .prom."""
+        with open(path, "w") as output:
+            output.write(self.to_prometheus() if path.endswith(".prom")
+                         else self.to_json())
+
+
+# Registre utilisé par LineTreatment et Detection
+PROFILE = Profiler()
+
+
+def configure(enabled: Optional[bool] = None) -> Profiler:
+    """Modifie la configuration du registre partagé PROFILE."""
+    if enabled is not None:
+        PROFILE.enabled = enabled
+    return PROFILE
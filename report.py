@@ -0,0 +1,193 @@
+import argparse
+import os
+import traceback
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+from ecg import ECG
+from parser import parse_lines
+from pipeline import Pipeline
+from plot import Plot
+
+
+class ReportRenderer:
+    """
+    Rendu hors écran (Agg) d'un ECG traité : informations patient, lignes
+    brutes, lignes traitées et ligne fusionnée avec ses fiducials.
+
+    La figure et ses axes sont créés une seule fois puis réutilisés d'un
+    enregistrement à l'autre : seules les courbes et le texte sont remplacés.
+    """
+
+    def __init__(self, figsize: Tuple[float, float] = (16, 10), dpi: int = 100):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        grid = self.figure.add_gridspec(3, 4)
+
+        info_ax = self.figure.add_subplot(grid[:, 0])
+        info_ax.axis("off")
+        self.info = info_ax.text(0.01, 0.99, "", fontsize=9,
+                                 verticalalignment="top", wrap=True)
+
+        self.axes = {
+            "raw": self.figure.add_subplot(grid[0, 1:]),
+            "treated": self.figure.add_subplot(grid[1, 1:]),
+            "merged": self.figure.add_subplot(grid[2, 1:]),
+        }
+        for name, ax in self.axes.items():
+            ax.set_title(name.capitalize(), fontsize=10)
+            ax.axhline(y=0, color="black", linewidth=0.8, linestyle="--")
+        self.axes["merged"].set_xlabel("Time (samples)")
+        self.figure.tight_layout()
+
+    def _clear(self):
+        for ax in self.axes.values():
+            # La ligne horizontale y = 0 est conservée
+            for artist in [*ax.lines[1:], *ax.collections]:
+                artist.remove()
+            legend = ax.get_legend()
+            if legend is not None:
+                legend.remove()
+
+    @staticmethod
+    def _draw_lines(ax, lines: List['ECG.Line'], fiducials: bool,
+                    legend: bool):
+        for line in lines:
+            points = np.asarray(line.points)
+            x, y = Plot.decimate(points, 0, len(points))
+            plot_line, = ax.plot(x, y, linewidth=0.6, label=line.label)
+            if fiducials and line.fiducials is not None:
+                indices = line.fiducials.valid_indices(len(points))
+                ax.scatter(indices, points[indices], s=8,
+                           color=plot_line.get_color(), zorder=3)
+        ax.relim()
+        ax.autoscale_view()
+        if legend and lines:
+            ax.legend(fontsize=6, ncol=6, loc="upper right")
+
+    def render(self, ecg: 'ECG') -> Figure:
+        """Met à jour la figure pour l'ECG (traité, fusionné et détecté)."""
+        self._clear()
+        self.info.set_text(ecg.patient_info())
+        treated = [line for line in ecg.treated_lines
+                   if line.label != "Merged"]
+        merged = [line for line in ecg.treated_lines
+                  if line.label == "Merged"]
+        self._draw_lines(self.axes["raw"], list(ecg.lines), False, True)
+        self._draw_lines(self.axes["treated"], treated, True, False)
+        self._draw_lines(self.axes["merged"], merged, True, False)
+        return self.figure
+
+
+# Un moteur de rendu par processus, réutilisé pour tous ses enregistrements
+_RENDERER: Optional[ReportRenderer] = None
+
+
+def _renderer() -> ReportRenderer:
+    global _RENDERER
+    if _RENDERER is None:
+        _RENDERER = ReportRenderer()
+    return _RENDERER
+
+
+def _load(row: pd.Series, cache_dir: Optional[str]) -> 'ECG':
+    ecg = ECG(row, parse_lines(row.ecg_file_path, cache_dir))
+    # Sans suivi tracemalloc, inutile ici et coûteux
+    Pipeline(Pipeline.default().stages, track_memory=False).run(ecg)
+    return ecg
+
+
+def _output_name(index, row: pd.Series) -> str:
+    return f"{index}_{os.path.splitext(os.path.basename(row.ecg_file_path))[0]}"
+
+
+def render_png(job: Tuple[object, pd.Series, str, Optional[str]]) -> dict:
+    """Rend un enregistrement dans un fichier PNG (tâche de pool)."""
+    index, row, output_dir, cache_dir = job
+    path = os.path.join(output_dir, _output_name(index, row) + ".png")
+    try:
+        _renderer().render(_load(row, cache_dir))
+        _renderer().canvas.print_png(path)
+    except Exception as error:
+        return {"index": index, "error": f"{type(error).__name__}: {error}",
+                "traceback": traceback.format_exc()}
+    return {"index": index, "path": path}
+
+
+def render_pdf(job: Tuple[List[Tuple[object, pd.Series]], str, Optional[str]]
+               ) -> List[dict]:
+    """Rend une suite d'enregistrements dans un PDF multipage (tâche de pool)."""
+    rows, path, cache_dir = job
+    results = []
+    with PdfPages(path) as pdf:
+        for index, row in rows:
+            try:
+                pdf.savefig(_renderer().render(_load(row, cache_dir)))
+            except Exception as error:
+                results.append({"index": index,
+                                "error": f"{type(error).__name__}: {error}",
+                                "traceback": traceback.format_exc()})
+                continue
+            results.append({"index": index, "path": path})
+    return results
+
+
+def render_reports(df_meta: pd.DataFrame, output_dir: str,
+                   output_format: str = "png", workers: Optional[int] = None,
+                   cache_dir: Optional[str] = None,
+                   records_per_pdf: int = 100) -> List[dict]:
+    """
+    Rend les rapports de toutes les lignes de df_meta sur un pool de
+    processus, sans affichage.
+
+    En PNG, un fichier par enregistrement. En PDF, les enregistrements sont
+    regroupés par `records_per_pdf` dans des PDF multipages (report_0000.pdf,
+    report_0001.pdf...), chacun rendu par un seul processus.
+
+    Returns:
+        list: Un résultat par enregistrement (chemin ou erreur).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rows = list(df_meta.iterrows())
+
+    with Pool(processes=workers) as pool:
+        if output_format == "png":
+            jobs = [(index, row, output_dir, cache_dir) for index, row in rows]
+            return list(pool.imap(render_png, jobs, chunksize=4))
+
+        jobs = [(rows[start:start + records_per_pdf],
+                 os.path.join(output_dir,
+                              f"report_{start // records_per_pdf:04d}.pdf"),
+                 cache_dir)
+                for start in range(0, len(rows), records_per_pdf)]
+        return [result for results in pool.imap(render_pdf, jobs)
+                for result in results]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rendu hors écran des rapports ECG d'un df_meta.")
+    parser.add_argument("df_meta", help="Chemin du fichier df_meta.pkl")
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--format", choices=["png", "pdf"], default="png")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument("--records-per-pdf", type=int, default=100)
+    parser.add_argument("--cache-dir", default=None,
+                        help="Répertoire du cache binaire des CSV")
+    args = parser.parse_args()
+
+    results = render_reports(pd.read_pickle(args.df_meta), args.output_dir,
+                             args.format, args.workers, args.cache_dir,
+                             args.records_per_pdf)
+    errors = [result for result in results if "error" in result]
+    for result in errors:
+        print(f"[{result['index']}] {result['error']}")
+    print(f"{len(results) - len(errors)} rapports rendus, "
+          f"{len(errors)} en erreur.")
@@ -0,0 +1,265 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from detection import Detection
+from fiducials import Fiducials
+from line_treatments import LineTreatment
+from parser import SAMPLING_RATE
+
+
+def read_csv_blocks(csv_path: str, chunk_size: int
+                    ) -> Tuple[List[str], Iterator[np.ndarray]]:
+    """
+    Lit un CSV d'ECG par blocs de `chunk_size` échantillons.
+
+    Returns:
+        tuple: Étiquettes des dérivations et itérateur de blocs
+        (n_dérivations, n_échantillons).
+    """
+    import pandas as pd
+
+    labels = [column for column in pd.read_csv(csv_path, nrows=0).columns
+              if len(str.strip(column)) > 0]
+
+    def blocks():
+        for chunk in pd.read_csv(csv_path, usecols=labels,
+                                 chunksize=chunk_size):
+            yield np.ascontiguousarray(
+                chunk[labels].to_numpy(dtype=np.float64).T)
+
+    return [str.strip(label) for label in labels], blocks()
+
+
+class StreamingTreatment:
+    """
+    Nettoyage bloc par bloc équivalent à la méthode "neurokit" de
+    nk.ecg_clean (passe-haut Butterworth 0,5 Hz d'ordre 5 puis moyenne
+    glissante sur une période du secteur), en version causale.
+
+    L'état des filtres est conservé d'un bloc à l'autre : le résultat est
+    identique à un filtrage du signal entier en une passe, sans artefact aux
+    jonctions. Contrairement à nk.ecg_clean (filtrage aller-retour), le
+    filtrage causal retarde le signal d'environ `delay` échantillons.
+    """
+
+    def __init__(self, n_leads: int, sampling_rate: int = SAMPLING_RATE,
+                 powerline: int = 50):
+        import scipy.signal
+
+        self.sampling_rate = sampling_rate
+        self.sos = scipy.signal.butter(5, 0.5, btype="highpass", output="sos",
+                                       fs=sampling_rate)
+        width = int(sampling_rate / powerline) if sampling_rate >= 100 else 2
+        self.moving_average = np.ones(width) / width
+        self.delay = (width - 1) // 2
+        self._sos_state = None
+        self._moving_average_state = np.zeros((n_leads, width - 1))
+
+    def clean(self, block: np.ndarray) -> np.ndarray:
+        """Nettoie un bloc (n_dérivations, n_échantillons)."""
+        import scipy.signal
+
+        block = np.asarray(block, dtype=np.float64)
+        if self._sos_state is None:
+            # Démarrage en régime établi sur le premier échantillon
+            self._sos_state = (scipy.signal.sosfilt_zi(self.sos)[:, None, :]
+                               * block[None, :, :1])
+
+        highpassed, self._sos_state = scipy.signal.sosfilt(
+            self.sos, block, axis=1, zi=self._sos_state)
+        cleaned, self._moving_average_state = scipy.signal.lfilter(
+            self.moving_average, [1.0], highpassed, axis=1,
+            zi=self._moving_average_state)
+        return cleaned
+
+
+class StreamingBaseline:
+    """
+    Correction de la ligne de base bloc par bloc, identique à
+    LineTreatment.estimate_baseline appliquée au signal entier (voir
+    LineTreatment.correct_baseline).
+
+    La ligne de base d'un échantillon ne dépend que des `margin` échantillons
+    de part et d'autre (demi-fenêtres des ouvertures et fermetures des deux
+    lissages) : chaque bloc est corrigé avec les `margin` échantillons qui le
+    précèdent, et ses `margin` derniers échantillons ne sont publiés qu'avec
+    le bloc suivant (ou par flush). Le signal n'est pas décalé, mais sa
+    publication est retardée de `margin` échantillons.
+    """
+
+    def __init__(self, n_leads: int, sampling_rate: int = SAMPLING_RATE,
+                 window_size_ms: float =
+                 LineTreatment.BASELINE_WINDOW_SIZE_MS):
+        self.sampling_rate = sampling_rate
+        self.window_size_ms = window_size_ms
+        # Mêmes fenêtres que LineTreatment.estimate_baseline : chaque
+        # ouverture (ou fermeture) s'étend d'une demi-fenêtre par min/max
+        self.margin = sum(
+            2 * ((int(factor * window_size_ms * sampling_rate / 1000) | 1)
+                 // 2)
+            for factor in (1, 3))
+        self._buffer = np.empty((n_leads, 0))
+        # Indice absolu du premier échantillon du tampon
+        self._buffer_start = 0
+        # Indice absolu à partir duquel les échantillons restent à publier
+        self._emitted_until = 0
+
+    def correct(self, block: np.ndarray) -> np.ndarray:
+        """Ajoute un bloc nettoyé et retourne les échantillons corrigés
+        dont la ligne de base est définitive."""
+        self._buffer = np.concatenate([self._buffer, block], axis=1)
+        return self._emit(self._buffer_start + self._buffer.shape[1]
+                          - self.margin)
+
+    def flush(self) -> np.ndarray:
+        """Publie les échantillons restants en fin d'enregistrement."""
+        return self._emit(self._buffer_start + self._buffer.shape[1])
+
+    def _emit(self, until: int) -> np.ndarray:
+        if until <= self._emitted_until:
+            return np.empty((self._buffer.shape[0], 0))
+
+        baseline = LineTreatment.estimate_baseline(
+            self._buffer, self.sampling_rate, self.window_size_ms)
+        first = self._emitted_until - self._buffer_start
+        last = until - self._buffer_start
+        corrected = self._buffer[:, first:last] - baseline[:, first:last]
+        self._emitted_until = until
+
+        # Seule la marge précédant la zone suivante reste nécessaire
+        keep_from = max(self._buffer_start, until - self.margin)
+        self._buffer = self._buffer[:, keep_from - self._buffer_start:].copy()
+        self._buffer_start = keep_from
+        return corrected
+
+
+class StreamingDetection:
+    """
+    Détection PQRST incrémentale sur un signal nettoyé reçu par blocs.
+
+    Un tampon conserve `margin` secondes de signal avant la zone en cours
+    (recherche des ondes P) et retarde la publication des battements de
+    `margin` secondes (recherche des fins d'ondes T et contexte de
+    Detection.detect_r_peaks). La mémoire utilisée est bornée par la taille d'un bloc
+    plus deux marges, quelle que soit la durée de l'enregistrement.
+    """
+
+    def __init__(self, labels: List[str], sampling_rate: int = SAMPLING_RATE,
+                 margin: float = 1.0, delay: int = 0):
+        self.labels = labels
+        self.sampling_rate = sampling_rate
+        self.margin = int(margin * sampling_rate)
+        self.delay = delay
+        self._buffer = np.empty((len(labels), 0))
+        # Indice absolu du premier échantillon du tampon
+        self._buffer_start = 0
+        # Indice absolu à partir duquel les battements restent à publier
+        self._emitted_until = 0
+
+    def feed(self, block: np.ndarray) -> Dict[str, Fiducials]:
+        """Ajoute un bloc nettoyé et retourne les battements finalisés."""
+        self._buffer = np.concatenate([self._buffer, block], axis=1)
+        buffer_end = self._buffer_start + self._buffer.shape[1]
+        return self._emit(buffer_end - self.margin)
+
+    def flush(self) -> Dict[str, Fiducials]:
+        """Publie les battements restants en fin d'enregistrement."""
+        return self._emit(self._buffer_start + self._buffer.shape[1])
+
+    def _emit(self, until: int) -> Dict[str, Fiducials]:
+        if until <= self._emitted_until or self._buffer.shape[1] == 0:
+            return {}
+
+        fiducials = {}
+        for label, signal in zip(self.labels, self._buffer):
+            fiducials[label] = self._detect(signal, self._emitted_until, until)
+        self._emitted_until = until
+
+        # Seule la marge précédant la zone suivante reste nécessaire
+        keep_from = max(self._buffer_start, until - self.margin)
+        self._buffer = self._buffer[:, keep_from - self._buffer_start:].copy()
+        self._buffer_start = keep_from
+        return fiducials
+
+    def _detect(self, signal: np.ndarray, start: int, end: int
+                ) -> Fiducials:
+        """Points caractéristiques, alignés par battement et en indices
+        absolus, des battements dont le pic R est dans [start, end)."""
+        fs = self.sampling_rate
+        r_peaks = Detection.detect_r_peaks(signal, fs)
+        r_peaks = r_peaks[(r_peaks + self._buffer_start >= start)
+                          & (r_peaks + self._buffer_start < end)]
+
+        q_peaks, s_peaks = Detection.q_and_s_per_beat(signal, r_peaks, fs)
+        fiducials = Fiducials.from_columns(
+            Detection.p_wave_per_beat(signal, r_peaks, fs), q_peaks, r_peaks,
+            s_peaks, Detection.t_wave_end_per_beat(signal, r_peaks, fs))
+        return fiducials.shifted(self._buffer_start - self.delay)
+
+
+def stream_fiducials(blocks: Iterable[np.ndarray], labels: List[str],
+                     sampling_rate: int = SAMPLING_RATE, margin: float = 1.0,
+                     merged: bool = True,
+                     baseline_window_ms: Optional[float] =
+                     LineTreatment.BASELINE_WINDOW_SIZE_MS
+                     ) -> Iterator[Dict[str, Fiducials]]:
+    """
+    Nettoie et analyse un enregistrement reçu par blocs
+    (n_dérivations, n_échantillons), et produit au fil de l'eau les
+    points caractéristiques de chaque dérivation (et de la moyenne "Merged"
+    si `merged`), alignés par battement (voir fiducials.Fiducials) et en
+    indices absolus dans l'enregistrement.
+
+    Comme LineTreatment.treat_ecg, le nettoyage est suivi de la correction
+    de la ligne de base (StreamingBaseline), sauf si `baseline_window_ms`
+    est None.
+
+    Yields:
+        dict: Pour chaque bloc, Fiducials des battements finalisés par
+        dérivation.
+    """
+    treatment: Optional[StreamingTreatment] = None
+    baseline: Optional[StreamingBaseline] = None
+    detection = StreamingDetection(
+        [label + " (treated)" for label in labels] + (
+            ["Merged"] if merged else []),
+        sampling_rate, margin)
+
+    def detect(treated: np.ndarray) -> Dict[str, Fiducials]:
+        if merged:
+            treated = np.vstack([treated, treated.mean(axis=0)])
+        return detection.feed(treated)
+
+    for block in blocks:
+        if treatment is None:
+            treatment = StreamingTreatment(len(block), sampling_rate)
+            detection.delay = treatment.delay
+            if baseline_window_ms is not None:
+                baseline = StreamingBaseline(len(block), sampling_rate,
+                                             baseline_window_ms)
+        cleaned = treatment.clean(block)
+        fiducials = detect(cleaned if baseline is None
+                           else baseline.correct(cleaned))
+        if fiducials:
+            yield fiducials
+
+    if baseline is not None:
+        fiducials = detect(baseline.flush())
+        if fiducials:
+            yield fiducials
+    fiducials = detection.flush()
+    if fiducials:
+        yield fiducials
+
+
+def stream_csv(csv_path: str, chunk_size: int = 30 * SAMPLING_RATE,
+               sampling_rate: int = SAMPLING_RATE, margin: float = 1.0,
+               merged: bool = True,
+               baseline_window_ms: Optional[float] =
+               LineTreatment.BASELINE_WINDOW_SIZE_MS
+               ) -> Iterator[Dict[str, Fiducials]]:
+    """Version de stream_fiducials lisant directement un CSV par blocs."""
+    labels, blocks = read_csv_blocks(csv_path, chunk_size)
+    return stream_fiducials(blocks, labels, sampling_rate, margin, merged,
+                            baseline_window_ms)
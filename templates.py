@@ -0,0 +1,169 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from detection import Detection
+from ecg import ECG
+from plot import Plot
+
+
+class BeatTemplates:
+    """
+    Battements moyens (médian et moyen) de chaque ligne traitée, alignés sur
+    les pics R de la ligne fusionnée.
+
+    Les fenêtres [R - BEFORE, R + AFTER) de tous les battements et de toutes
+    les lignes sont extraites en une fois en un tenseur lignes × battements
+    × fenêtre, réduit sur l'axe des battements (np.median et np.mean) : le
+    coût est linéaire en battements × lignes, sans boucle par battement.
+
+    Un battement moyen se mesure comme un enregistrement d'un seul
+    battement (voir to_ecg) : Calculation et Plot le consomment tel quel,
+    pour une fraction du coût des mesures de chaque battement.
+
+    Exemple :
+        templates = BeatTemplates.from_ecg(ecg)
+        calculation = Calculation(templates.to_ecg("median"))
+        calculation.qt_intervals()
+    """
+    # Fenêtre (s) autour du pic R : elle contient les fenêtres de recherche
+    # de Detection (début de P 0.3 s avant R, fin de T jusqu'à 0.64 s après)
+    BEFORE = 0.4
+    AFTER = 0.7
+    KINDS = ("median", "mean")
+
+    data: Optional['ECG.PatientData']
+    labels: List[str]
+    sampling_rate: int
+    # Indice du pic R dans chaque battement moyen
+    r_index: int
+    # Pics R (dans l'enregistrement) des battements moyennés
+    r_peaks: np.ndarray
+    # Intervalles RR (ms) de l'enregistrement
+    rr_intervals: np.ndarray
+    median: np.ndarray
+    mean: np.ndarray
+
+    def __init__(self, data: Optional['ECG.PatientData'], labels: List[str],
+                 median: np.ndarray, mean: np.ndarray, sampling_rate: int,
+                 r_index: int, r_peaks: np.ndarray, rr_intervals: np.ndarray):
+        self.data = data
+        self.labels = labels
+        self.median = median
+        self.mean = mean
+        self.sampling_rate = sampling_rate
+        self.r_index = r_index
+        self.r_peaks = r_peaks
+        self.rr_intervals = rr_intervals
+
+    @staticmethod
+    def beat_tensor(matrix: np.ndarray, r_peaks: np.ndarray, before: int,
+                    after: int) -> np.ndarray:
+        """
+        Tenseur lignes × battements × (before + after) des fenêtres
+        matrix[:, R - before:R + after], extrait en une seule indexation
+        d'une vue strided (sliding_window_view) de la matrice. Les pics R
+        dont la fenêtre sort du signal doivent avoir été écartés.
+        """
+        windows = sliding_window_view(matrix, before + after, axis=1)
+        return windows[:, np.asarray(r_peaks, dtype=np.intp) - before]
+
+    @staticmethod
+    def from_ecg(ecg: 'ECG', before: float = BEFORE, after: float = AFTER
+                 ) -> 'BeatTemplates':
+        """
+        Battements moyens des lignes traitées d'un ECG dont la ligne
+        fusionnée a été détectée (voir Detection.detect). Les battements dont
+        la fenêtre dépasse le début ou la fin du signal sont écartés.
+        """
+        treated = ecg.treated_lines
+        merged = next((line for line in treated or []
+                       if line.label == "Merged"), None)
+        if merged is None or merged.fiducials is None:
+            raise ValueError(
+                "La détection doit être faite sur la ligne fusionnée.")
+
+        fs = treated.sampling_rate
+        n_before, n_after = int(before * fs), int(after * fs)
+        r_peaks = merged.fiducials["R"].astype(np.intp)
+        complete = r_peaks[(r_peaks >= n_before)
+                           & (r_peaks + n_after <= treated.matrix.shape[1])]
+        if len(complete) == 0:
+            raise ValueError(
+                "Aucun battement complet pour construire les battements "
+                "moyens.")
+
+        tensor = BeatTemplates.beat_tensor(treated.matrix, complete,
+                                           n_before, n_after)
+        return BeatTemplates(
+            ecg.data, treated.labels, np.median(tensor, axis=1),
+            tensor.mean(axis=1), fs, n_before, complete,
+            np.diff(r_peaks) * 1000 / fs)
+
+    def __len__(self) -> int:
+        """Nombre de battements moyennés."""
+        return len(self.r_peaks)
+
+    def _matrix(self, kind: str) -> np.ndarray:
+        if kind not in BeatTemplates.KINDS:
+            raise ValueError(
+                f"Type de battement moyen inconnu : {kind} "
+                f"(attendu : {', '.join(BeatTemplates.KINDS)}).")
+        return self.median if kind == "median" else self.mean
+
+    def leads(self, kind: str = "median") -> 'ECG.Leads':
+        """
+        Battements moyens sous forme de lignes, avec leurs points
+        caractéristiques : le pic R est replacé autour de r_index dans
+        chaque ligne (voir Detection.process_ecg_signal).
+        """
+        # Copie : les lignes ne doivent pas modifier les battements moyens
+        leads = ECG.Leads(list(self.labels), self._matrix(kind).copy(),
+                          self.sampling_rate)
+        for line in leads:
+            line.fiducials = Detection.process_ecg_signal(
+                line.points, self.sampling_rate, [self.r_index])
+        return leads
+
+    def rhythm(self, kind: str = "median") -> np.ndarray:
+        """Intervalle RR (ms) associé au battement moyen : médiane ou
+        moyenne des intervalles RR de l'enregistrement."""
+        self._matrix(kind)
+        rr = self.rr_intervals
+        if len(rr) == 0:
+            return rr
+        return np.array([np.median(rr) if kind == "median" else rr.mean()])
+
+    def to_ecg(self, kind: str = "median") -> 'ECG':
+        """
+        ECG d'un seul battement (le battement moyen), consommable par
+        Calculation et Plot. Ses lignes brutes et traitées sont deux copies
+        distinctes des battements moyens (les lignes traitées portent les
+        points caractéristiques) ; ses données patient sont celles de l'ECG
+        source.
+
+        Un battement moyen n'a pas de rythme propre : son intervalle RR est
+        celui de rhythm (voir ECG.rr_intervals), si bien que la fréquence
+        cardiaque et le QTc restent ceux de l'enregistrement.
+        """
+        suffix = " (treated)"
+        raw = ECG.Leads([label[:-len(suffix)] if label.endswith(suffix)
+                         else label for label in self.labels],
+                        self._matrix(kind).copy(), self.sampling_rate)
+        template_ecg = ECG(self.data, raw, rr_intervals=self.rhythm(kind))
+        template_ecg.treated_lines = self.leads(kind)
+        return template_ecg
+
+    def measurements(self, kind: str = "median") -> Dict[str, np.ndarray]:
+        """Intervalles et amplitudes du battement moyen (voir
+        ECG.measurements), un seul battement par mesure."""
+        return self.to_ecg(kind).measurements()
+
+    def plot(self, kind: str = "median", selected_label: Optional[str] = None
+             ) -> None:
+        """Affiche les battements moyens et leurs points caractéristiques."""
+        Plot.plot_lines(self.leads(kind),
+                        title=f"Beat templates ({kind}, {len(self)} beats)",
+                        selected_label=selected_label)
+        Plot.show()